@@ -30,6 +30,8 @@ readAnal = subp.add_parser('reads', help='Read-based analysis', description='Ana
 asseAnal = subp.add_parser('assembly', help='Assembly-based analysis', description='Analysis based on local assembly of reads spanning the regions of interest.')
 # merge analysis
 mergeAnal = subp.add_parser('merge', help='Merge multiple VCF together', description='Merge multiple VCF generated by Treat together.')
+# reference catalog
+catAnal = subp.add_parser('catalog', help='Reference catalog', description='Annotation of the regions of interest in the reference genome, which can be reused by read-based and assembly-based analyses.')
 # analysis analysis
 analAnal = subp.add_parser('analysis', help='Analysis of VCF file', description='Outlier-based detection of individuals with extreme TR expansion/contraction.')
 # plot analysis
@@ -64,6 +66,16 @@ readAnal.add_argument('-minSup', '--minimumSupport', type = int, help = 'During
 readAnal.add_argument('-minCov', '--minimumCoverage', type = int, help = 'During haplotying, minimum number of total reads necessary for calling.', required = False, default = 5)
 # raw sequences: rawSeq
 readAnal.add_argument('-rawSeq', '--rawSequences', type = str, help = 'True/False. Whether to output the raw sequences with TRF annotation extracted from the bam file. (Default is False)', required = False, default = 'False')
+# motif finding: trf backend
+readAnal.add_argument('-trf', '--trfBackend', type = str, choices = ['pytrf', 'trf'], help = 'pytrf/trf. Tool for motif finding: pytrf runs in-process on the extracted sequences, trf uses the external trf binary. (Default is pytrf)', required = False, default = 'pytrf')
+# motif finding: annotation cache
+readAnal.add_argument('-cache', '--cacheDir', type = str, help = 'Directory where motif annotations are cached between runs. Sequences already annotated are not annotated again. (Default is None)', required = False, default = 'None')
+# resume from checkpoints
+readAnal.add_argument('-resume', '--resume', type = str, help = 'True/False. Whether to save checkpoints of each step in the output directory and resume from them, so that a run interrupted can be restarted with the same command. (Default is False)', required = False, default = 'False')
+# output format of the tables of reads
+readAnal.add_argument('-format', '--outFormat', type = str, choices = ['txt', 'parquet'], help = 'txt/parquet. Format of the raw sequences table: gzipped text, or parquet with typed columns (requires pyarrow). (Default is txt)', required = False, default = 'txt')
+# reference catalog
+readAnal.add_argument('-cat', '--catalog', type = str, help = 'Reference catalog built with TREAT.py catalog on the same reference genome, with the same window and TRF backend. The regions are not annotated again in the reference genome. (Default is None)', required = False, default = 'None')
 ###########################################################
 
 ###########################################################
@@ -94,6 +106,34 @@ asseAnal.add_argument('-wAss', '--windowAssembly', type = int, help = 'Integer.
 asseAnal.add_argument('-p', '--ploidy', type = int, help = 'Integer. Estimated ploidy of the sample.', required = False, default = 2)
 # software
 asseAnal.add_argument('-s', '--software', type = str, help = 'Software to use for assembly (otter). New assembler will be added.', required = False, default = 'otter')
+# motif finding: annotation cache
+asseAnal.add_argument('-cache', '--cacheDir', type = str, help = 'Directory where motif annotations are cached between runs. Sequences already annotated are not annotated again. (Default is None)', required = False, default = 'None')
+# output format of the tables of reads
+asseAnal.add_argument('-format', '--outFormat', type = str, choices = ['txt', 'parquet'], help = 'txt/parquet. Format of the tables of assembled sequences: gzipped text, or parquet with typed columns (requires pyarrow). (Default is txt)', required = False, default = 'txt')
+# reference catalog
+asseAnal.add_argument('-cat', '--catalog', type = str, help = 'Reference catalog built with TREAT.py catalog on the same reference genome. The regions are not annotated again in the reference genome. (Default is None)', required = False, default = 'None')
+###########################################################
+
+###########################################################
+# Define the arguments for the reference catalog
+# required arguments
+# bed file
+catAnal.add_argument('-b', '--bed', required=True, help='BED file with the regions(s) to annotate. Header is not required but if present, it must start with #.')
+# reference genome
+catAnal.add_argument('-r', '--ref', required=True, help='Path to reference genome data in FASTA format. Reference needs to be indexed.')
+# optional arguments
+# output directory
+catAnal.add_argument('-o', '--outDir', help='Output directory where to place the catalog. If not specified, will be the current directory.', required = False, default = './')
+# output name
+catAnal.add_argument('-n', '--outName', help='Name of the catalog. If not specified, will be treat_catalog.json.gz', required = False, default = 'treat_catalog.json.gz')
+# window around
+catAnal.add_argument('-w', '--window', type = int, help = 'Integer. Window used by the read-based analyses that will use the catalog.', required = False, default = 10)
+# number of threads
+catAnal.add_argument('-t', '--cpu', type = int, help = 'Number of parallel threads to be used.', required = False, default = 2)
+# motif finding: trf backend
+catAnal.add_argument('-trf', '--trfBackend', type = str, choices = ['pytrf', 'trf'], help = 'pytrf/trf. Tool for motif finding used by the read-based analyses that will use the catalog. (Default is pytrf)', required = False, default = 'pytrf')
+# motif finding: annotation cache
+catAnal.add_argument('-cache', '--cacheDir', type = str, help = 'Directory where motif annotations are cached between runs. (Default is None)', required = False, default = 'None')
 ###########################################################
 
 ###########################################################
@@ -106,6 +146,10 @@ mergeAnal.add_argument('-v', '--vcf', required=True, help='Comma separated list
 mergeAnal.add_argument('-o', '--outDir', help='Output directory where to place outputs. If not specified, will be the current directory.', required = False, default = './')
 # output name
 mergeAnal.add_argument('-n', '--outName', help='Name of the combined VCF file. If not specified, will the combined_treat.vcf.gz', required = False, default = 'combined_treat.vcf.gz')
+# number of threads
+mergeAnal.add_argument('-t', '--cpu', type = int, help = 'Number of parallel threads to be used. If all VCF files are bgzip-compressed and indexed with tabix, chromosomes are merged in parallel.', required = False, default = 1)
+# fan-in of the tree merge
+mergeAnal.add_argument('-f', '--fanIn', type = int, help = 'Number of VCF files merged together at once. With many VCF files, groups of this size are merged in parallel into intermediate VCF files, which are merged again. If 0, all VCF files are merged at once. (Default is 0)', required = False, default = 0)
 ###########################################################
 
 ###########################################################
@@ -177,12 +221,17 @@ if args.cmd == 'reads':
     print("   Minimum supporting reads: ", args.minimumSupport)
     print("   Minimum coverage: ", args.minimumCoverage)
     print("   Write raw sequences: ", args.rawSequences)
+    print("   TRF backend: ", args.trfBackend)
+    print("   Annotation cache directory: ", args.cacheDir)
+    print("   Table format: ", args.outFormat)
+    print("   Resume from checkpoints: ", args.resume)
+    print("   Reference catalog: ", args.catalog)
     print("\n")
     # set flag to true
     RUN = True
     # define script to run and arguments
     script_path = 'read_based.py'
-    arguments = [args.inBam, args.bed, args.outDir, args.ref, str(args.window), str(args.cpu), args.phasingData, args.mappingSNP, str(args.HaploDev), str(args.minimumSupport), str(args.minimumCoverage), str(args.rawSequences)]
+    arguments = [args.inBam, args.bed, args.outDir, args.ref, str(args.window), str(args.cpu), args.phasingData, args.mappingSNP, str(args.HaploDev), str(args.minimumSupport), str(args.minimumCoverage), str(args.rawSequences), args.trfBackend, args.cacheDir, args.outFormat, args.resume, args.catalog]
 elif args.cmd == 'assembly':
     print('Assembly-based analysis selected')
     print('** Required argument:')
@@ -199,24 +248,47 @@ elif args.cmd == 'assembly':
     print("   Haplotyping deviation: ", args.HaploDev)
     print("   Minimum supporting reads: ", args.minimumSupport)
     print("   Minimum coverage: ", args.minimumCoverage)
+    print("   Annotation cache directory: ", args.cacheDir)
+    print("   Table format: ", args.outFormat)
+    print("   Reference catalog: ", args.catalog)
     print("\n")
     # set flag to true
     RUN = True
     # define script to run and arguments
     script_path = 'assembly_based.py'
-    arguments = [args.inBam, args.bed, args.outDir, args.ref, str(args.window), str(args.windowAssembly), str(args.cpu), str(args.ploidy), args.software, str(args.HaploDev), str(args.minimumSupport), str(args.minimumCoverage)]
+    arguments = [args.inBam, args.bed, args.outDir, args.ref, str(args.window), str(args.windowAssembly), str(args.cpu), str(args.ploidy), args.software, str(args.HaploDev), str(args.minimumSupport), str(args.minimumCoverage), args.cacheDir, args.outFormat, args.catalog]
 elif args.cmd == 'merge':
     print('Merge VCF analysis selected')
     print('** Required argument:')
     print("   Input VCF file(s): ", args.vcf)
     print("   Output directory: ", args.outDir)
     print("   Output name: ", args.outName)
+    print("   Number of threads: ", args.cpu)
+    print("   Fan-in: ", args.fanIn)
     print("\n")
     # set flag to true
     RUN = True
     # define script to run and arguments
     script_path = 'merge_vcf.py'
-    arguments = [args.vcf, args.outDir, args.outName]
+    arguments = [args.vcf, args.outDir, args.outName, str(args.cpu), str(args.fanIn)]
+elif args.cmd == 'catalog':
+    print('Reference catalog selected')
+    print('** Required argument:')
+    print("   Input BED file: ", args.bed)
+    print("   Reference genome: ", args.ref)
+    print('** Optional arguments:')
+    print("   Output directory: ", args.outDir)
+    print("   Output name: ", args.outName)
+    print("   Window: ", args.window)
+    print("   Number of threads: ", args.cpu)
+    print("   TRF backend: ", args.trfBackend)
+    print("   Annotation cache directory: ", args.cacheDir)
+    print("\n")
+    # set flag to true
+    RUN = True
+    # define script to run and arguments
+    script_path = 'reference_catalog.py'
+    arguments = [args.bed, args.ref, args.outDir, args.outName, str(args.window), str(args.cpu), args.trfBackend, args.cacheDir]
 elif args.cmd == 'analysis':
     # set flag to true
     RUN = True
@@ -242,7 +314,7 @@ if RUN == True:
     main_path = '/'.join(main_path.split('/')[:-1])
 
     # Run the script
-    if script_path in ['read_based.py', 'assembly_based.py', 'merge_vcf.py']:
+    if script_path in ['read_based.py', 'assembly_based.py', 'merge_vcf.py', 'reference_catalog.py']:
         main_script = 'python3.6 %s/%s %s' %(main_path, script_path, ' '.join(arguments))
     elif script_path == 'treat_analysis.py':
         main_script = '%s/%s --analysis %s --vcf %s --outDir %s --outName %s --region %s --madThr %s --labels %s --cpu %s --known %s' %(main_path, script_path, arguments[0], arguments[1], arguments[2], arguments[3], arguments[4], arguments[5], arguments[6], arguments[7], arguments[8])
@@ -6,8 +6,8 @@ from functions_assembly_based import *
 
 # Main
 # Read arguments and make small changes
-inBam_dir, bed_dir, outDir, ref, window, windowAss, cpu, ploidy, software, HaploDev, minimumSupport, minimumCoverage = sys.argv[1::]
-window = int(window); cpu = int(cpu); ploidy = int(ploidy); windowAss = int(windowAss); minimumSupport = int(minimumSupport)
+inBam_dir, bed_dir, outDir, ref, window, windowAss, cpu, ploidy, software, HaploDev, minimumSupport, minimumCoverage, cacheDir, outFormat, catalog = sys.argv[1::]
+window = int(window); cpu = int(cpu); ploidy = int(ploidy); windowAss = int(windowAss); minimumSupport = int(minimumSupport); outFormat = checkTableFormat(outFormat)
 
 # 1. Check arguments: BED, output directory and BAMs
 print('** Analysis started')
@@ -15,18 +15,26 @@ ts_total = time.time()
 # 1.1 Check output directory
 print(checkOutDir(outDir))
 # 1.2 Create Log file
-logfile = createLogAsm(inBam_dir, bed_dir, outDir, ref, window, cpu, windowAss, ploidy, software, HaploDev, minimumSupport, minimumCoverage)
+logfile = createLogAsm(inBam_dir, bed_dir, outDir, ref, window, cpu, windowAss, ploidy, software, HaploDev, minimumSupport, minimumCoverage, cacheDir, outFormat, catalog)
 # 1.3 Read bed file
 bed, count_reg, bed_dir = readBed(bed_dir, outDir)
 # 1.4 Check BAM files
 inBam = checkBAM(inBam_dir)
+# 1.5 Start the worker processes used by all steps: annotation cache and motif table are loaded before, so that the workers inherit them
+loadAnnotationCache(cacheDir)
+loadMotifTable(cacheDir)
+startPool(cpu, {'reference' : ref})
+# 1.6 Read the reference motifs from the reference catalog, if any
+reference_motif_dic = None if catalog == 'None' else readCatalog(catalog, 'assembly', ref, {'annotation' : ATR_PARAMS}, [entry[2] for chromosome in bed for entry in bed[chromosome]])
 
 # 2. Check which software was selected and do things accordingly
 if software == 'otter':
     # Run local assembly and TRF
-    df_trf_phasing_combined = otterPipeline_opt(outDir, cpu, ref, bed_dir, inBam, count_reg, windowAss, window, bed)
+    df_trf_phasing_combined = otterPipeline_opt(outDir, cpu, ref, bed_dir, inBam, count_reg, windowAss, window, bed, cacheDir, reference_catalog = reference_motif_dic is not None)
     # Do directly the haplotyping so that we save on IO usage
-    print(haplotyping_steps_opt(data = df_trf_phasing_combined, n_cpu = cpu, thr_mad = HaploDev, min_support = minimumSupport, type = 'otter', outDir = outDir, inBam = inBam))
+    print(haplotyping_steps_opt(data = df_trf_phasing_combined, n_cpu = cpu, thr_mad = HaploDev, min_support = minimumSupport, type = 'otter', outDir = outDir, inBam = inBam, reference_motif_dic = reference_motif_dic))
+    saveMotifTable(cacheDir)
+    closePool()
     # Remove temporary files
     removeTemp(outDir)
     te_total = time.time()
@@ -39,15 +47,15 @@ elif software == 'hifiasm':
     mask = ~df_trf_phasing_combined_all['SAMPLE_NAME'].str.contains('_primary_cleaned')
     df_trf_phasing_combined = df_trf_phasing_combined_all[mask].copy()
     # Save output
-    outf = '%s/assembly_trf_phasing.txt.gz' %(outDir)
-    df_trf_phasing_combined.to_csv(outf, sep = "\t", index=False, na_rep='NA', compression='gzip')
+    outf = writeTable(df_trf_phasing_combined, '%s/assembly_trf_phasing' %(outDir), outFormat, sep = '\t')
     print('** Data combined and outputs are ready')
     # Haplotyping
     file_path = os.path.realpath(__file__)
     file_path = '/'.join(file_path.split('/')[:-1])
-    os.system("~/.conda/envs/treat/bin/python %s/call_haplotypes.py %s/assembly_trf_phasing.txt.gz %s %s %s %s %s" %(file_path, outDir, outDir, cpu, HaploDev, 'hifiasm', minimumSupport))
+    os.system("~/.conda/envs/treat/bin/python %s/call_haplotypes.py %s %s %s %s %s %s %s" %(file_path, outf, outDir, cpu, HaploDev, 'hifiasm', minimumSupport, outFormat))
     # Remove temporary files
     removeTemp(outDir)
+    closePool()
     te_total = time.time()
     time_total = te_total - ts_total
     print('\n** Analysis completed in %s seconds. Ciao!                   ' %(round(time_total, 0)))
\ No newline at end of file
@@ -2,7 +2,7 @@
 print('* Loading libraries')
 import pandas as pd
 import sys
-from Bio.Seq import reverse_complement
+from functions_common import permutMotif, uniqueReadKey, readTable, writeTable, checkTableFormat, regionKey, openVCF, writeVCFrecords, closeVCF
 import multiprocessing
 from functools import partial
 import numpy as np
@@ -17,19 +17,6 @@ import warnings
 import gzip
 
 # FUNCTIONS
-# function to make permutations
-def permutMotif(motif):
-    # standard motif
-    motif_cons = [motif[i::] + motif[0:i] for i in range(len(motif))]
-    # reverse complement
-    rc_motif = reverse_complement(motif)
-    rc_motif_cons = [rc_motif[i::] + rc_motif[0:i] for i in range(len(rc_motif))]
-    # combine
-    comb_motifs = motif_cons + rc_motif_cons
-    # take the first in ascending order
-    sel_motif = sorted(comb_motifs)[0]
-    return sel_motif
-
 # function to guide haplotyping
 def haplotyping(x, s, thr_mad, type, dup_df, reference_motif_dic, intervals, min_support):
     # define columns based on the data type
@@ -532,26 +519,15 @@ def prepareIntervals(all_regions):
         intervals.append(all_regions[index])
     return intervals
 
-# function to write header of vcf file
-def writeVCFheader(vcf_file, samples):
-    # open file
-    outf = open(vcf_file, 'w')
-    # write header
-    outf.write('##fileformat=VCFv4.2\n##INFO=<ID=REFERENCE_INFO,Number=2,Type=String,Description="Motif observed in the reference genome (GRCh38), and relative number of motif repetitions."\n##FORMAT=<ID=QC,Number=1,Type=String,Description="Quality summary of TREAT genotyping. PASS_BOTH: genotype agreed between reads-spanning and assembly. PASS_RSP: genotype from reads-spanning. PASS_ASM: genotype from assembly."\n##FORMAT=<ID=GT,Number=2,Type=String,Description="Phased size of the tandem repeats. H1_size | H2_size"\n##FORMAT=<ID=MOTIF,Number=2,Type=String,Description="Phased consensus motif found in the sample. H1_motif | H2_motif"\n##FORMAT=<ID=CN,Number=2,Type=String,Description="Phased number of copies of the motif found in the sample. H1_copies | H2_copies"\n##FORMAT=<ID=CN_REF,Number=2,Type=String,Description="Phased estimation of the reference motif as found in the sample. H1_motif_ref | H2_motif_ref"\n##FORMAT=<ID=DP,Number=1,Type=String,Description="Phased depth found in the sample. H1_depth | H2_depth"\n')
-    outf.close()
-    return    
-
-# function to write outputs
-def writeOutputs(df_vcf, df_seq, seq_file, vcf_file):
-    # write header of vcf file
-    writeVCFheader(vcf_file, all_samples)
-    with open(vcf_file, mode='a') as file:
-        df_vcf.to_csv(file, header=True, index=False, sep='\t')
-    # then compress it
-    os.system('gzip %s' %(vcf_file))
-    # write sequence file
-    #df_seq.to_csv(seq_file, header=True, index=False, sep='\t', compression = 'gzip')
-    return
+# header lines of the VCF file
+VCF_HEADER = ['##fileformat=VCFv4.2',
+    '##INFO=<ID=REFERENCE_INFO,Number=2,Type=String,Description="Motif observed in the reference genome (GRCh38), and relative number of motif repetitions."',
+    '##FORMAT=<ID=QC,Number=1,Type=String,Description="Quality summary of TREAT genotyping. PASS_BOTH: genotype agreed between reads-spanning and assembly. PASS_RSP: genotype from reads-spanning. PASS_ASM: genotype from assembly."',
+    '##FORMAT=<ID=GT,Number=2,Type=String,Description="Phased size of the tandem repeats. H1_size | H2_size"',
+    '##FORMAT=<ID=MOTIF,Number=2,Type=String,Description="Phased consensus motif found in the sample. H1_motif | H2_motif"',
+    '##FORMAT=<ID=CN,Number=2,Type=String,Description="Phased number of copies of the motif found in the sample. H1_copies | H2_copies"',
+    '##FORMAT=<ID=CN_REF,Number=2,Type=String,Description="Phased estimation of the reference motif as found in the sample. H1_motif_ref | H2_motif_ref"',
+    '##FORMAT=<ID=DP,Number=1,Type=String,Description="Phased depth found in the sample. H1_depth | H2_depth"']
 
 # 1. arguments
 inpf = sys.argv[1]
@@ -560,10 +536,14 @@ n_cpu = int(sys.argv[3])
 thr_mad = float(sys.argv[4])
 type = sys.argv[5]
 min_support = int(sys.argv[6])
+# optional: format of the raw output, and comma-separated regions and samples to genotype
+table_format = checkTableFormat(sys.argv[7]) if len(sys.argv) >7 else 'txt'
+regions = sys.argv[8].split(',') if len(sys.argv) >8 and sys.argv[8] != 'None' else None
+samples = sys.argv[9].split(',') + ['reference'] if len(sys.argv) >9 and sys.argv[9] != 'None' else None
 
-# 2. read data
+# 2. read data: with parquet inputs, only the requested regions and samples are read
 print('** Read data')
-data = pd.read_csv(inpf, sep=' ', compression='gzip', low_memory=False)
+data = readTable(inpf, regions = regions, samples = samples)
 
 # 3. adjust the motif -- merge the same motifs
 print('** Adjust motifs')
@@ -571,7 +551,7 @@ all_motifs = data['TRF_MOTIF'].dropna().unique()
 main_motifs = [permutMotif(motif) for motif in all_motifs]
 motifs_df = pd.DataFrame({'motif' : all_motifs, 'UNIFORM_MOTIF' : main_motifs})
 data = pd.merge(data, motifs_df, left_on='TRF_MOTIF', right_on='motif', how='left')
-data['UNIQUE_NAME'] = data.apply(lambda row: str(row['READ_NAME']) + '___' + str(row['SAMPLE_NAME']) + '___' + str(row['REGION']) + '___' + str(row['LEN_SEQUENCE_FOR_TRF']), axis = 1)
+data['UNIQUE_NAME'] = uniqueReadKey(data)
 
 # 4. extract the reference and work on the motifs
 print('** Reference motifs                                     ')
@@ -616,9 +596,18 @@ for s in all_samples:
     pool.close()
     sample_res.append(haplo_results)
 
-# 7. compose the vcf and seq dataframes
-df_vcf = pd.DataFrame([x[0] for x in sample_res[0]], columns=['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT', all_samples[0]])
-df_seq = pd.DataFrame([x for y in sample_res[0] for x in y[1]], columns=['READ_NAME', 'HAPLOTAG', 'REGION', 'PASSES', 'READ_QUALITY', 'LEN_SEQUENCE_FOR_TRF', 'START_TRF', 'END_TRF', 'type', 'SAMPLE_NAME', 'POLISHED_HAPLO', 'DEPTH', 'CONSENSUS_MOTIF', 'CONSENSUS_MOTIF_COPIES', 'MOTIF_REF', 'REFERENCE_MOTIF_COPIES', 'SEQUENCE_WITH_PADDINGS', 'SEQUENCE_FOR_TRF'])
+# 7. compose the vcf: matrix of regions x samples, with regions in coordinate order
+all_ids = sorted(set([x[0][2] for y in sample_res for x in y]), key = regionKey)
+id_index = {all_ids[i] : i for i in range(len(all_ids))}
+fixed_fields = [None] * len(all_ids)
+genotypes = np.full((len(all_ids), len(all_samples)), '.', dtype = object)
+for j in range(len(sample_res)):
+    for x in sample_res[j]:
+        i = id_index[x[0][2]]
+        # fixed fields from the first sample with the region
+        if fixed_fields[i] is None:
+            fixed_fields[i] = list(x[0][:9])
+        genotypes[i, j] = x[0][-1]
 # and the raw output
 if type == 'reads':
     raw_seq_list = []
@@ -628,21 +617,12 @@ if type == 'reads':
                 raw_seq_list.append(region[-1])
     # combine all dataframes and write as output
     raw_seq_df = pd.concat(raw_seq_list, ignore_index=True)
-    raw_seq_df.to_csv('%s/sample.raw.txt.gz' %(outd), sep="\t", compression = 'gzip', header=True, index=False)
-# if there are more samples, write them as well
-if len(sample_res) >1:
-    for i in range(1, len(sample_res)):
-        tmp = pd.DataFrame([[x[0][2], x[0][-1]] for x in sample_res[i]], columns=['ID', all_samples[i]])
-        # merge with main df
-        df_vcf = pd.merge(df_vcf, tmp, on='ID', how='outer')
-        # then compose the seq dataframe
-        tmp = pd.DataFrame([x for y in sample_res[i] for x in y[1]], columns=['READ_NAME', 'HAPLOTAG', 'REGION', 'PASSES', 'READ_QUALITY', 'LEN_SEQUENCE_FOR_TRF', 'START_TRF', 'END_TRF', 'type', 'SAMPLE_NAME', 'POLISHED_HAPLO', 'DEPTH', 'CONSENSUS_MOTIF', 'CONSENSUS_MOTIF_COPIES', 'MOTIF_REF', 'REFERENCE_MOTIF_COPIES', 'SEQUENCE_WITH_PADDINGS', 'SEQUENCE_FOR_TRF'])
-        # add to main df
-        df_seq = pd.concat([df_seq, tmp], axis=0)
+    writeTable(raw_seq_df, '%s/sample.raw' %(outd), table_format, sep = '\t')
 
-# 8. write outputs: vcf file and raw sequences
+# 8. write outputs: vcf file, bgzip-compressed and indexed
 print('** Producing outputs: VCF file and table with sequences                        ')
-seq_file = '%s/sample.seq.txt.gz' %(outd)
-vcf_file = '%s/sample.vcf' %(outd)
-writeOutputs(df_vcf, df_seq, seq_file, vcf_file)
+vcf_file = '%s/sample.vcf.gz' %(outd)
+fout = openVCF(vcf_file, VCF_HEADER, all_samples)
+writeVCFrecords(fout, [fixed_fields[i] + list(genotypes[i]) for i in range(len(all_ids))])
+closeVCF(fout, vcf_file)
 
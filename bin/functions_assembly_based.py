@@ -9,13 +9,12 @@ import pandas as pd
 import re
 import math
 import time
-from Bio.Seq import reverse_complement
 import numpy as np
 import warnings
 import gzip
 import pyfastx
-import pyfaidx
 import pytrf
+from functions_common import *
 
 ### FUNCTIONS TO CHECK DIRECTORIES AND FILES
 # Function to read bed file - OK
@@ -100,7 +99,7 @@ def checkBAM(bam_dir):
         sys.exit(1)  # Exit the script with a non-zero status code
 
 # Function to create Log file - OK
-def createLogAsm(inBam, bed_dir, outDir, ref, window, cpu, windowAss, ploidy, software, HaploDev, minimumSupport, minimumCoverage):
+def createLogAsm(inBam, bed_dir, outDir, ref, window, cpu, windowAss, ploidy, software, HaploDev, minimumSupport, minimumCoverage, cacheDir, outFormat, catalog):
     foutname = open('%s/treat_run.log' %(outDir), 'w')
     foutname.write('Assembly-based analysis selected\n')
     foutname.write('** Required argument:\n')
@@ -117,8 +116,11 @@ def createLogAsm(inBam, bed_dir, outDir, ref, window, cpu, windowAss, ploidy, so
     foutname.write("\tHaplotyping deviation: %s\n" %(HaploDev))
     foutname.write("\tMinimum supporting reads: %s\n" %(minimumSupport))
     foutname.write("\tMinimum coverage: %s\n" %(minimumCoverage))
+    foutname.write("\tAnnotation cache directory: %s\n" %(cacheDir))
+    foutname.write("\tTable format: %s\n" %(outFormat))
+    foutname.write("\tReference catalog: %s\n" %(catalog))
     foutname.write("\n")
-    foutname.write('Effective command line:\nTREAT.py assembly -i %s -b %s -o %s -r %s -w %s -wAss %s -t %s -s %s -p %s -d %s -minSup %s -minCov %s\n' %(inBam, bed_dir, outDir, ref, window, windowAss, cpu, software, ploidy, HaploDev, minimumSupport, minimumCoverage))
+    foutname.write('Effective command line:\nTREAT.py assembly -i %s -b %s -o %s -r %s -w %s -wAss %s -t %s -s %s -p %s -d %s -minSup %s -minCov %s -cache %s -format %s -cat %s\n' %(inBam, bed_dir, outDir, ref, window, windowAss, cpu, software, ploidy, HaploDev, minimumSupport, minimumCoverage, cacheDir, outFormat, catalog))
     foutname.close()
     print('** Log file written to %s/treat_run.log' %(outDir))
     return foutname
@@ -144,19 +146,36 @@ def writeFastaTRF(all_seqs, fasta_name):
             outFile.write('>%s;%s;%s\n%s\n' %(region[1], region[0], region[2], region[-4]))
     outFile.close()
 
-# Function to run pytrf given a sequence on the reference genome - OK
-def run_trf_ref_opt(x):
-    res = []
-    for k in x:
-        name, seq = k[1], k[-4]
+# Parameters of motif finding with pytrf: they are part of the key of the annotation cache, with the version of pytrf as versions find different repeats
+ATR_PARAMS = 'pytrf %s;min_motif_size=1;max_motif_size=100;fallback=min_seed_repeat=2,min_seed_length=8' %(pytrf.__version__)
+
+# Function to run pytrf on a sequence, lowering parameters if there are no hits, using the annotation cache - OK
+def run_atr_cached(name, seq, new_entries):
+    key = annotationKey(ATR_PARAMS, seq)
+    if key in ANNOTATION_CACHE:
+        temp = ANNOTATION_CACHE[key]
+    elif key in new_entries:
+        temp = new_entries[key]
+    else:
         # run approximate TRFinder
-        temp = [list(i) for i in pytrf.ATRFinder(name, seq, min_motif_size=1, max_motif_size=100).as_list()]
+        temp = repeatLists(name, seq, min_motif_size=1, max_motif_size=100)
         if len(temp) == 0:
             # if there are no hits, lower parameters and try again
-            temp = [list(i) for i in pytrf.ATRFinder(name, seq, min_motif_size=1, max_motif_size=100, min_seed_repeat=2).as_list()]
+            temp = repeatLists(name, seq, min_motif_size=1, max_motif_size=100, min_seed_repeat=2)
             # if there are still no results, decrease parameters even lower
             if len(temp) == 0:
-                temp = [list(i) for i in pytrf.ATRFinder(name, seq, min_motif_size=1, max_motif_size=100, min_seed_repeat=2, min_seed_length=8).as_list()]
+                temp = repeatLists(name, seq, min_motif_size=1, max_motif_size=100, min_seed_repeat=2, min_seed_length=8)
+        new_entries[key] = temp
+    # the cached hits may come from a sequence with another name
+    return [[name] + x[1:] for x in temp]
+
+# Function to run pytrf given a sequence on the reference genome - OK
+def run_trf_ref_opt(x):
+    res = []
+    new_entries = {}
+    for k in x:
+        name, seq = k[1], k[-4]
+        temp = run_atr_cached(name, seq, new_entries)
         if len(temp) >0:
             for x in temp:
                 x.append(seq)
@@ -166,30 +185,17 @@ def run_trf_ref_opt(x):
         else:
             temp = [name, 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', seq, len(seq), 'REFERENCE']
             res.append(temp)
-    return res
+    return res, new_entries
 
 # Function to run pyTRF on otter assemblies - OK
 def run_trf_asm_opt(x, w):
     sample_name = os.path.basename(x).replace('.fa', '')
     res = []
+    new_entries = {}
     fa = pyfastx.Fastx(x, uppercase=True)
     for name, seq in fa:
-        if w == 0:
-            tmp = [list(i) for i in pytrf.ATRFinder(name, seq, min_motif_size = 1, max_motif_size=100).as_list()]
-            # if there are no hits, lower parameters and try again
-            if len(tmp) == 0:
-                tmp = [list(i) for i in pytrf.ATRFinder(name, seq, min_motif_size = 1, max_motif_size=100, min_seed_repeat=2).as_list()]
-                # if there are still no results, decrease parameters even lower
-                if len(tmp) == 0:
-                    tmp = [list(i) for i in pytrf.ATRFinder(name, seq, min_motif_size = 1, max_motif_size=100, min_seed_repeat=2, min_seed_length=8).as_list()]
-        else:
-            tmp = [list(i) for i in pytrf.ATRFinder(name, seq[(w-1):-w], min_motif_size = 1, max_motif_size=100).as_list()]
-            # if there are no hits, lower parameters and try again
-            if len(tmp) == 0:
-                tmp = [list(i) for i in pytrf.ATRFinder(name, seq[(w-1):-w], min_motif_size = 1, max_motif_size=100, min_seed_repeat=2).as_list()]
-                # if there are still no results, decrease parameters even lower
-                if len(tmp) == 0:
-                    tmp = [list(i) for i in pytrf.ATRFinder(name, seq[(w-1):-w], min_motif_size = 1, max_motif_size=100, min_seed_repeat=2, min_seed_length=8).as_list()]
+        trf_seq = seq if w == 0 else seq[(w-1):-w]
+        tmp = run_atr_cached(name, trf_seq, new_entries)
         if len(tmp) >0:
             for k in tmp:
                 k.append(seq[(w-1):-w])
@@ -203,65 +209,78 @@ def run_trf_asm_opt(x, w):
         else:
             tmp = [name, 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', 'NA', seq[(w-1):-w], len(seq[(w-1):-w]), sample_name, name.split('#')[2], name.split('#')[1], 'NA', 'NA']
             res.append(tmp)
-    return res
+    return res, new_entries
 
 # Function for otter pipeline - OK
-def otterPipeline_opt(outDir, cpu, ref, bed_dir, inBam, count_reg, windowAss, window, bed):
+def otterPipeline_opt(outDir, cpu, ref, bed_dir, inBam, count_reg, windowAss, window, bed, cacheDir, reference_catalog = False):
     print('** Assembler: otter')
     # create directory for outputs
     os.system('mkdir %s/otter_local_asm' %(outDir))
     # run local assembly in multiprocessing -- optimized
     otter_start_time = time.time()
-    pool = multiprocessing.Pool(processes=cpu)
     otter_fun = partial(assembly_otter_opt, output_directory = outDir, ref_fasta = ref, bed_file = bed_dir, number_threads = cpu, windowAss = windowAss)
-    extract_results = pool.map(otter_fun, inBam)
-    pool.close()
+    extract_results = getPool(cpu).map(otter_fun, inBam)
     otter_end_time = time.time()
     time_otter = otter_end_time - otter_start_time
     print('*** Otter took %s seconds\t\t\t\t\t\t\t\t\t\t\t\t' %(round(time_otter, 0)))
     annot_start_time = time.time()
-    # do the same on the reference genome -- optimized
-    all_regions = [entry[2] for chromosome in bed for entry in bed[chromosome]]
-    # divide into n lists based on the number of regions
-    regions_list = [all_regions[i * (len(all_regions) // cpu) + min(i, len(all_regions) % cpu):(i + 1) * (len(all_regions) // cpu) + min(i + 1, len(all_regions) % cpu)] for i in range(cpu)]
-    pool = multiprocessing.Pool(processes=cpu)
-    extract_fun = partial(measureDistance_reference_opt, ref = ref, w = window)
-    extract_results_ref = pool.map(extract_fun, regions_list)
-    pool.close()
-    # run trf on reference
-    pool = multiprocessing.Pool(processes=cpu)
-    trf_ref = pool.map(run_trf_ref_opt, extract_results_ref)
-    pool.close()
-    # run trf on the assemblies
-    pool = multiprocessing.Pool(processes=cpu)
+    # do the same on the reference genome, unless the reference motifs come from the reference catalog
+    df_ref = None if reference_catalog else referenceAnnotation_opt(bed, ref, window, cpu, cacheDir)
+    # run trf on the assemblies: the annotation cache was loaded before the pool was started, so the workers can use it
     trf_asm = partial(run_trf_asm_opt, w = window)
-    trf_asm_res = pool.map(trf_asm, extract_results)
-    pool.close()
+    trf_asm_res = getPool(cpu).map(trf_asm, extract_results)
+    # save the new annotations in the cache
+    new_entries = {}
+    for x in trf_asm_res:
+        new_entries.update(x[1])
+    saveAnnotationCache(cacheDir, new_entries)
+    trf_asm_res = [x[0] for x in trf_asm_res]
     # Combine df from different samples together
     # flatten the lists first
-    flattened_ref = [sublist for sublist_list in trf_ref for sublist in sublist_list]
     flattened_asm = [sublist for sublist_list in trf_asm_res for sublist in sublist_list]
     # make dataframes
     df_asm = pd.DataFrame(flattened_asm, columns = ['ID', 'SEED_START', 'SEED_END', 'MOTIF', 'MOTIF_SIZE', 'SEED_REPEAT', 'ATR_START', 'ATR_END', 'ATR_REPEAT', 'ATR_SIZE', 'MATCHES', 'SUBSTITUTIONS', 'INSERTIONS', 'DELETIONS', 'IDENTITY', 'SEQUENCE', 'SEQUENCE_LEN', 'SAMPLE', 'HAPLOTYPE', 'REGION', 'TOTAL_COVERAGE', 'COVERAGE_HAPLO'])
-    df_ref = pd.DataFrame(flattened_ref, columns = ['REGION', 'SEED_START', 'SEED_END', 'MOTIF', 'MOTIF_SIZE', 'SEED_REPEAT', 'ATR_START', 'ATR_END', 'ATR_REPEAT', 'ATR_SIZE', 'MATCHES', 'SUBSTITUTIONS', 'INSERTIONS', 'DELETIONS', 'IDENTITY', 'SEQUENCE', 'SEQUENCE_LEN', 'SAMPLE'])
-    # add HAPLOTYPE to reference -- 1
-    df_ref['HAPLOTYPE'] = 1
     # finally concatenate with reference info
-    df_all = pd.concat([df_asm, df_ref])
+    df_all = pd.concat([df_asm, df_ref]) if df_ref is not None else df_asm
     annot_end_time = time.time()
     time_annot = annot_end_time - annot_start_time
     print('*** Annotation took %s seconds\t\t\t\t\t\t\t\t\t\t\t\t' %(round(time_annot, 0)))
     return df_all
 
+# Function to annotate the regions in the reference genome
+def referenceAnnotation_opt(bed, ref, window, cpu, cacheDir):
+    all_regions = [entry[2] for chromosome in bed for entry in bed[chromosome]]
+    # divide into n lists based on the number of regions: regions are sorted so that each worker reads a stretch of the genome
+    all_regions.sort(key = regionKey)
+    regions_list = [all_regions[i * (len(all_regions) // cpu) + min(i, len(all_regions) % cpu):(i + 1) * (len(all_regions) // cpu) + min(i + 1, len(all_regions) % cpu)] for i in range(cpu)]
+    extract_fun = partial(measureDistance_reference_opt, ref = ref, w = window)
+    extract_results_ref = getPool(cpu).map(extract_fun, regions_list)
+    # run trf on reference: the annotation cache was loaded before the pool was started, so the workers can use it
+    trf_ref_res = getPool(cpu).map(run_trf_ref_opt, extract_results_ref)
+    # save the new annotations in the cache
+    new_entries = {}
+    for x in trf_ref_res:
+        new_entries.update(x[1])
+    saveAnnotationCache(cacheDir, new_entries)
+    flattened_ref = [sublist for x in trf_ref_res for sublist in x[0]]
+    df_ref = pd.DataFrame(flattened_ref, columns = ['REGION', 'SEED_START', 'SEED_END', 'MOTIF', 'MOTIF_SIZE', 'SEED_REPEAT', 'ATR_START', 'ATR_END', 'ATR_REPEAT', 'ATR_SIZE', 'MATCHES', 'SUBSTITUTIONS', 'INSERTIONS', 'DELETIONS', 'IDENTITY', 'SEQUENCE', 'SEQUENCE_LEN', 'SAMPLE'])
+    # add HAPLOTYPE to reference -- 1
+    df_ref['HAPLOTYPE'] = 1
+    return df_ref
+
+# Function for the reference catalog: the reference leg of the assembly-based analysis (sequences, motif finding and reference motifs) on all the regions
+def referenceCatalog_opt(bed, ref, window, cpu, cacheDir):
+    data = adjustMotifs_opt(referenceAnnotation_opt(bed, ref, window, cpu, cacheDir))
+    return referenceMotifTable_opt(data, cpu)
+
 # Measure the distance in the reference genome - OK
 def measureDistance_reference_opt(x, ref, w):
     distances = []
-    # open the fasta
-    fa = pyfaidx.Fasta(ref)
-    # x is a list of regions -- iterate through these regions
-    for i in x:
-        chrom, start, end = i.split(':')[0], int(i.split(':')[-1].split('-')[0]), int(i.split(':')[-1].split('-')[1])
-        tmp = fa[chrom][(start-1) : end]
+    # x is a list of regions: sequences are fetched in genome order from the fasta opened once per worker
+    regions = [(i.split(':')[0], int(i.split(':')[-1].split('-')[0]), int(i.split(':')[-1].split('-')[1])) for i in x]
+    for i, tmp in zip(x, referenceSequences(regions, 0, ref)):
+        if tmp is None:
+            continue
         distances.append(['reference', i, 'reference', 'NA', 'NA', 'NA', str(tmp).upper(), str(tmp).upper(), len(tmp), len(tmp)])
     return distances
 
@@ -270,7 +289,7 @@ def measureDistance_reference_opt(x, ref, w):
 def removeTemp(outDir):
     # list all files
     all_files = [x.rstrip() for x in list(os.popen('ls %s' %(outDir)))]
-    all_files = ['%s/%s' %(outDir, x) for x in all_files if 'gz' not in x]
+    all_files = ['%s/%s' %(outDir, x) for x in all_files if 'gz' not in x and not x.endswith('.parquet')]
     all_files = [x for x in all_files if 'otter_local_asm' not in x]
     all_files = [x for x in all_files if 'trf_reads' not in x]
     all_files = [x for x in all_files if 'log' not in x]
@@ -284,30 +303,14 @@ def removeTemp(outDir):
 
 ### FUNCTIONS FOR HAPLOTYPING
 # Function that guides haplotyping - OK
-def haplotyping_steps_opt(data, n_cpu, thr_mad, min_support, type, outDir, inBam):
+def haplotyping_steps_opt(data, n_cpu, thr_mad, min_support, type, outDir, inBam, reference_motif_dic = None):
     # Adjust the motifs in the data to find a uniform representation
     #data['UNIQUE_NAME'] = data.apply(lambda row: str(row['SAMPLE']) + '___' + str(row['REGION']) + '___' + str(row['HAPLOTYPE']), axis = 1)
     motif_start_time = time.time()
-    data['MOTIF'] = data['MOTIF'].replace("NA", np.nan)
-    all_motifs = data['MOTIF'].dropna().unique()
-    main_motifs = [permutMotif(motif) for motif in all_motifs]
-    motifs_df = pd.DataFrame({'motif' : all_motifs, 'UNIFORM_MOTIF' : main_motifs})
-    data = pd.merge(data, motifs_df, left_on='MOTIF', right_on='motif', how='left')
-    # Check motifs of the reference
-    ref = data[data['SAMPLE'] == 'REFERENCE'].copy()
-    ref['POLISHED_HAPLO'] = ref['SEQUENCE_LEN']
-    ref_ok = ref.drop_duplicates(subset='REGION', keep=False).copy()
-    ref_ok_dic = {row['REGION']: [row['MOTIF'], row['ATR_REPEAT'], row['SEQUENCE_LEN'], row['SEQUENCE']] for _, row in ref_ok.iterrows()}
-    ref_tocheck = ref[ref.duplicated(subset='REGION', keep=False)].copy()
-    # Only adjust motifs that need to be adjusted
-    all_regions = list(ref_tocheck['REGION'].dropna().unique())
-    pool = multiprocessing.Pool(processes=n_cpu)
-    motif_fun = partial(referenceMotifs_opt, ref = ref_tocheck)
-    motif_res = pool.map(motif_fun, all_regions)
-    pool.close()
-    # combine dictionaries
-    reference_motif_dic = {k: v for d in motif_res for k, v in d.items()}
-    reference_motif_dic.update(ref_ok_dic)
+    data = adjustMotifs_opt(data)
+    # Check motifs of the reference, unless they come from the reference catalog
+    if reference_motif_dic is None:
+        reference_motif_dic = referenceMotifTable_opt(data, n_cpu)
     # Then move to the sample(s)
     data_sample = data[data['SAMPLE'] != 'REFERENCE'].copy()
     data_sample['POLISHED_HAPLO'] = data_sample['SEQUENCE_LEN']
@@ -318,10 +321,8 @@ def haplotyping_steps_opt(data, n_cpu, thr_mad, min_support, type, outDir, inBam
     # fix those that need to be fixed
     data_sample_tocheck = data_sample[data_sample.duplicated(subset='ID', keep=False)].copy()
     ids_to_fix = list(data_sample_tocheck['ID'].dropna().unique())
-    pool = multiprocessing.Pool(processes=n_cpu)
     motif_fun = partial(sampleMotifs_opt, df = data_sample_tocheck)
-    motif_res = pool.map(motif_fun, ids_to_fix)
-    pool.close()
+    motif_res = getPool(n_cpu).map(motif_fun, ids_to_fix)
     motif_end_time = time.time()
     time_motif = motif_end_time - motif_start_time
     print('*** Motif merge took %s seconds\t\t\t\t\t\t\t\t\t\t\t\t' %(round(time_motif, 0)))
@@ -337,12 +338,10 @@ def haplotyping_steps_opt(data, n_cpu, thr_mad, min_support, type, outDir, inBam
     all_regions = list(data_final['REGION'].dropna().unique())
     # divide in n chunks where n is th enumber of cores
     prepare_start_time = time.time()
-    chunk_size = math.ceil(len(all_regions) / 4)
+    chunk_size = math.ceil(len(all_regions) / n_cpu)
     chunks = [all_regions[i * chunk_size:(i + 1) * chunk_size] for i in range(n_cpu)]
-    pool = multiprocessing.Pool(processes=n_cpu)
     prep_fun = partial(prepareOutputs_opt, final_sbs = data_final, reference_motif_dic = reference_motif_dic, all_samples = all_samples)
-    vcf = pool.map(prep_fun, chunks)
-    pool.close()
+    vcf = getPool(n_cpu).map(prep_fun, chunks)
     prepare_end_time = time.time()
     time_prepare = prepare_end_time - prepare_start_time
     print('*** preparation took %s seconds\t\t\t\t\t\t\t\t\t\t\t\t' %(round(time_prepare, 0)))
@@ -351,7 +350,7 @@ def haplotyping_steps_opt(data, n_cpu, thr_mad, min_support, type, outDir, inBam
     flattened_vcf = [item for sublist in vcf for item in sublist]
     df_vcf = pd.DataFrame(flattened_vcf, columns = ['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT'] + all_samples)
     # write vcf
-    vcf_file = '%s/sample.vcf' %(outDir)
+    vcf_file = '%s/sample.vcf.gz' %(outDir)
     writeOutputs_opt(df_vcf, vcf_file, all_samples, inBam)
     #write_done = writeOutDirect(outDir, data_final, reference_motif_dic, all_samples, all_regions)
     write_end_time = time.time()
@@ -359,18 +358,30 @@ def haplotyping_steps_opt(data, n_cpu, thr_mad, min_support, type, outDir, inBam
     print('*** Writing took %s seconds\t\t\t\t\t\t\t\t\t\t\t\t' %(round(time_write, 0)))
     return('Haplotyping analysis done!')
 
-# Function to make permutations - OK
-def permutMotif(motif):
-    # standard motif
-    motif_cons = [motif[i::] + motif[0:i] for i in range(len(motif))]
-    # reverse complement
-    rc_motif = reverse_complement(motif)
-    rc_motif_cons = [rc_motif[i::] + rc_motif[0:i] for i in range(len(rc_motif))]
-    # combine
-    comb_motifs = motif_cons + rc_motif_cons
-    # take the first in ascending order
-    sel_motif = sorted(comb_motifs)[0]
-    return sel_motif
+# Function to find a uniform representation of the motifs in the data
+def adjustMotifs_opt(data):
+    data['MOTIF'] = data['MOTIF'].replace("NA", np.nan)
+    all_motifs = data['MOTIF'].dropna().unique()
+    main_motifs = [permutMotif(motif) for motif in all_motifs]
+    motifs_df = pd.DataFrame({'motif' : all_motifs, 'UNIFORM_MOTIF' : main_motifs})
+    data = pd.merge(data, motifs_df, left_on='MOTIF', right_on='motif', how='left')
+    return data
+
+# Function to find the motif, copies, size and sequence of each region in the reference data
+def referenceMotifTable_opt(data, n_cpu):
+    ref = data[data['SAMPLE'] == 'REFERENCE'].copy()
+    ref['POLISHED_HAPLO'] = ref['SEQUENCE_LEN']
+    ref_ok = ref.drop_duplicates(subset='REGION', keep=False).copy()
+    ref_ok_dic = {row['REGION']: [row['MOTIF'], row['ATR_REPEAT'], row['SEQUENCE_LEN'], row['SEQUENCE']] for _, row in ref_ok.iterrows()}
+    ref_tocheck = ref[ref.duplicated(subset='REGION', keep=False)].copy()
+    # Only adjust motifs that need to be adjusted
+    all_regions = list(ref_tocheck['REGION'].dropna().unique())
+    motif_fun = partial(referenceMotifs_opt, ref = ref_tocheck)
+    motif_res = getPool(n_cpu).map(motif_fun, all_regions)
+    # combine dictionaries
+    reference_motif_dic = {k: v for d in motif_res for k, v in d.items()}
+    reference_motif_dic.update(ref_ok_dic)
+    return reference_motif_dic
 
 # Function to look at reference motifs - OK
 def referenceMotifs_opt(r, ref):
@@ -577,36 +588,25 @@ def manageSequence(sequences, alt, ref_seq):
     gt = '|'.join(gt)
     return gt, alt
 
-# Function to write outputs - OK
+# Function to write outputs: bgzip-compressed VCF with records in coordinate order, indexed with tabix - OK
 def writeOutputs_opt(df_vcf, vcf_file, all_samples, inBam):
-    # write header of vcf file
-    writeVCFheader(vcf_file, all_samples, inBam)
-    with open(vcf_file, mode='a') as file:
-        df_vcf.to_csv(file, header=True, index=False, sep='\t')
-    # then compress it
-    os.system('gzip %s' %(vcf_file))
-    # write sequence file
-    #df_seq.to_csv(seq_file, header=True, index=False, sep='\t', compression = 'gzip')
-    return
-
-# Function to write header of vcf file - OK
-def writeVCFheader(vcf_file, samples, inBam):
-    # open file
-    outf = open(vcf_file, 'w')
-    # write header
-    outf.write('##fileformat=VCFv4.2\n##INFO=<ID=REFERENCE_INFO,Number=2,Type=String,Description="Motif observed in the reference genome (GRCh38), and relative number of motif repetitions."\n##FORMAT=<ID=QC,Number=1,Type=String,Description="Quality summary of TREAT genotyping. PASS: passed quality filter."\n##FORMAT=<ID=GT,Number=2,Type=String,Description="Phased genotype of the tandem repeats. H1_genotype | H2_genotype"\n##FORMAT=<ID=GT_LEN,Number=2,Type=Number,Description="Phased size of the tandem repeat genotypes. H1_size | H2_size"\n##FORMAT=<ID=MOTIF,Number=2,Type=String,Description="Phased consensus motif found in the sample. H1_motif | H2_motif"\n##FORMAT=<ID=CN,Number=2,Type=String,Description="Phased number of copies of the motif found in the sample. H1_copies | H2_copies"\n##FORMAT=<ID=CN_REF,Number=2,Type=String,Description="Phased estimation of the reference motif as found in the sample. H1_motif_ref | H2_motif_ref"\n##FORMAT=<ID=DP,Number=1,Type=String,Description="Phased depth found of the tandem repeat. H1_depth | H2_depth"\n')
-    # need to add the contig information
-    contig_info = '\n'.join([convert_sq_to_contig(x.rstrip())for x in os.popen('samtools view -H %s' %(inBam[0])) if '@SQ' in x])
-    outf.write('%s\n' %(contig_info))
-    outf.close()
+    region_keys = [regionKey(x) for x in df_vcf['ID']]
+    df_vcf = df_vcf.iloc[sorted(range(df_vcf.shape[0]), key = lambda i: region_keys[i])]
+    fout = openVCF(vcf_file, VCF_HEADER_ASM, all_samples, inBam[0])
+    writeVCFrecords(fout, df_vcf.values.tolist())
+    closeVCF(fout, vcf_file)
     return
 
-# Function to convert sequence to contig - OK
-def convert_sq_to_contig(sq_string):
-    match = re.match(r'@SQ\tSN:(\S+)\tLN:(\d+)', sq_string)
-    if not match:
-        raise ValueError("The input string does not match the expected format")
-    return f'##contig=<ID={match.group(1)},length={match.group(2)}>'
+# header lines of the VCF file, contigs excluded
+VCF_HEADER_ASM = ['##fileformat=VCFv4.2',
+    '##INFO=<ID=REFERENCE_INFO,Number=2,Type=String,Description="Motif observed in the reference genome (GRCh38), and relative number of motif repetitions."',
+    '##FORMAT=<ID=QC,Number=1,Type=String,Description="Quality summary of TREAT genotyping. PASS: passed quality filter."',
+    '##FORMAT=<ID=GT,Number=2,Type=String,Description="Phased genotype of the tandem repeats. H1_genotype | H2_genotype"',
+    '##FORMAT=<ID=GT_LEN,Number=2,Type=Number,Description="Phased size of the tandem repeat genotypes. H1_size | H2_size"',
+    '##FORMAT=<ID=MOTIF,Number=2,Type=String,Description="Phased consensus motif found in the sample. H1_motif | H2_motif"',
+    '##FORMAT=<ID=CN,Number=2,Type=String,Description="Phased number of copies of the motif found in the sample. H1_copies | H2_copies"',
+    '##FORMAT=<ID=CN_REF,Number=2,Type=String,Description="Phased estimation of the reference motif as found in the sample. H1_motif_ref | H2_motif_ref"',
+    '##FORMAT=<ID=DP,Number=1,Type=String,Description="Phased depth found of the tandem repeat. H1_depth | H2_depth"']
 
 # Function to find sequences of consecutive integers - OK
 def is_consecutive(numbers):
@@ -0,0 +1,576 @@
+# LIBRARIES
+import sys
+import os
+import gzip
+import pickle
+import json
+import hashlib
+import math
+import shutil
+import multiprocessing
+import pysam
+import pytrf
+# pyarrow is only needed for parquet tables
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+import numpy as np
+import pandas as pd
+
+##########################################################
+###### COMMON FUNCTIONS TO READS AND ASSEMBLY ANALYSIS
+### FUNCTIONS FOR THE MOTIF-ANNOTATION CACHE
+# Motif annotations by hash of the motif-finding parameters and of the sequence
+# The dictionary is filled before the pools are created, so that worker processes inherit it
+ANNOTATION_CACHE = {}
+
+# Key of a sequence in the annotation cache
+def annotationKey(params, seq):
+    return hashlib.sha1(('%s\n%s' %(params, seq)).encode()).hexdigest()
+
+# Read the annotation cache of a cache directory
+def readAnnotationCache(cache_dir):
+    cache_file = '%s/motif_annotation_cache.pkl.gz' %(cache_dir)
+    if os.path.exists(cache_file):
+        try:
+            with gzip.open(cache_file, 'rb') as finp:
+                return pickle.load(finp)
+        except:
+            print('!! Annotation cache %s could not be read. Will annotate all sequences.' %(cache_file))
+    return {}
+
+# Load the annotation cache from the cache directory, if any
+def loadAnnotationCache(cache_dir):
+    ANNOTATION_CACHE.clear()
+    if cache_dir != 'None':
+        ANNOTATION_CACHE.update(readAnnotationCache(cache_dir))
+        print('** Annotation cache: %s sequences already annotated' %(len(ANNOTATION_CACHE)))
+    return ANNOTATION_CACHE
+
+# Add the new annotations to the cache and write it to the cache directory, if any
+def saveAnnotationCache(cache_dir, new_entries):
+    ANNOTATION_CACHE.update(new_entries)
+    if cache_dir != 'None' and len(new_entries) > 0:
+        os.makedirs(cache_dir, exist_ok = True)
+        # merge with the cache on disk, that other runs may have updated in the meantime
+        disk_cache = readAnnotationCache(cache_dir)
+        disk_cache.update(ANNOTATION_CACHE)
+        # write to a temporary file first, so that an interrupted run never leaves a broken cache
+        cache_file = '%s/motif_annotation_cache.pkl.gz' %(cache_dir)
+        tmp_file = '%s.%s.tmp' %(cache_file, os.getpid())
+        with gzip.open(tmp_file, 'wb') as fout:
+            pickle.dump(disk_cache, fout, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+        print('** Annotation cache: %s new sequences saved to %s' %(len(new_entries), cache_file))
+    return ANNOTATION_CACHE
+
+### FUNCTIONS FOR PYTRF
+# Keywords of pytrf 1.3, and their names in the installed version: later versions renamed them
+try:
+    pytrf.ATRFinder('check', 'ACGT', min_motif_size = 1, max_motif_size = 6, min_seed_repeat = 3, min_seed_length = 10)
+    PYTRF_KEYWORDS = {}
+except TypeError:
+    PYTRF_KEYWORDS = {'min_motif_size' : 'min_motif', 'max_motif_size' : 'max_motif', 'min_seed_repeat' : 'min_seedrep', 'min_seed_length' : 'min_seedlen'}
+
+# Fields of a tandem repeat, in the order of as_list in pytrf 1.3: later versions changed the order, so fields are taken by name
+ATR_FIELDS = ['chrom', 'seed_start', 'seed_end', 'motif', 'type', 'seed_repeat', 'start', 'end', 'repeat', 'length', 'matches', 'substitutions', 'insertions', 'deletions', 'identity']
+
+# pytrf 1.3 counts matches, substitutions and indels only in the extension of the seed, later versions in the whole repeat
+PYTRF_EXTENSION_COUNTS = len(PYTRF_KEYWORDS) == 0
+
+# Function to find the approximate tandem repeats of a sequence with the keywords of pytrf 1.3: each repeat is a dictionary of its fields, with counts on the whole repeat
+def findRepeats(name, seq, **kwargs):
+    repeats = [atr.as_dict() for atr in pytrf.ATRFinder(name, seq, **{PYTRF_KEYWORDS.get(k, k) : v for k, v in kwargs.items()})]
+    if PYTRF_EXTENSION_COUNTS:
+        # the seed is a perfect repeat: its bases are matches
+        for atr in repeats:
+            atr['matches'] += atr['seed_end'] - atr['seed_start'] + 1
+            atr['identity'] = 100 * atr['matches'] / (atr['matches'] + atr['substitutions'] + atr['insertions'] + atr['deletions'])
+    return repeats
+
+# Function to find the approximate tandem repeats of a sequence as lists of fields in the order of pytrf 1.3
+def repeatLists(name, seq, **kwargs):
+    return [[atr[x] for x in ATR_FIELDS] for atr in findRepeats(name, seq, **kwargs)]
+
+### FUNCTIONS FOR MOTIFS
+# Canonical motif of each motif seen so far: it can be preloaded from the cache directory
+MOTIF_TABLE = {}
+
+# Translation table for the complement of DNA sequences, IUPAC codes included
+COMPLEMENT_TABLE = str.maketrans('ACGTRYKMBVDHNSWacgtrykmbvdhnsw', 'TGCAYRMKVBHDNSWtgcayrmkvbhdnsw')
+
+# Function to make the reverse complement of a sequence
+def reverseComplement(seq):
+    return seq.translate(COMPLEMENT_TABLE)[::-1]
+
+# Function to find the lexicographically minimal rotation of a sequence
+# The minimal rotation starts with the smallest character, so only these rotations are compared
+def minimalRotation(seq):
+    seq_seq = seq + seq
+    min_char = min(seq)
+    return min([seq_seq[i : i + len(seq)] for i in range(len(seq)) if seq[i] == min_char])
+
+# Function to make a uniform representation of a motif: the first, in ascending order, of all the rotations of the motif and of its reverse complement
+def permutMotif(motif):
+    if motif not in MOTIF_TABLE:
+        MOTIF_TABLE[motif] = min(minimalRotation(motif), minimalRotation(reverseComplement(motif)))
+    return MOTIF_TABLE[motif]
+
+# Load the table of canonical motifs from the cache directory, if any
+def loadMotifTable(cache_dir):
+    if cache_dir != 'None':
+        table_file = '%s/canonical_motifs.txt.gz' %(cache_dir)
+        if os.path.exists(table_file):
+            with gzip.open(table_file, 'rt') as finp:
+                for line in finp:
+                    motif, canonical = line.rstrip('\n').split('\t')
+                    MOTIF_TABLE[motif] = canonical
+        print('** Motif table: %s motifs already known' %(len(MOTIF_TABLE)))
+    return MOTIF_TABLE
+
+# Write the table of canonical motifs to the cache directory, if any
+def saveMotifTable(cache_dir):
+    if cache_dir != 'None' and len(MOTIF_TABLE) > 0:
+        os.makedirs(cache_dir, exist_ok = True)
+        table_file = '%s/canonical_motifs.txt.gz' %(cache_dir)
+        tmp_file = '%s.%s.tmp' %(table_file, os.getpid())
+        with gzip.open(tmp_file, 'wt') as fout:
+            for motif in MOTIF_TABLE:
+                fout.write('%s\t%s\n' %(motif, MOTIF_TABLE[motif]))
+        os.replace(tmp_file, table_file)
+    return MOTIF_TABLE
+
+### FUNCTIONS FOR HAPLOTYPING
+# Function to make a compact integer key of the reads: the same read, sample, region and sequence length have the same key
+def uniqueReadKey(data):
+    # factorize each column (missing values get their own code) and number the combinations
+    codes = pd.DataFrame({col : pd.factorize(data[col])[0] for col in ['READ_NAME', 'SAMPLE_NAME', 'REGION', 'LEN_SEQUENCE_FOR_TRF']}, index = data.index)
+    return codes.groupby(list(codes.columns), sort = False).ngroup()
+
+### FUNCTIONS TO SHARE TABLES WITH THE WORKER PROCESSES
+# Column stores opened by this process
+COLUMN_STORES = {}
+
+# Function to write a table as a column store of memory-mapped files: numeric columns as arrays, string columns as one buffer with offsets, other columns pickled
+def writeColumnStore(df, store_dir):
+    os.makedirs(store_dir, exist_ok = True)
+    meta = []
+    for i, col in enumerate(df.columns):
+        values = df[col].values
+        prefix = '%s/col_%s' %(store_dir, i)
+        missing = pd.isna(values)
+        if values.dtype.kind in 'biuf':
+            np.save('%s.npy' %(prefix), values)
+            meta.append([col, 'numeric'])
+        elif all([isinstance(x, str) for x in values[~missing]]):
+            encoded = [b'' if missing[j] else values[j].encode() for j in range(len(values))]
+            offsets = np.zeros(len(values) + 1, dtype = np.int64)
+            offsets[1:] = np.cumsum([len(x) for x in encoded])
+            with open('%s.bytes' %(prefix), 'wb') as fout:
+                fout.write(b''.join(encoded))
+            np.save('%s.offsets.npy' %(prefix), offsets)
+            np.save('%s.missing.npy' %(prefix), missing)
+            meta.append([col, 'string'])
+        else:
+            with open('%s.pkl' %(prefix), 'wb') as fout:
+                pickle.dump(values, fout, protocol = pickle.HIGHEST_PROTOCOL)
+            meta.append([col, 'object'])
+    with open('%s/meta.pkl' %(store_dir), 'wb') as fout:
+        pickle.dump(meta, fout)
+    return store_dir
+
+# Function to open a column store, once per process
+def openColumnStore(store_dir):
+    if store_dir not in COLUMN_STORES:
+        with open('%s/meta.pkl' %(store_dir), 'rb') as finp:
+            meta = pickle.load(finp)
+        columns = []
+        for i, (col, kind) in enumerate(meta):
+            prefix = '%s/col_%s' %(store_dir, i)
+            if kind == 'numeric':
+                columns.append([col, kind, np.load('%s.npy' %(prefix), mmap_mode = 'r')])
+            elif kind == 'string':
+                buffer = np.memmap('%s.bytes' %(prefix), dtype = np.uint8, mode = 'r') if os.path.getsize('%s.bytes' %(prefix)) > 0 else np.zeros(0, dtype = np.uint8)
+                columns.append([col, kind, [buffer, np.load('%s.offsets.npy' %(prefix), mmap_mode = 'r'), np.load('%s.missing.npy' %(prefix), mmap_mode = 'r')]])
+            else:
+                with open('%s.pkl' %(prefix), 'rb') as finp:
+                    columns.append([col, kind, pickle.load(finp)])
+        COLUMN_STORES[store_dir] = columns
+    return COLUMN_STORES[store_dir]
+
+# Function to read the rows start:stop of a column store as a dataframe
+def readColumnStore(store_dir, start, stop):
+    data = {}
+    for col, kind, values in openColumnStore(store_dir):
+        if kind == 'numeric':
+            data[col] = np.array(values[start:stop])
+        elif kind == 'string':
+            buffer, offsets, missing = values
+            chunk = bytes(buffer[offsets[start] : offsets[stop]])
+            pos = offsets[start : (stop + 1)] - offsets[start]
+            data[col] = [np.nan if missing[start + j] else chunk[pos[j] : pos[j + 1]].decode() for j in range(stop - start)]
+        else:
+            data[col] = values[start:stop]
+    return pd.DataFrame(data, columns = [x[0] for x in COLUMN_STORES[store_dir]])
+
+# Function to write an object shared with the worker processes
+def writeSharedObject(obj, path):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, 'wb') as fout:
+        pickle.dump(obj, fout, protocol = pickle.HIGHEST_PROTOCOL)
+    return path
+
+# Function to read an object shared with the worker processes, once per process
+def readSharedObject(path):
+    if path not in COLUMN_STORES:
+        with open(path, 'rb') as finp:
+            COLUMN_STORES[path] = pickle.load(finp)
+    return COLUMN_STORES[path]
+
+# Function to remove a column store
+def removeColumnStore(store_dir):
+    for path in [x for x in COLUMN_STORES.keys() if x.startswith(store_dir)]:
+        COLUMN_STORES.pop(path)
+    shutil.rmtree(store_dir, ignore_errors = True)
+
+### FUNCTIONS FOR THE WORKER POOL
+# Pool of worker processes shared by all the steps of the analysis, and data preloaded in the workers
+WORKER_POOL = None
+WORKER_DATA = {}
+
+# Function to initialize a worker process with the preloaded data
+def initWorker(preload):
+    WORKER_DATA.clear()
+    WORKER_DATA.update(preload)
+
+# Function to start the pool of worker processes: preload is a dictionary (e.g. bed index, reference path) available in the workers through WORKER_DATA
+# Motif tables and annotation caches loaded before the pool is started are inherited by the workers
+def startPool(cpu, preload = {}):
+    global WORKER_POOL
+    closePool()
+    initWorker(preload)
+    WORKER_POOL = multiprocessing.Pool(processes=cpu, initializer=initWorker, initargs=(preload,))
+    return WORKER_POOL
+
+# Function to get the pool of worker processes, which is started if needed
+def getPool(cpu):
+    if WORKER_POOL is None:
+        startPool(cpu)
+    return WORKER_POOL
+
+# Function to close the pool of worker processes
+def closePool():
+    global WORKER_POOL
+    if WORKER_POOL is not None:
+        WORKER_POOL.close()
+        WORKER_POOL.join()
+        WORKER_POOL = None
+
+# Function to get the reference genome of the worker: the fasta file (by default, the preloaded one) is opened once per process, together with the table of contig names
+def workerReference(ref = None):
+    ref = WORKER_DATA['reference'] if ref is None else ref
+    if WORKER_DATA.get('reference_handle', [None])[0] != ref:
+        fa = pysam.FastaFile(ref)
+        WORKER_DATA['reference_handle'] = [ref, fa, contigAliases(fa.references)]
+    return WORKER_DATA['reference_handle'][1]
+
+# Function to create the table of contig names: names with and without 'chr' point to the contig of the reference
+def contigAliases(contigs):
+    aliases = {}
+    for contig in contigs:
+        aliases.setdefault(contig[3:] if contig.startswith('chr') else 'chr' + contig, contig)
+    aliases.update({x : x for x in contigs})
+    return aliases
+
+# Function to get the sequences of regions (chromosome, 1-based start, end) from the reference of the worker, with paddings
+# Regions are fetched in genome order, and sequences are returned in the order of the regions (None for contigs not in the reference)
+def referenceSequences(regions, padding = 0, ref = None):
+    fa = workerReference(ref)
+    aliases = WORKER_DATA['reference_handle'][2]
+    sequences = [None] * len(regions)
+    for i in sorted(range(len(regions)), key = lambda i: (chromosomeKey(regions[i][0]), regions[i][1])):
+        chrom, start, end = regions[i]
+        if chrom in aliases.keys():
+            sequences[i] = fa.fetch(aliases[chrom], max(0, start - 1 - padding), end + padding)
+    return sequences
+
+### FUNCTIONS FOR TABLES OF READS
+# Columns of strings with few distinct values, stored as dictionaries in parquet tables
+DICTIONARY_COLUMNS = ['SAMPLE_NAME', 'SAMPLE', 'REGION', 'EXPECTED_MOTIF', 'TRF_MOTIF', 'MOTIF', 'motif', 'UNIFORM_MOTIF', 'CONSENSUS_MOTIF', 'MOTIF_REF', 'type']
+
+# Function to check that the table format can be used
+def checkTableFormat(table_format):
+    if table_format == 'parquet' and pyarrow is None:
+        print('!! Parquet format requires pyarrow, which is not installed. Quitting.')
+        sys.exit(1)
+    return table_format
+
+# Function to make the file name of a table given the format
+def tableName(path_base, table_format):
+    return '%s.parquet' %(path_base) if table_format == 'parquet' else '%s.txt.gz' %(path_base)
+
+# Function to write a table of reads: gzipped text, or parquet with typed columns sorted by region and sample
+def writeTable(df, path_base, table_format, sep = ' '):
+    outf = tableName(path_base, table_format)
+    if table_format == 'parquet':
+        typed = {}
+        for col in df.columns:
+            values = df[col].replace('NA', np.nan) if df[col].dtype == object else df[col]
+            not_missing = values.notna()
+            if values.dtype == object:
+                # columns with numbers only become numeric as in text tables, the others strings (as dictionaries if they have few distinct values)
+                numeric = pd.to_numeric(values, errors='coerce')
+                if numeric.notna().sum() == not_missing.sum():
+                    typed[col] = numeric
+                else:
+                    typed[col] = values.where(~not_missing, values.astype(str))
+                    if col in DICTIONARY_COLUMNS:
+                        typed[col] = typed[col].astype('category')
+            else:
+                typed[col] = values
+        typed = pd.DataFrame(typed, columns = df.columns)
+        # sort rows so that reading by region and sample can skip row groups
+        sort_cols = [x for x in ['REGION', 'SAMPLE_NAME', 'SAMPLE'] if x in typed.columns]
+        if len(sort_cols) >0:
+            typed = typed.sort_values(sort_cols, kind = 'mergesort')
+        pq.write_table(pyarrow.Table.from_pandas(typed, preserve_index = False), outf, row_group_size = 100000)
+    else:
+        df.to_csv(outf, sep = sep, index=False, na_rep='NA', compression='gzip')
+    return outf
+
+# Function to read a table of reads, optionally only some columns, regions and samples
+def readTable(inpf, columns = None, regions = None, samples = None):
+    if inpf.endswith('.parquet'):
+        checkTableFormat('parquet')
+        schema_cols = pq.read_schema(inpf).names
+        filters = []
+        if regions is not None:
+            filters.append(('REGION', 'in', list(regions)))
+        if samples is not None:
+            filters.extend([(x, 'in', list(samples)) for x in ['SAMPLE_NAME', 'SAMPLE'] if x in schema_cols][:1])
+        df = pq.read_table(inpf, columns = columns, filters = filters if len(filters) >0 else None).to_pandas()
+        # dictionary columns back to plain values
+        for col in df.columns:
+            if str(df[col].dtype) == 'category':
+                df[col] = df[col].astype(object)
+    else:
+        # separator from the header
+        with gzip.open(inpf, 'rt') as finp:
+            sep = '\t' if '\t' in finp.readline() else ' '
+        df = pd.read_csv(inpf, sep = sep, compression = 'gzip', usecols = columns, low_memory = False)
+        if regions is not None:
+            df = df[df['REGION'].isin(list(regions))]
+        if samples is not None:
+            sample_col = [x for x in ['SAMPLE_NAME', 'SAMPLE'] if x in df.columns][0]
+            df = df[df[sample_col].isin(list(samples))]
+    return df
+
+### FUNCTIONS FOR CHECKPOINTS
+# Key of an input file: path, size and modification time, or the content itself for small files like BED files
+def fileKey(path, content = False):
+    if path == 'None' or not os.path.isfile(path):
+        return [path]
+    if content:
+        with open(path, 'rb') as finp:
+            return [hashlib.sha1(finp.read()).hexdigest()]
+    file_stat = os.stat(path)
+    return [os.path.abspath(path), file_stat.st_size, file_stat.st_mtime_ns]
+
+# Key of a checkpoint: hash of all the inputs and parameters of the step
+def checkpointKey(*items):
+    return hashlib.sha1(repr(items).encode()).hexdigest()
+
+# Read a checkpoint: returns whether it was found and the saved result
+def readCheckpoint(checkpoint_dir, stage, key):
+    checkpoint_file = '%s/%s.%s.pkl.gz' %(checkpoint_dir, stage, key)
+    if checkpoint_dir != 'None' and os.path.exists(checkpoint_file):
+        try:
+            with gzip.open(checkpoint_file, 'rb') as finp:
+                return True, pickle.load(finp)
+        except:
+            print('!! Checkpoint %s could not be read. Will run the step again.' %(checkpoint_file))
+    return False, None
+
+# Write a checkpoint: to a temporary file first, so that an interrupted run never leaves a broken checkpoint
+def writeCheckpoint(checkpoint_dir, stage, key, obj):
+    if checkpoint_dir != 'None':
+        os.makedirs(checkpoint_dir, exist_ok = True)
+        checkpoint_file = '%s/%s.%s.pkl.gz' %(checkpoint_dir, stage, key)
+        tmp_file = '%s.%s.tmp' %(checkpoint_file, os.getpid())
+        with gzip.open(tmp_file, 'wb') as fout:
+            pickle.dump(obj, fout, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, checkpoint_file)
+    return obj
+
+# Map a function over the tasks of a step in the worker pool, reusing the tasks with a checkpoint
+def mapCheckpointed(fun, tasks, keys, stage, checkpoint_dir, cpu):
+    results = [readCheckpoint(checkpoint_dir, stage, key) for key in keys]
+    todo = [i for i in range(len(tasks)) if not results[i][0]]
+    if checkpoint_dir != 'None' and len(todo) < len(tasks):
+        print('** %s: %s of %s chunks reused from checkpoints' %(stage, len(tasks) - len(todo), len(tasks)))
+    results = [x[1] for x in results]
+    # checkpoints are written as soon as each chunk is done
+    for i, res in zip(todo, getPool(cpu).imap(fun, [tasks[i] for i in todo])):
+        results[i] = writeCheckpoint(checkpoint_dir, stage, keys[i], res)
+    return results
+
+### FUNCTIONS FOR TABLES WRITTEN IN CHUNKS
+# Open a table that is written in chunks: text tables are written as the chunks arrive, parquet tables at the end, as the column types depend on the whole table
+def openTable(path_base, table_format, sep = ' '):
+    writer = {'path_base' : path_base, 'format' : table_format, 'sep' : sep, 'chunks' : [], 'file' : None, 'header' : True}
+    if table_format != 'parquet':
+        writer['file'] = gzip.open(tableName(path_base, table_format), 'wt')
+    return writer
+
+# Add a chunk of rows to the table
+def appendTable(writer, df):
+    if writer['file'] is None:
+        writer['chunks'].append(df)
+    else:
+        df.to_csv(writer['file'], sep = writer['sep'], index=False, na_rep='NA', header = writer['header'])
+        writer['header'] = False
+    return writer
+
+# Close the table and return the file name
+def closeTable(writer):
+    if writer['file'] is None:
+        df = pd.concat(writer['chunks'], ignore_index=True) if len(writer['chunks']) >0 else pd.DataFrame()
+        return writeTable(df, writer['path_base'], writer['format'], writer['sep'])
+    writer['file'].close()
+    return tableName(writer['path_base'], writer['format'])
+
+### FUNCTIONS FOR VCF OUTPUTS
+# Sorting key of chromosomes in natural order: chr1, chr2, ..., chr10, ..., chrX, chrY
+def chromosomeKey(chrom):
+    name = chrom[3:] if chrom.startswith('chr') else chrom
+    return (0, int(name), '') if name.isdigit() else (1, 0, name)
+
+# Sorting key of regions (chrom:start-end) in coordinate order
+def regionKey(region):
+    chrom, interval = region.rsplit(':', 1)
+    start, end = interval.split('-')
+    return (chromosomeKey(chrom), int(start), int(end))
+
+# Contig lines of the VCF header, from the header of a BAM file
+def contigHeader(bam):
+    with pysam.AlignmentFile(bam) as finp:
+        return ['##contig=<ID=%s,length=%s>' %(chrom, length) for chrom, length in zip(finp.references, finp.lengths)]
+
+# Open a bgzip-compressed VCF file and write the header: contigs are taken from the BAM file, if given
+def openVCF(vcf_file, header, samples, bam = None):
+    fout = pysam.BGZFile(vcf_file, 'wb')
+    lines = header + (contigHeader(bam) if bam is not None else []) + ['\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT'] + list(samples))]
+    fout.write(('\n'.join(lines) + '\n').encode())
+    return fout
+
+# Write VCF records: missing values are written as .
+def writeVCFrecords(fout, records):
+    if len(records) >0:
+        fout.write(''.join(['\t'.join(['.' if x is None or (isinstance(x, float) and math.isnan(x)) else str(x) for x in rec]) + '\n' for rec in records]).encode())
+    return len(records)
+
+# Close the VCF file and index it with tabix: records must be in coordinate order
+def closeVCF(fout, vcf_file):
+    fout.close()
+    pysam.tabix_index(vcf_file, preset = 'vcf', force = True)
+    return vcf_file
+
+### FUNCTIONS FOR VCF INPUTS
+# FORMAT of the VCF files produced by TREAT: reads-spanning and assembly
+TREAT_FORMATS = ['QC;GT;MOTIF;CN;CN_REF;DP', 'QC;GT;GT_LEN;MOTIF;CN;CN_REF;DP']
+# Parsed headers of VCF files, by path, size and modification time of the file
+VCF_HEADERS = {}
+
+# Open a VCF file, compressed (gzip or bgzip) or not
+def openVCFtext(vcf_file):
+    with open(vcf_file, 'rb') as finp:
+        compressed = finp.read(2) == b'\x1f\x8b'
+    return gzip.open(vcf_file, 'rt') if compressed else open(vcf_file)
+
+# Parse the header of a VCF file, reading only until the first record: header lines, samples, contigs, FORMAT fields, and whether the file was produced by TREAT
+def readVCFheader(vcf_file):
+    file_stat = os.stat(vcf_file)
+    key = (os.path.abspath(vcf_file), file_stat.st_size, file_stat.st_mtime_ns)
+    if key in VCF_HEADERS.keys():
+        return VCF_HEADERS[key]
+    header = {'lines' : [], 'samples' : [], 'contigs' : [], 'format_fields' : [], 'record_format' : None, 'treat' : False}
+    try:
+        with openVCFtext(vcf_file) as finp:
+            for line in finp:
+                line = line.rstrip('\n')
+                if line.startswith('##'):
+                    header['lines'].append(line)
+                    if line.startswith('##contig=<ID='):
+                        header['contigs'].append(line[len('##contig=<ID='):].split(',')[0].rstrip('>'))
+                    elif line.startswith('##FORMAT=<ID='):
+                        header['format_fields'].append(line[len('##FORMAT=<ID='):].split(',')[0])
+                elif line.startswith('#CHROM'):
+                    header['samples'] = line.split('\t')[9:]
+                elif line.strip() != '':
+                    fields = line.split('\t')
+                    header['record_format'] = fields[8] if len(fields) >8 else ''
+                    break
+    except (OSError, EOFError, UnicodeDecodeError):
+        VCF_HEADERS[key] = header
+        return header
+    # TREAT files declare all the FORMAT fields, and records use one of the TREAT formats
+    declared = all([x in header['format_fields'] for x in TREAT_FORMATS[0].split(';')])
+    header['treat'] = declared and (header['record_format'] is None or header['record_format'] in TREAT_FORMATS)
+    VCF_HEADERS[key] = header
+    return header
+
+### FUNCTIONS FOR THE REFERENCE CATALOG
+# Version of the reference catalog: catalogs of other versions must be built again
+CATALOG_VERSION = 2
+
+# Function to describe the reference genome: contigs and their length
+def referenceContigs(ref):
+    fa = pysam.FastaFile(ref)
+    contigs = dict(zip(fa.references, fa.lengths))
+    fa.close()
+    return contigs
+
+# Function to convert the numpy values of the catalog for json
+def catalogValue(x):
+    return x.item() if isinstance(x, np.generic) else str(x)
+
+# Function to write the reference catalog as gzipped json: it is written to a temporary file first, so that an interrupted run never leaves a broken catalog
+def writeCatalog(catalog, catalog_file):
+    catalog = dict(catalog, version = CATALOG_VERSION)
+    tmp_file = '%s.%s.tmp' %(catalog_file, os.getpid())
+    with gzip.open(tmp_file, 'wt') as fout:
+        json.dump(catalog, fout, default = catalogValue)
+    os.replace(tmp_file, catalog_file)
+    return catalog_file
+
+# Function to read the reference motifs of an analysis (reads or assembly) from the reference catalog
+# The catalog must be of the same version, and built on the same reference genome, with the same parameters and for all the regions of the analysis
+def readCatalog(catalog_file, analysis, ref, params, regions):
+    try:
+        with gzip.open(catalog_file, 'rt') as finp:
+            catalog = json.load(finp)
+    except (OSError, EOFError, ValueError):
+        print('\n!!! Reference catalog %s is missing or not readable.\nExecution halted.' %(catalog_file))
+        sys.exit(1)
+    problems = []
+    if catalog.get('version') != CATALOG_VERSION:
+        problems.append('version %s instead of %s' %(catalog.get('version'), CATALOG_VERSION))
+    elif analysis not in catalog.keys():
+        problems.append('no annotation for the %s analysis' %(analysis))
+    else:
+        if catalog['contigs'] != referenceContigs(ref):
+            problems.append('built on a different reference genome (%s)' %(catalog['reference']))
+        if catalog[analysis]['params'] != params:
+            problems.append('built with different parameters (%s)' %(', '.join(['%s=%s' %(k, v) for k, v in catalog[analysis]['params'].items()])))
+        catalog_regions = set(catalog[analysis]['regions'])
+        missing = [r for r in regions if r not in catalog_regions]
+        if len(missing) >0:
+            problems.append('%s regions of the BED file are not in the catalog' %(len(missing)))
+    if len(problems) >0:
+        print('\n!!! Reference catalog %s can not be used: %s. Please build it again with TREAT.py catalog.\nExecution halted.' %(catalog_file, '; '.join(problems)))
+        sys.exit(1)
+    motifs = catalog[analysis]['motifs']
+    print('** Reference catalog: reference motifs of %s regions' %(len(regions)))
+    return {r : motifs[r] for r in regions if r in motifs.keys()}
@@ -9,7 +9,6 @@ import pandas as pd
 import re
 import math
 import time
-from Bio.Seq import reverse_complement
 import numpy as np
 #import itertools
 import scipy.stats as stats
@@ -18,6 +17,10 @@ from sklearn.cluster import KMeans
 #import shutil
 import warnings
 import gzip
+import bisect
+import tempfile
+import pytrf
+from functions_common import *
 
 ##########################################################
 ###### COMMON BASIC FUNCTIONS TO READS AND ASSEMBLY ANALYSIS
@@ -64,21 +67,37 @@ def readBed(bed_dir, out_dir):
             print('** Of these, %s are valid intervals, and %s are invalid. Invalid intervals (distance between start and end of 0) have been removed.' %(counter_valid, counter_invalid))
         else:
             print('** All intervals are valid.')
-        return bed, count_reg, fout_name
+        # index the regions for the overlap queries
+        bed_index = indexBed(bed)
+        return bed, count_reg, fout_name, bed_index
     except:
         print("\n!!! Input BED file is missing or wrongly formatted. Make sure to provide a genuine tab-separated BED file without header.\nExecution halted.")
         sys.exit(1)  # Exit the script with a non-zero status code
 
+# Index bed file: for each chromosome, the regions sorted by start, with their ends and the running maximum of the ends
+def indexBed(bed):
+    bed_index = {}
+    for chrom, intervals in bed.items():
+        sorted_intervals = sorted([[int(x[0]), int(x[1]), x[2]] for x in intervals], key = lambda x: (x[0], x[1]))
+        starts = [x[0] for x in sorted_intervals]
+        ends = [x[1] for x in sorted_intervals]
+        max_ends = list(np.maximum.accumulate(ends))
+        ids = [x[2] for x in sorted_intervals]
+        bed_index[chrom] = [starts, ends, max_ends, ids]
+    return bed_index
+
 # Check directory
-def checkOutDir(out_dir):
+def checkOutDir(out_dir, resume = 'False'):
     if out_dir[-1] == '/':
         out_dir = out_dir[:-1]
     if os.path.isdir(out_dir) == False:
         os.system('mkdir %s' %(out_dir))
         return("** Output directory valid.")
     else:
-        # check if directory is empty or not
-        if any(os.scandir(out_dir)):
+        # check if directory is empty or not: when resuming, the checkpoints of the previous run are there
+        if resume == 'True':
+            return("** Output directory exists. Will resume from the checkpoints there.")
+        elif any(os.scandir(out_dir)):
             print("\n!!! Output directory you indicated is not empty. This may cause issues and unexpected results. Please indicate a new folder instead.\nExecution halted.")
             sys.exit(1)  # Exit the script with a non-zero status code
         else:
@@ -98,13 +117,20 @@ def checkBAM(bam_dir):
         elif ',' in bam_dir:                            # in case there is a comma-separated list of bams
             all_bams = bam_dir.split(',')
             print("** BAM file(s): found %s bam" %(len(all_bams)))
-        return all_bams
+        else:
+            raise FileNotFoundError(bam_dir)
     except:
         print("\n!!! Input BAM file is missing or wrongly formatted. Make sure to provide a genuine BAM file.\nExecution halted.")
         sys.exit(1)  # Exit the script with a non-zero status code
+    # reads are fetched by region, so bam files need to be indexed
+    not_indexed = [x for x in all_bams if not (os.path.isfile(x + '.bai') or os.path.isfile(x + '.csi') or os.path.isfile(re.sub(r'\.bam$', '.bai', x)))]
+    if len(not_indexed) >0:
+        print("\n!!! Input BAM file(s) not indexed: %s. Please index them with samtools index.\nExecution halted." %(' '.join(not_indexed)))
+        sys.exit(1)  # Exit the script with a non-zero status code
+    return all_bams
 
 # Function to create Log file -- Reads analysis
-def createLogReads(inBam, bed_dir, outDir, ref, window, cpu, phasingData, mappingSNP, HaploDev, minimumSupport, minimumCoverage):
+def createLogReads(inBam, bed_dir, outDir, ref, window, cpu, phasingData, mappingSNP, HaploDev, minimumSupport, minimumCoverage, trfBackend, cacheDir, outFormat, resume, catalog):
     foutname = open('%s/treat_run.log' %(outDir), 'w')
     foutname.write('Read-based analysis selected\n')
     foutname.write('** Required argument:\n')
@@ -120,8 +146,13 @@ def createLogReads(inBam, bed_dir, outDir, ref, window, cpu, phasingData, mappin
     foutname.write("\tHaplotyping deviation: %s\n" %(HaploDev))
     foutname.write("\tMinimum supporting reads: %s\n" %(minimumSupport))
     foutname.write("\tMinimum coverage: %s\n" %(minimumCoverage))
+    foutname.write("\tTRF backend: %s\n" %(trfBackend))
+    foutname.write("\tAnnotation cache directory: %s\n" %(cacheDir))
+    foutname.write("\tTable format: %s\n" %(outFormat))
+    foutname.write("\tResume from checkpoints: %s\n" %(resume))
+    foutname.write("\tReference catalog: %s\n" %(catalog))
     foutname.write("\n")
-    foutname.write('Effective command line:\nTREAT.py reads -i %s -b %s -o %s -r %s -w %s -t %s -p %s -m %s -d %s -minSup %s -minCov %s\n' %(inBam, bed_dir, outDir, ref, window, cpu, phasingData, mappingSNP, HaploDev, minimumSupport, minimumCoverage))
+    foutname.write('Effective command line:\nTREAT.py reads -i %s -b %s -o %s -r %s -w %s -t %s -p %s -m %s -d %s -minSup %s -minCov %s -trf %s -cache %s -format %s -resume %s -cat %s\n' %(inBam, bed_dir, outDir, ref, window, cpu, phasingData, mappingSNP, HaploDev, minimumSupport, minimumCoverage, trfBackend, cacheDir, outFormat, resume, catalog))
     foutname.close()
     print('** Log file written to %s/treat_run.log' %(outDir))
     return foutname
@@ -154,109 +185,97 @@ def createLogAsm(inBam, bed_dir, outDir, ref, window, cpu, windowAss, ploidy, so
 
 ###### FUNCTIONS FOR READS ANALYSIS
 ### FUNCTIONS TO EXTRACT READS AND SEQUENCES
-# Function to extract reads using multiple processors
-def samtoolsExtract(x, bam, out_dir, temp_name):
-    # combine temporary name with the splitted bed name
-    bed_ext = x.split('_bed.')[-1]
-    temp_name = '%s/%s.%s' %(out_dir, bed_ext, temp_name)
-    # define command for the extraction
-    cmd = 'samtools view -M -b -L %s %s > %s' %(x, bam, temp_name)
-    os.system(cmd)
-    # and index
-    cmd = 'samtools index %s' %(temp_name)
-    os.system(cmd)
-    return temp_name
-
-# Function to split bed file in n bed files
-def splitBed(bed_dir, n, outDir, count_reg):
+# Function to split the regions of the bed file in n chunks
+def splitBed(bed, n, outDir, count_reg):
     # check if it's more convenient to use n_cpu chunks, or divide files up to 10000 lines
     temp_number_lines_per_file = math.ceil(count_reg/n)
     number_lines_per_file = temp_number_lines_per_file if temp_number_lines_per_file < 10000 else 10000
-    cmd = 'split -l %s %s %s/tmp_bed.' %(number_lines_per_file, bed_dir, outDir)
-    os.system(cmd)
-    # then read the obtained temporary beds
-    cmd = 'ls %s/tmp_bed.*' %(outDir)
-    tmp_beds = [x.rstrip() for x in list(os.popen(cmd))]
-    return tmp_beds
+    # sort regions by chromosome and position so that each chunk is fetched sequentially from the bam files
+    all_regions = sorted([[chrom, int(x[0]), int(x[1]), x[2]] for chrom in bed.keys() for x in bed[chrom]], key = lambda x: (x[0], x[1], x[2]))
+    split_regions = [all_regions[i : i + number_lines_per_file] for i in range(0, len(all_regions), number_lines_per_file)]
+    # write the chunks as temporary beds (used for the reference genome and phasing), with the same suffixes as split
+    tmp_beds = []
+    for i in range(len(split_regions)):
+        tmp_bed = '%s/tmp_bed.%s%s' %(outDir, chr(97 + i // 26), chr(97 + i % 26))
+        with open(tmp_bed, 'w') as fout:
+            for chrom, start, end, region_id in split_regions[i]:
+                fout.write('%s\t%s\t%s\n' %(chrom, start, end))
+        tmp_beds.append(tmp_bed)
+    return split_regions, tmp_beds
 
-# Extract reads of interest to temporary BAM files
-def extractRead(bam_dir, bed_dir, out_dir, cpu, count_reg):
-    # first split the bed files in n smaller bed depending on the cpu number
-    split_beds = splitBed(bed_dir, cpu, out_dir, count_reg)
-    # make list of temporary outputs
-    temp_bams = []
-    for bam in bam_dir:
-        # define temporary name
-        temp_name = 'tmp_' + os.path.basename(bam)
-        # define command to extract in MP for each of the splitted bed files
-        pool = multiprocessing.Pool(processes=cpu)
-        extract_fun = partial(samtoolsExtract, bam = bam, out_dir = out_dir, temp_name = temp_name)
-        extract_results = pool.map(extract_fun, split_beds)
-        pool.close()
-        # append temporary names
-        temp_bams.extend(extract_results)
-    return temp_bams, split_beds
+# Define extraction tasks: each bam file is paired with each chunk of regions
+def extractRead(bam_dir, bed, out_dir, cpu, count_reg):
+    # first split the bed in n smaller chunks depending on the cpu number
+    split_regions, split_beds = splitBed(bed, cpu, out_dir, count_reg)
+    # reads will be fetched directly from the indexed bam files, without writing temporary bam files
+    extraction_tasks = [[bam, split_beds[i], split_regions[i]] for bam in bam_dir for i in range(len(split_beds))]
+    return extraction_tasks, split_beds
+
+# Merge overlapping regions of a chunk so that each read is fetched once
+def mergeRegions(regions):
+    merged = []
+    for chrom, start, end, region_id in regions:
+        if len(merged) >0 and merged[-1][0] == chrom and start <= merged[-1][2]:
+            merged[-1][2] = max(merged[-1][2], end)
+        else:
+            merged.append([chrom, start, end])
+    return merged
 
 # Check how many intervals a sequence is included in
-def checkIntervals(bed, chrom, start, end, window):
+def checkIntervals(bed_index, chrom, start, end, window):
     # define output sublist
     sublist = []
-    # iterate over bed file
-    for interval in bed[chrom]:
-        if (int(interval[0]) - window) >= start and (int(interval[1]) + window) <= end:
-            sublist.append(interval[-1])
+    if chrom in bed_index.keys():
+        starts, ends, max_ends, ids = bed_index[chrom]
+        # only regions starting within the read (window included) can be contained in it
+        i_start = bisect.bisect_left(starts, start + window)
+        i_end = bisect.bisect_right(starts, end - window)
+        for i in range(i_start, i_end):
+            if (ends[i] + window) <= end:
+                sublist.append(ids[i])
     return sublist
 
-# Function to parse the CIGAR string
-def findPositionOfInterestWhile(cigar, region_start, region_end, ref_start, ref_end, window):
-    # define start and ending positions of interest, with and without padding
-    positions_of_interest_with_padding = (region_start - window) - ref_start
-    positions_of_interest_with_padding_end = (region_end + window) - ref_start
-    positions_of_interest = region_start - ref_start
-    positions_of_interest_end = region_end - ref_start
+# Project reference offsets (relative to the alignment start) onto the read with one pass over the CIGAR operations
+# For each offset, the position in the read is the number of read bases consumed when the offset+1 reference base is reached (0 if not reached)
+def projectCigarPositions(cigar, offsets):
+    positions = [0] * len(offsets)
+    # resolve the offsets in increasing order, as the reference counter only moves forward
+    order = sorted(range(len(offsets)), key = lambda i: offsets[i])
     # define counter of the reference and the raw sequences
-    counter_ref = 0; counter_raw = 0; counter_raw_padd = 0
-    # define positions of interest
-    pos_interest = 0; pos_interest_padd = 0; pos_interest_end = 0; pos_interest_padd_end = 0
-    # make a list of 1 cigar element per position
-    cigar_per_base = [x for cse in cigar for x in [cse[0]] * cse[1]]
-    # Then loop on this list
-    i = 0; run = True
-    while (run == True) and (i < len(cigar_per_base)):
-        x = cigar_per_base[i]
-        # Parse cigar types: 
-        if (x == 7) or (x == 0):   # 7 --> =
-            counter_raw += 1; counter_ref += 1; counter_raw_padd += 1
-        elif x == 8:   # 8 --> X
-            counter_raw += 1; counter_ref += 1; counter_raw_padd += 1
-        elif x == 1:   # 1 --> I
-            counter_raw +=1; counter_raw_padd += 1
-        elif x == 2:   # 2 --> D
-            counter_ref += 1
-        elif x == 4:  # 4 --> S
-            counter_raw += 1; counter_raw_padd += 1
-        elif x == 5:  # 5 --> H
-            counter_raw += 1; counter_raw_padd += 1
-            print("!!! Alignments are hard clipped. Impossible to take actual sequence!")
-        else:
-            print("!!! Unknown term in cigar string --> %s" % (x))
+    counter_ref = 0; counter_raw = 0; t = 0
+    for op, length in cigar:
+        if t == len(order):
             break
-        # Then check if we reached the start/end position without padding
-        if pos_interest == 0 and counter_ref == (positions_of_interest-1):
-            pos_interest = counter_raw
-        if pos_interest_end == 0 and counter_ref == (positions_of_interest_end-1):
-            pos_interest_end = counter_raw
-        # Then check if we reached the start/end position with padding
-        if pos_interest_padd == 0 and counter_ref == (positions_of_interest_with_padding-1):
-            pos_interest_padd = counter_raw_padd
-        if pos_interest_padd_end == 0 and counter_ref == (positions_of_interest_with_padding_end-1):
-            pos_interest_padd_end = counter_raw_padd
-        # Finally check if we need to loop again
-        if 0 in [pos_interest, pos_interest_end, pos_interest_padd, pos_interest_padd_end]:
-            run = True; i += 1
+        # Parse cigar types:
+        if op in (0, 7, 8):   # 0 --> M, 7 --> =, 8 --> X
+            while t < len(order) and offsets[order[t]] <= counter_ref + length:
+                target = offsets[order[t]]
+                if target > counter_ref:
+                    positions[order[t]] = counter_raw + target - counter_ref
+                t += 1
+            counter_ref += length; counter_raw += length
+        elif op in (1, 4, 5):   # 1 --> I, 4 --> S, 5 --> H
+            if op == 5:
+                print("!!! Alignments are hard clipped. Impossible to take actual sequence!")
+            while t < len(order) and offsets[order[t]] <= counter_ref:
+                if offsets[order[t]] == counter_ref:
+                    positions[order[t]] = counter_raw + 1
+                t += 1
+            counter_raw += length
+        elif op == 2:   # 2 --> D
+            while t < len(order) and offsets[order[t]] <= counter_ref + length:
+                target = offsets[order[t]]
+                # with no read base consumed yet, the offset at the end of the deletion can still be resolved by a following insertion
+                if counter_raw == 0 and target == counter_ref + length:
+                    break
+                if target > counter_ref:
+                    positions[order[t]] = counter_raw
+                t += 1
+            counter_ref += length
         else:
-            run = False
-    return pos_interest, pos_interest_end, pos_interest_padd, pos_interest_padd_end
+            print("!!! Unknown term in cigar string --> %s" % (op))
+            break
+    return positions
 
 # Extract sequence given interval and read looking at CIGAR
 def getSequenceInterval(regions_overlapping, tags, is_secondary, is_supplementary, query_name, query_sequence, window, ref_start, ref_end, cigartuples, sample_name):
@@ -271,159 +290,223 @@ def getSequenceInterval(regions_overlapping, tags, is_secondary, is_supplementar
             rq = "RQ:%s" %(x[1])
         elif x[0] == "mc":
             mc = "MC:%s" %(x[1])
-    # iterate over the regions encompassed by the read
-    for region in regions_overlapping:
+    # exclude secondary and supplementary alignments
+    if not is_secondary and not is_supplementary:
         # extract region stats
-        chrom, interval = region.split(':')
-        start, end = [int(x) for x in interval.split('-')]
-        # exclude secondary and supplementary alignments
-        if not is_secondary and not is_supplementary:
-            # extract read name
-            read_name = query_name
-            # look into CIGAR to find positions
-            pos_interest, pos_interest_end, pos_interest_padd, pos_interest_padd_end = findPositionOfInterestWhile(cigartuples, start, end, ref_start, ref_end, window)
-            # then extract sequence
-            sequence_interest = str(query_sequence)[pos_interest : pos_interest_end]
+        regions_coords = []
+        for region in regions_overlapping:
+            chrom, interval = region.split(':')
+            regions_coords.append([int(x) for x in interval.split('-')])
+        # look into CIGAR to find positions of all regions at once: start/end without padding, then with padding
+        positions_of_interest = []
+        for start, end in regions_coords:
+            positions_of_interest.extend([start - ref_start - 1, end - ref_start - 1, (start - window) - ref_start - 1, (end + window) - ref_start - 1])
+        positions = projectCigarPositions(cigartuples, positions_of_interest)
+        # then extract sequences
+        query_sequence = str(query_sequence)
+        for i in range(len(regions_overlapping)):
+            pos_interest, pos_interest_end, pos_interest_padd, pos_interest_padd_end = positions[i*4 : i*4 + 4]
+            sequence_interest = query_sequence[pos_interest : pos_interest_end]
             sequence_interest_len = len(sequence_interest)
-            sequence_interest_with_padding = str(query_sequence)[pos_interest_padd : pos_interest_padd_end]
+            sequence_interest_with_padding = query_sequence[pos_interest_padd : pos_interest_padd_end]
             sequence_interest_with_padding_len = len(sequence_interest_with_padding)
             # save info
-            info_reads.append([sample_name, region, query_name, np, rq, mc, sequence_interest, sequence_interest_with_padding, sequence_interest_len, sequence_interest_with_padding_len])
-        else:
+            info_reads.append([sample_name, regions_overlapping[i], query_name, np, rq, mc, sequence_interest, sequence_interest_with_padding, sequence_interest_len, sequence_interest_with_padding_len])
+    else:
+        for region in regions_overlapping:
             info_reads.append([sample_name, region, query_name, np, rq, mc, 'NA', 'NA', 'NA', 'NA'])
     return info_reads
 
 # Function to check for soft-clipping events
-def has_soft_clipping_in_interval(cigartuples, ref_start, ref_end, ref_chrom, bed):
-    # Iterate over regions
-    for chromosome, interval_list in bed.items():
-        for start, end, interval_str in interval_list:
-            # Convert start and end positions to integers
-            start_pos = int(start)
-            end_pos = int(end)
-            # Check if the read's reference interval overlaps with the region interval
-            if (chromosome == ref_chrom and ref_start < end_pos and ref_end > start_pos):
-                # Check if the read has soft-clipping at the beginning or end
-                if cigartuples[0][0] == 4 or cigartuples[-1][0] == 4:
-                    soft_clip_start = ref_start if cigartuples[0][0] == 4 else ref_start + cigartuples[0][1]
-                    soft_clip_end = ref_end if cigartuples[-1][0] == 4 else ref_end + cigartuples[-1][1]
-                    if (soft_clip_start < end_pos and soft_clip_end > start_pos) or (soft_clip_start < end_pos and soft_clip_end > end_pos) or (soft_clip_start < start_pos and soft_clip_end > start_pos):
-                        return True, interval_str
+def has_soft_clipping_in_interval(cigartuples, ref_start, ref_end, ref_chrom, bed_index):
+    # Check if the read has soft-clipping at the beginning or end, and if there are regions in the chromosome
+    if (cigartuples[0][0] == 4 or cigartuples[-1][0] == 4) and ref_chrom in bed_index.keys():
+        starts, ends, max_ends, ids = bed_index[ref_chrom]
+        # Regions overlapping the read: they start before the read's end, and end after the read's start
+        i_start = bisect.bisect_right(max_ends, ref_start)
+        i_end = bisect.bisect_left(starts, ref_end)
+        for i in range(i_start, i_end):
+            start_pos, end_pos, interval_str = starts[i], ends[i], ids[i]
+            if end_pos > ref_start:
+                soft_clip_start = ref_start if cigartuples[0][0] == 4 else ref_start + cigartuples[0][1]
+                soft_clip_end = ref_end if cigartuples[-1][0] == 4 else ref_end + cigartuples[-1][1]
+                if (soft_clip_start < end_pos and soft_clip_end > start_pos) or (soft_clip_start < end_pos and soft_clip_end > end_pos) or (soft_clip_start < start_pos and soft_clip_end > start_pos):
+                    return True, interval_str
     return False, None
 
 # Function to execute the sequence extraction in multiple processors
-def distributeExtraction(x, bed, window):
+def distributeExtraction(x, window):
+    # the task is a bam file with a chunk of regions, the index of the regions is preloaded in the worker
+    bam, tmp_bed, regions = x
+    bed_index = WORKER_DATA['bed_index']
     # container for results
     tmp_results = []
     clipping_events = []
     # get sample name
-    sample_name = re.sub(r'^a[a-z]\.tmp_', '', os.path.basename(x)).replace('.bam', '')
-    # loop over reads with pysam
-    with pysam.AlignmentFile(x, 'rb', check_sq=False) as bamfile:
-        for read in bamfile:
-            # sometimes the reference end is missing, control for that here
-            try:
-                # extract read information
-                ref_chrom, ref_start, ref_end, query_name, query_sequence, cigartuples, tags, is_secondary, is_supplementary, cigarstring = read.reference_name, int(read.reference_start), int(read.reference_end), read.query_name, read.query_sequence, read.cigartuples, read.tags, read.is_supplementary, read.is_secondary, read.cigarstring
-                if query_name == 'm64043_201203_004011/38733353/ccs':
-                    break
-                # check how many regions we overlap with this read
-                regions_overlapping = checkIntervals(bed, ref_chrom, ref_start, ref_end, window)
-                # then get the sequence of the read in the interval
-                regions_overlapping_info = getSequenceInterval(regions_overlapping, tags, is_secondary, is_supplementary, query_name, query_sequence, window, ref_start, ref_end, cigartuples, sample_name)       
-                # if there are no overlaps, it can be that there are clipping events at the sides of the sequence
-                if len(regions_overlapping_info) == 0:
-                    temp_clipping = has_soft_clipping_in_interval(cigartuples, ref_start, ref_end, ref_chrom, bed)
-                    if temp_clipping[0] == True:
-                        clipping_events.append([temp_clipping[1], x.split('.tmp_')[-1].replace('.bam', ''), query_name])
-                # add to results
-                for lst in regions_overlapping_info:
-                    tmp_results.append(lst)
-            except:
-                pass
-    # name of the fasta output
-    fasta_name = x.replace('.bam', '.fa')
-    # finally write fasta files
-    writeFastaTRF(tmp_results, fasta_name)
-    return tmp_results, fasta_name, clipping_events
+    sample_name = os.path.basename(bam).replace('.bam', '')
+    # reads already processed, with their end position: a read can span more than one block of regions
+    seen_reads = {}
+    # fetch reads with pysam from the indexed bam
+    with pysam.AlignmentFile(bam, 'rb', check_sq=False) as bamfile:
+        for chrom, block_start, block_end in mergeRegions(regions):
+            if chrom not in bamfile.references:
+                continue
+            # forget reads that cannot overlap this block
+            seen_reads = {k: v for k, v in seen_reads.items() if k[0] == chrom and v > block_start}
+            for read in bamfile.fetch(chrom, block_start, block_end):
+                read_key = (chrom, read.query_name, read.flag, read.reference_start)
+                if read_key in seen_reads:
+                    continue
+                # sometimes the reference end is missing, control for that here
+                try:
+                    # extract read information
+                    ref_chrom, ref_start, ref_end, query_name, query_sequence, cigartuples, tags, is_secondary, is_supplementary, cigarstring = read.reference_name, int(read.reference_start), int(read.reference_end), read.query_name, read.query_sequence, read.cigartuples, read.tags, read.is_supplementary, read.is_secondary, read.cigarstring
+                    seen_reads[read_key] = ref_end
+                    # check how many regions we overlap with this read
+                    regions_overlapping = checkIntervals(bed_index, ref_chrom, ref_start, ref_end, window)
+                    # then get the sequence of the read in the interval
+                    regions_overlapping_info = getSequenceInterval(regions_overlapping, tags, is_secondary, is_supplementary, query_name, query_sequence, window, ref_start, ref_end, cigartuples, sample_name)
+                    # if there are no overlaps, it can be that there are clipping events at the sides of the sequence
+                    if len(regions_overlapping_info) == 0:
+                        temp_clipping = has_soft_clipping_in_interval(cigartuples, ref_start, ref_end, ref_chrom, bed_index)
+                        if temp_clipping[0] == True:
+                            clipping_events.append([temp_clipping[1], sample_name, query_name])
+                    # add to results
+                    for lst in regions_overlapping_info:
+                        tmp_results.append(lst)
+                except:
+                    pass
+    # label of the chunk: chunk suffix and sample name
+    chunk_name = '%s/%s.tmp_%s' %(os.path.dirname(tmp_bed), tmp_bed.split('.')[-1], os.path.basename(bam).replace('.bam', '.fa'))
+    return tmp_results, chunk_name, clipping_events
 
-# Measure the distance in the reference genome
-def measureDistance_reference(bed_file, window, ref, output_directory):    
-    # sequence with paddings
-    awk_command = """awk '{print $1":"$2-%s"-"$3+%s}' %s > %s_reformatted.txt""" %(window, window, bed_file, bed_file)
-    os.system(awk_command)
-    # if reference is not GRCh38, then we need to exclude the 'chr' from the bed file otherwise it will not work
-    if 'GRCh37' in ref or 'hg19' in ref or 'hg37' in ref:
-        sed_cmd = "sed -i 's/chr//g' %s_reformatted.txt" %(bed_file)
-        os.system(sed_cmd)        
-    sequence_in_reference_with_padding = [x.rstrip() for x in list(os.popen('samtools faidx -r %s_reformatted.txt %s' %(bed_file, ref)))]        # sequence without padding
+# Measure the distance in the reference genome: sequences with paddings are fetched from the reference opened once per worker
+def measureDistance_reference(bed_file, window, ref, output_directory):
+    # regions of the chunk
+    with open(bed_file) as finp:
+        regions = [(x[0], int(x[1]), int(x[2])) for x in [line.rstrip().split() for line in finp] if len(x) >= 3]
     # then store these results
     distances = []
-    i = 0
-    total_sequence = ''
-    while i<len(sequence_in_reference_with_padding):
-        x = sequence_in_reference_with_padding[i]
-        if x.startswith('>'):
-            if total_sequence != '':
-                sequence_with_paddings, sequence = total_sequence, total_sequence[window:-window]
-                total_sequence = ''
-                distances.append(['reference', region, 'reference', 'NA', 'NA', 'NA', sequence, sequence_with_paddings, len(sequence), len(sequence_with_paddings)])
-            chrom = x.replace('>', '').split(':')[0]
-            start = int(x.replace('>', '').split(':')[1].split('-')[0])
-            end = int(x.replace('>', '').split(':')[1].split('-')[1])
-            region = chrom + ':' + str(start + window) + '-' + str(end - window)
-            i += 1
-        else:
-            total_sequence = total_sequence + x
-            i += 1
-    # add last element
-    sequence_with_paddings, sequence = total_sequence, total_sequence[window:-window]
-    distances.append(['reference', region, 'reference', 'NA', 'NA', 'NA', sequence, sequence_with_paddings, len(sequence), len(sequence_with_paddings)])
-    # then we write the fasta
+    for (chrom, start, end), sequence_with_paddings in zip(regions, referenceSequences(regions, window, ref)):
+        if sequence_with_paddings is None:
+            continue
+        sequence = sequence_with_paddings[window:-window]
+        region = chrom + ':' + str(start) + '-' + str(end)
+        distances.append(['reference', region, 'reference', 'NA', 'NA', 'NA', sequence, sequence_with_paddings, len(sequence), len(sequence_with_paddings)])
     outfasta = '%s/reference_%s.fa' %(output_directory, bed_file.split('.')[-1])
-    writeFastaTRF(distances, outfasta)
     return distances, outfasta
 
+# Names of the regions in the reference genome: chromosome names with 'chr' as in the bed dictionary
+def referenceRegions(bed):
+    return ['%s:%s-%s' %(chrom, int(x[0]), int(x[1])) for chrom in bed.keys() for x in bed[chrom]]
+
+# Function for the reference catalog: the reference leg of the read-based analysis (sequences, motif finding and reference motifs) on all the regions
+def referenceCatalog(bed, count_reg, ref, window, trf_backend, cache_dir, cpu, out_dir):
+    split_regions, temp_beds = splitBed(bed, cpu, out_dir, count_reg)
+    extract_fun = partial(measureDistance_reference, window = window, ref = ref, output_directory = out_dir)
+    extract_results_ref = getPool(cpu).map(extract_fun, temp_beds)
+    all_fasta_ref = [outer_list[1] for outer_list in extract_results_ref]
+    trf_results = annotateReads(extract_results_ref, trf_backend, cache_dir, cpu, out_dir)
+    data = adjustMotifs(combineTRF_res(trf_results, extract_results_ref, all_fasta_ref))
+    return referenceMotifTable(data, cpu)
+
+# Function to give the sizes of the reference catalog the type they have in the analysis: sizes are floats if any read or reference sequence has a missing size
+def catalogSizes(reference_motif_dic, sizes):
+    if not pd.api.types.is_float_dtype(sizes):
+        return reference_motif_dic
+    return {k: [v[0], float(v[1]) if isinstance(v[1], int) else v[1], v[2]] for k, v in reference_motif_dic.items()}
+
 ### FUNCTIONS FOR TRF
-# Function to write fasta files for TRF
-def writeFastaTRF(all_seqs, fasta_name):
-    # define container for fasta outputs
-    fasta_outputs = []
-    # open file and write things
-    with open(fasta_name, 'w') as outFile:
-        for region in all_seqs:
-            outFile.write('>%s;%s;%s\n%s\n' %(region[1], region[0], region[2], region[-4]))
-    outFile.close()
+# Parameters of motif finding for each backend: they are part of the key of the annotation cache, with the version of pytrf as versions find different repeats
+TRF_PARAMS = {'pytrf' : 'pytrf %s;min_motif_size=1;max_motif_size=100;min_score=50' %(pytrf.__version__), 'trf' : 'trf;2 7 7 80 10 50 200 -ngs'}
 
-# Run TRF given a sequence -- a problem may be that we pass the distances object here -- this is only done for a merging operation, maybe we can do the perging operation outside the multiprocessing
-def run_trf(index, all_fasta, type):
-    # then run tandem repeat finder
-    cmd = 'trf %s 2 7 7 80 10 50 200 -ngs -h' %(all_fasta[index])
+# Run pytrf on a sequence, and format the results as the -ngs output of trf
+def pytrfAnnotation(seq):
+    seq = seq.upper()
+    trf_matches = []
+    for atr in findRepeats('sequence', seq, min_motif_size = 1, max_motif_size = 100):
+        # score with the same weights used for trf (match 2, mismatch 7, indel 7), and keep the same minimum score
+        score = 2 * atr['matches'] - 7 * (atr['substitutions'] + atr['insertions'] + atr['deletions'])
+        if score < 50:
+            continue
+        repeat_seq = seq[(atr['start'] - 1) : atr['end']]
+        composition = [repeat_seq.count(n) / len(repeat_seq) for n in 'ACGT']
+        entropy = -sum([x * math.log2(x) for x in composition if x > 0])
+        perc_indel = 100 * (atr['insertions'] + atr['deletions']) / atr['length']
+        padding_before = seq[max(0, atr['start'] - 51) : (atr['start'] - 1)]
+        padding_after = seq[atr['end'] : (atr['end'] + 50)]
+        tmp_trf_match = [atr['start'], atr['end'], atr['type'], round(float(atr['repeat']), 1), atr['type'], round(atr['identity']), round(perc_indel), score] + [round(x * 100) for x in composition] + [round(entropy, 2), atr['motif'], repeat_seq, padding_before if padding_before != '' else '.', padding_after if padding_after != '' else '.']
+        # values as strings, like the parsed output of trf
+        trf_matches.append([str(x) for x in tmp_trf_match])
+    return trf_matches
+
+# Run trf on a list of sequences, and return the -ngs output of trf for each sequence
+def trfAnnotation(seqs, fasta_name):
+    with open(fasta_name, 'w') as outFile:
+        for i in range(len(seqs)):
+            outFile.write('>%s\n%s\n' %(i, seqs[i]))
+    cmd = 'trf %s 2 7 7 80 10 50 200 -ngs -h' %(fasta_name)
     trf = [x for x in os.popen(cmd).read().split('\n') if x != '']
-    # loop on trf results and save them into a list of lists
-    x = 0; trf_matches = []
-    sample_name = re.sub(r'^a[a-z]\.tmp_', '', os.path.basename(all_fasta[index])).replace('.fa', '')
-    while x < len(trf):
-        # check if the line is the header of an entry
-        if trf[x].startswith('@'):
-            # if so, save the corresponding information depending on the type of input
-            if type != 'otter' or sample_name == 'reference':
-                region, sample, read_id = trf[x].split(';')[0:3]
-            else:
-                read_id, region, seq_size_with_padding, seq_size = trf[x].split(';')
-                read_id = '@>' + read_id
-            x += 1
-        while x < len(trf) and not trf[x].startswith('@'):
-            tmp_trf_match = [read_id + '_' + region.replace('@', ''), 'NA'] + trf[x].split()
-            trf_matches.append(tmp_trf_match)
-            x += 1
-    # finally create pandas df and assign column names
-    if len(trf_matches) == 0:
-        trf_matches = [['NA' for i in range(19)]] 
+    # the header of each entry is the index of the sequence
+    trf_matches = [[] for x in seqs]; index = 0
+    for line in trf:
+        if line.startswith('@'):
+            index = int(line.replace('@', ''))
+        else:
+            trf_matches[index].append(line.split())
     return trf_matches
 
-# Combine TRF results of the different chunks
-def combineTRF_res(trf_matches, distances, all_fasta):
+# Annotate a chunk of sequences with the selected backend
+def annotateSequences(x, backend, out_dir):
+    index, seqs = x
+    # sequences of secondary/supplementary alignments and empty sequences have no annotation
+    valid = [i for i in range(len(seqs)) if seqs[i] not in ['', 'NA']]
+    if backend == 'trf':
+        valid_annotations = trfAnnotation([seqs[i] for i in valid], '%s/trf_sequences_%s.fa' %(out_dir, index)) if len(valid) >0 else []
+    else:
+        valid_annotations = [pytrfAnnotation(seqs[i]) for i in valid]
+    annotations = [[] for x in seqs]
+    for i, annot in zip(valid, valid_annotations):
+        annotations[i] = annot
+    return annotations
+
+# Run motif finding on the extracted sequences: each distinct sequence is annotated once, and sequences in the annotation cache are skipped
+def annotateReads(extract_results, trf_backend, cache_dir, cpu, out_dir):
+    loadAnnotationCache(cache_dir)
+    # distinct sequences and their key in the cache
+    seq_keys = {}
+    for outer_list in extract_results:
+        for region in outer_list[0]:
+            seq = str(region[-4])
+            if seq not in seq_keys:
+                seq_keys[seq] = annotationKey(TRF_PARAMS[trf_backend], seq)
+    new_seqs = [seq for seq in seq_keys if seq_keys[seq] not in ANNOTATION_CACHE]
+    print('** %s distinct sequences, %s to annotate' %(len(seq_keys), len(new_seqs)))
+    # annotate the new sequences in multiprocessing
+    new_entries = {}
+    if len(new_seqs) >0:
+        chunk_size = math.ceil(len(new_seqs) / (cpu * 4))
+        seq_chunks = [[i, new_seqs[j : j + chunk_size]] for i, j in enumerate(range(0, len(new_seqs), chunk_size))]
+        trf_fun = partial(annotateSequences, backend = trf_backend, out_dir = out_dir)
+        annotations = getPool(cpu).map(trf_fun, seq_chunks)
+        for chunk, annot in zip(seq_chunks, annotations):
+            for seq, trf_matches in zip(chunk[1], annot):
+                new_entries[seq_keys[seq]] = trf_matches
+    saveAnnotationCache(cache_dir, new_entries)
+    # then attach the annotations to the reads of each chunk, as in the -ngs output of trf
+    trf_results = []
+    for outer_list in extract_results:
+        trf_matches = []
+        for region in outer_list[0]:
+            for trf_match in ANNOTATION_CACHE[seq_keys[str(region[-4])]]:
+                trf_matches.append([region[2] + '_' + region[1], 'NA'] + trf_match)
+        if len(trf_matches) == 0:
+            trf_matches = [['NA' for i in range(19)]]
+        trf_results.append(trf_matches)
+    return trf_results
+
+# Combine TRF results of the different chunks: if an index of haplotags is given, the haplotag of each read is added
+def combineTRF_res(trf_matches, distances, all_fasta, haplotag_index = None):
     complete_df = pd.DataFrame()
     for i in range(len(all_fasta)):
         df = pd.DataFrame(trf_matches[i])
@@ -445,6 +528,8 @@ def combineTRF_res(trf_matches, distances, all_fasta):
             distances_sample_df['PASSES'] = 'NA'; distances_sample_df['READ_QUALITY'] = 'NA'; distances_sample_df['MAPPING_CONSENSUS'] = 'NA'; distances_sample_df['WINDOW'] = 50;
         # add id
         df_seqs['ID'] = df_seqs['READ_NAME'].str.cat(df_seqs['REGION'], sep='_')
+        if haplotag_index is not None:
+            df_seqs = addHaplotags(df_seqs, haplotag_index)
         # merge trf dataframe and reads dataframes
         temp_combined = pd.merge(df_seqs, df, left_on = 'ID', right_on = 'ID', how = 'outer')
         complete_df = pd.concat([complete_df, temp_combined], ignore_index=True)
@@ -455,7 +540,7 @@ def combineTRF_res(trf_matches, distances, all_fasta):
 def removeTemp(outDir):
     # list all files
     all_files = [x.rstrip() for x in list(os.popen('ls %s' %(outDir)))]
-    all_files = ['%s/%s' %(outDir, x) for x in all_files if 'gz' not in x]
+    all_files = ['%s/%s' %(outDir, x) for x in all_files if 'gz' not in x and not x.endswith('.parquet')]
     all_files = [x for x in all_files if 'log' not in x]
     # and remove them
     for x in all_files:
@@ -484,220 +569,240 @@ def manageIDs_SNPs_Sequencing(mappingSNP, bam, outDir):
             fout.write('%s\n' %(x))
     return random_num
 
-# Function to do phasing
-def phase_reads(i, temp_bams, temp_beds, phasingData, mappingSNP, outDir, snpWindow):
+# Function to do phasing: SNPs around all the regions are phased once per sample, and haplotags are read from the list of haplotagged reads and indexed
+def phase_reads(bam, bed_file, phasingData, mappingSNP, outDir, snpWindow, ref):
+    sample_name = os.path.basename(bam).replace('.bam', '')
     # manage IDs
-    random_num = manageIDs_SNPs_Sequencing(mappingSNP, [temp_bams[i]], outDir)
-    # there are n bed files and n*n_samples bam files. make sure the index of the bed file is kept
-    i_bed = i if i < len(temp_beds) else i - len(temp_beds)
+    random_num = manageIDs_SNPs_Sequencing(mappingSNP, [os.path.basename(bam)], outDir)
     # write vcf for each sample keeping the snps of interest and samples of interest -- assumes plink2 files
-    cmd = 'plink2 --pfile %s --extract bed1 %s --bed-border-bp %s --keep %s/phasing/%s.txt --recode vcf --out %s/phasing/%s >/dev/null 2>&1' %(phasingData.replace('.pvar', ''), temp_beds[i_bed], snpWindow, outDir, random_num, outDir, random_num)
+    cmd = 'plink2 --pfile %s --extract bed1 %s --bed-border-bp %s --keep %s/phasing/%s.txt --recode vcf --out %s/phasing/%s >/dev/null 2>&1' %(phasingData.replace('.pvar', ''), bed_file, snpWindow, outDir, random_num, outDir, random_num)
     os.system(cmd)
+    haplotags = []
     # check if file was created, otherwise skip
     if os.path.isfile('%s/phasing/%s.vcf' %(outDir, random_num)):
-        # sort and index bam file
-        os.system('samtools sort %s > %s' %(temp_bams[i], temp_bams[i] + '_sorted'))
-        os.system('mv %s %s' %(temp_bams[i] + '_sorted', temp_bams[i]))
-        os.system('samtools index %s' %(temp_bams[i]))
-        # add chr notation for chromosome to vcf
-        #os.system('bcftools annotate --rename-chrs %s %s.vcf | bgzip > %s.vcf.gz' %('/'.join(abspath(getsourcefile(lambda:0)).split('/')[:-1]) + '/test_data/chr_name_conv.txt', vcf_out, vcf_out))
-        os.system('bcftools annotate --rename-chrs %s %s/phasing/%s.vcf | bgzip > %s/phasing/%s.vcf.gz' %('/project/holstegelab/Software/nicco/bin/treat/test_data/chr_name_conv.txt', outDir, random_num, outDir, random_num))
-        # index vcf
-        os.system('tabix %s/phasing/%s.vcf.gz' %(outDir, random_num))
-        # create a phased vcf with whatshap
-        whathap_out = os.path.basename(temp_bams[i]).replace('.bam', '_phased.vcf.gz')
-        haplotag_out = os.path.basename(temp_bams[i]).replace('.bam', '_haplotag.bam')
-        # whatshap phase
-        os.system('whatshap phase -o %s/phasing/%s --reference=%s %s/phasing/%s.vcf.gz %s --ignore-read-groups --internal-downsampling 5 >/dev/null 2>&1' %(outDir, whathap_out, ref, outDir, random_num, temp_bams[i]))
-        # index the phased vcf
-        os.system('tabix %s/phasing/%s' %(outDir, whathap_out))
-        # then tag the haplotypes in the bam file
-        os.system('whatshap haplotag -o %s/phasing/%s --reference=%s %s/phasing/%s %s --ignore-read-groups --skip-missing-contigs >/dev/null 2>&1' %(outDir, haplotag_out, ref, outDir, whathap_out, temp_bams[i]))
-        # also index so that everything is ok
-        os.system('samtools index %s/phasing/%s' %(outDir, haplotag_out))
-        # read haplotags
-        haplotags = []
-        inBam = pysam.AlignmentFile('%s/phasing/%s' %(outDir, haplotag_out), 'rb', check_sq=False)
-        for read in inBam:
-            info = read.tags
-            haplo = 'NA'
-            for x in info:
-                if x[0] == 'HP':
-                    haplotags.append([read.query_name, x[1]])
-    else:
-        haplotags = []
+        # rename the chromosomes of the vcf as in the bam file
+        bam_file = pysam.AlignmentFile(bam, 'rb')
+        aliases = contigAliases(bam_file.references)
+        bam_file.close()
+        with open('%s/phasing/%s.chr_names.txt' %(outDir, random_num), 'w') as fout:
+            for contig in readVCFheader('%s/phasing/%s.vcf' %(outDir, random_num))['contigs']:
+                fout.write('%s %s\n' %(contig, aliases.get(contig, contig)))
+        os.system('bcftools annotate --rename-chrs %s/phasing/%s.chr_names.txt %s/phasing/%s.vcf -Oz -o %s/phasing/%s.vcf.gz' %(outDir, random_num, outDir, random_num, outDir, random_num))
+        pysam.tabix_index('%s/phasing/%s.vcf.gz' %(outDir, random_num), preset = 'vcf', force = True)
+        # create a phased vcf with whatshap: the input bam is sorted and indexed already
+        whathap_out = '%s/phasing/%s.%s_phased.vcf.gz' %(outDir, random_num, sample_name)
+        os.system('whatshap phase -o %s --reference=%s %s/phasing/%s.vcf.gz %s --ignore-read-groups --internal-downsampling 5 >/dev/null 2>&1' %(whathap_out, ref, outDir, random_num, bam))
+        pysam.tabix_index(whathap_out, preset = 'vcf', force = True)
+        # then tag the haplotypes of the reads, only in the span of the regions on each chromosome: the list of haplotagged reads is kept, not the bam
+        chr_spans = {}
+        with open(bed_file) as finp:
+            for line in finp:
+                chrom, start, end = line.rstrip().split()[0:3]
+                start, end = int(start), int(end)
+                chr_spans[chrom] = [min(start, chr_spans[chrom][0]), max(end, chr_spans[chrom][1])] if chrom in chr_spans.keys() else [start, end]
+        regions_cmd = ' '.join(['--regions %s:%s-%s' %(chrom, max(1, v[0] - snpWindow), v[1] + snpWindow) for chrom, v in chr_spans.items()])
+        haplotag_list = '%s/phasing/%s.%s_haplotags.tsv' %(outDir, random_num, sample_name)
+        os.system('whatshap haplotag -o /dev/null --output-haplotag-list %s --reference=%s %s %s %s --ignore-read-groups --skip-missing-contigs >/dev/null 2>&1' %(haplotag_list, ref, whathap_out, bam, regions_cmd))
+        # read haplotags: read name, haplotype (H1, H2 or none), phase set and chromosome
+        if os.path.isfile(haplotag_list):
+            with open(haplotag_list) as finp:
+                for line in finp:
+                    if line.startswith('#'):
+                        continue
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) >1 and fields[1] in ['H1', 'H2']:
+                        haplotags.append([fields[0], int(fields[1][1])])
     # clean environment
     os.system('rm %s/phasing/%s.*' %(outDir, random_num))
-    return haplotags
+    return sample_name, haplotagIndex(haplotags)
 
-# Function to combine data with multiprocessing
-def multiCombine(s, outDir, vcf_list, bam_list):
-    # get samples to concatenate
-    vcf_to_concatenate = [x for x in vcf_list if '_' + s + '_' in x]
-    bam_to_concatenate = [x for x in bam_list if '_' + s + '_' in x]
-    # combine vcf
-    cmd = 'bcftools concat %s | bgzip > %s/phasing/%s.vcf.gz' %(' '.join(vcf_to_concatenate), outDir, s)
-    os.system(cmd)
-    # combine bam
-    cmd = 'samtools merge %s/phasing/%s.bam %s' %(outDir, s, ' '.join(bam_list))
-    os.system(cmd)
-    # remove temporary files
-    for f in vcf_to_concatenate + bam_to_concatenate:
-        os.system('rm %s*' %(f))
-    # return the file names
-    fname_vcf = '%s/phasing/%s.vcf.gz' %(outDir, s)
-    fname_bam = '%s/phasing/%s.bam' %(outDir, s)
-    return [fname_vcf, fname_bam]
+# Index of the haplotags of a sample: hashes of the read names in sorted order, and the haplotag of each read
+def haplotagIndex(haplotags):
+    if len(haplotags) == 0:
+        return np.array([], dtype = np.uint64), np.array([], dtype = np.uint8)
+    hashes = pd.util.hash_array(np.array([x[0] for x in haplotags], dtype = object))
+    tags = np.array([x[1] for x in haplotags], dtype = np.uint8)
+    order = np.argsort(hashes, kind = 'mergesort')
+    return hashes[order], tags[order]
+
+# Haplotags of reads of a sample from the index of the sample: reads not in the index are not phased
+def lookupHaplotags(read_names, index):
+    hashes, tags = index
+    haplotags = np.full(len(read_names), np.nan)
+    if len(hashes) >0 and len(read_names) >0:
+        query = pd.util.hash_array(np.asarray(read_names, dtype = object))
+        pos = np.minimum(np.searchsorted(hashes, query), len(hashes) - 1)
+        found = hashes[pos] == query
+        haplotags[found] = tags[pos[found]]
+    return haplotags
 
-# Function to combine VCF and BAM files after phasing
-def combine_data_afterPhasing(outDir):
-    # list VCF and BAM files
-    vcf_list = [x.rstrip() for x in os.popen('ls %s/phasing/*vcf.gz' %(outDir))]
-    bam_list = [x.rstrip() for x in os.popen('ls %s/phasing/*haplotag.bam' %(outDir))]
-    # identify samples
-    sample_list = list(set([os.path.basename(x).split('.tmp_')[-1].replace('_phased.vcf.gz', '') for x in vcf_list]))
-    # iterate through samples
-    pool = multiprocessing.Pool(processes=cpu)
-    combine_fun = partial(multiCombine, outDir = outDir, vcf_list = vcf_list, bam_list = bam_list)
-    combine_res = pool.map(combine_fun, sample_list)
-    pool.close()
-    return combine_res
+# Add the haplotags to the reads: each read is looked up in the index of its own sample
+def addHaplotags(df, haplotag_index):
+    df['HAPLOTAG'] = np.nan
+    for sample in df['SAMPLE_NAME'].unique():
+        if sample in haplotag_index.keys():
+            rows = (df['SAMPLE_NAME'] == sample).values
+            df.loc[rows, 'HAPLOTAG'] = lookupHaplotags(df.loc[rows, 'READ_NAME'].values, haplotag_index[sample])
+    return df
 
 # FUNCTIONS FOR HAPLOTYPING
 # main function that guides haplotyping
-def haplotyping_steps(data, n_cpu, thr_mad, min_support, type, outDir, all_clipping_df, inBam):
-    # STEP 1 IS TO ADJUST THE DATA BEFORE WE START
+def haplotyping_steps(data, n_cpu, thr_mad, min_support, type, outDir, all_clipping_df, inBam, raw_table = 'None', raw_format = 'txt', reference_motif_dic = None):
+    # STEP 1 AND 2 ARE TO ADJUST THE DATA AND THE MOTIFS BEFORE WE START
+    data = adjustMotifs(data)
+    # STEP 3 IS TO ADJUST THE MOTIFS IN THE REFERENCE DATA, UNLESS THEY COME FROM THE REFERENCE CATALOG
+    if reference_motif_dic is None:
+        print('** Reference motifs                                     ')
+        reference_motif_dic = referenceMotifTable(data, n_cpu)
+    else:
+        print('** Reference motifs from the reference catalog          ')
+        reference_motif_dic = catalogSizes(reference_motif_dic, data['LEN_SEQUENCE_FOR_TRF'])
+    # STEP 4 IS TO ADD A UNIQUE ID AND SPLIT DUPLICATES BEFORE HAPLOTYPING
+    data = data[data['SAMPLE_NAME'] != 'reference']
+    data_nodup = data.drop_duplicates(subset = 'UNIQUE_NAME')
+    dup_df = data[data.duplicated(subset = 'UNIQUE_NAME', keep=False)]
+    all_samples = data_nodup['SAMPLE_NAME'].dropna().unique()
+    all_regions = list(data_nodup['REGION'].dropna().unique())
+    # STEP 5 IS TO SORT THE READS BY SAMPLE AND REGION, AND WRITE THEM TO COLUMN STORES: WORKERS ONLY RECEIVE THE RANGE OF ROWS OF EACH REGION
+    data_nodup = data_nodup.sort_values(['SAMPLE_NAME', 'REGION'], kind = 'mergesort').reset_index(drop = True)
+    dup_df = dup_df.sort_values(['SAMPLE_NAME', 'REGION'], kind = 'mergesort').reset_index(drop = True)
+    # a new directory for each run of the function, as workers keep the stores they opened
+    store_dir = tempfile.mkdtemp(prefix = 'haplotyping_store_', dir = outDir)
+    store_nodup = writeColumnStore(data_nodup, '%s/reads' %(store_dir))
+    store_dups = writeColumnStore(dup_df, '%s/duplicates' %(store_dir))
+    ranges_nodup = {k: (v[0], v[-1] + 1) for k, v in data_nodup.groupby(['SAMPLE_NAME', 'REGION']).indices.items()}
+    ranges_dups = {k: (v[0], v[-1] + 1) for k, v in dup_df.groupby(['SAMPLE_NAME', 'REGION']).indices.items()}
+    # STEP 6 IS HAPLOTYPING BASED ON THE SIZES
+    print('** Genotyping                                         ')
+    intervals = prepareIntervals(all_regions)
+    # data shared by all the tasks is written once, and read once per worker
+    shared_data = writeSharedObject([reference_motif_dic, intervals], '%s/shared.pkl' %(store_dir))
+    # number of clipped reads of each sample and region
+    n_clipped = all_clipping_df.groupby(['SAMPLE', 'REGION']).size().to_dict()
+    # the unit of work is a sample and a region: tasks of all samples are scheduled together
+    tasks = []
+    for s in all_samples:
+        for r in sorted([k[1] for k in ranges_nodup.keys() if k[0] == s]):
+            tasks.append([s, ranges_nodup[(s, r)], ranges_dups[(s, r)] if (s, r) in ranges_dups.keys() else (0, 0), n_clipped.get((s, r), 0), r])
+    haplo_fun = partial(haplotypingBatch, thr_mad = thr_mad, type = type, min_support = min_support, shared_data = shared_data, store_nodup = store_nodup, store_dups = store_dups)
+    # STEP 7 IS TO WRITE THE OUTPUTS AS THE TASKS COMPLETE: VCF RECORDS IN COORDINATE ORDER, AND RAW SEQUENCES IF REQUESTED
+    print('** Producing outputs: VCF file and table with sequences                        ')
+    vcf_file = '%s/sample.vcf.gz' %(outDir)
+    fout = openVCF(vcf_file, VCF_HEADER, all_samples, inBam[0])
+    raw_writer = openTable(raw_table, raw_format) if (type == 'reads' and raw_table != 'None') else None
+    # a region is written once all its samples are done, and after the regions before it: batches follow the coordinate order of the regions
+    sample_index = {all_samples[i] : i for i in range(len(all_samples))}
+    region_order = sorted(set([k[1] for k in ranges_nodup.keys()]), key = regionKey)
+    n_expected = {}
+    for s, r in ranges_nodup.keys():
+        n_expected[r] = n_expected.get(r, 0) + 1
+    pending = {}; next_region = 0
+    for batch_results in getPool(n_cpu).imap_unordered(haplo_fun, batchTasks(tasks, n_cpu)):
+        for i, res in batch_results:
+            s, r = tasks[i][0], tasks[i][4]
+            pending.setdefault(r, {})[sample_index[s]] = res[0]
+            if raw_writer is not None and isinstance(res[-1], pd.DataFrame):
+                appendTable(raw_writer, res[-1])
+        records, next_region = completeRegions(pending, region_order, n_expected, next_region, len(all_samples))
+        writeVCFrecords(fout, records)
+    removeColumnStore(store_dir)
+    closeVCF(fout, vcf_file)
+    raw_file = closeTable(raw_writer) if raw_writer is not None else 'None'
+    print('Haplotyping analysis done!')
+    return vcf_file, raw_file
+
+# Function to adjust the data before haplotyping: numeric columns, uniform representation of the motifs and unique identifier of the reads
+def adjustMotifs(data):
     data['START_TRF'] = pd.to_numeric(data['START_TRF'], errors='coerce')
     data['END_TRF'] = pd.to_numeric(data['END_TRF'], errors='coerce')
     data['LEN_SEQUENCE_FOR_TRF'] = pd.to_numeric(data['LEN_SEQUENCE_FOR_TRF'], errors='coerce')
     data['TRF_SCORE'] = pd.to_numeric(data['TRF_SCORE'], errors='coerce')
-    # STEP 2 IS TO ADJUST THE MOTIFS IN THE DATA
     print('** Adjust motifs')
     all_motifs = data['TRF_MOTIF'].dropna().unique()
     main_motifs = [permutMotif(motif) for motif in all_motifs]
     motifs_df = pd.DataFrame({'motif' : all_motifs, 'UNIFORM_MOTIF' : main_motifs})
     data = pd.merge(data, motifs_df, left_on='TRF_MOTIF', right_on='motif', how='left')
-    data['UNIQUE_NAME'] = data.apply(lambda row: str(row['READ_NAME']) + '___' + str(row['SAMPLE_NAME']) + '___' + str(row['REGION']) + '___' + str(row['LEN_SEQUENCE_FOR_TRF']), axis = 1)
-    # STEP 3 IS TO ADJUST THE MOTIFS IN THE REFERENCE DATA
-    print('** Reference motifs                                     ')
+    data['UNIQUE_NAME'] = uniqueReadKey(data)
+    return data
+
+# Function to find the consensus motif, size and copies of each region in the reference data
+def referenceMotifTable(data, n_cpu):
     ref = data[data['SAMPLE_NAME'] == 'reference'].copy()
     all_regions = list(ref['REGION'].dropna().unique())
     intervals = prepareIntervals(all_regions)
     ref['HAPLOTAG'] = 1; ref['POLISHED_HAPLO'] = ref['LEN_SEQUENCE_FOR_TRF']
-    all_regions = list(ref['REGION'].dropna().unique())
-    pool = multiprocessing.Pool(processes=n_cpu)
     motif_fun = partial(referenceMotifs, ref = ref, intervals = intervals)
-    motif_res = pool.map(motif_fun, all_regions)
-    pool.close()
+    motif_res = getPool(n_cpu).map(motif_fun, all_regions)
     # combine dictionaries
     reference_motif_dic = {k: v for d in motif_res for k, v in d.items()}
-    # STEP 4 IS TO ADD A UNIQUE ID AND SPLIT DUPLICATES BEFORE HAPLOTYPING
-    data = data[data['SAMPLE_NAME'] != 'reference']
-    data_nodup = data.drop_duplicates(subset = 'UNIQUE_NAME')
-    dup_df = data[data.duplicated(subset = 'UNIQUE_NAME', keep=False)]
-    # STEP 6 IS HAPLOTYPING BASED ON THE SIZES
-    print('** Genotyping                                         ')
-    all_samples = data_nodup['SAMPLE_NAME'].dropna().unique()
-    all_regions = list(data_nodup['REGION'].dropna().unique())
-    intervals = prepareIntervals(all_regions)
-    sample_res = []
-    for s in all_samples:
-        print('**** %s                      ' %(s))
-        sbs = data_nodup[(data_nodup['SAMPLE_NAME'] == s)]
-        sbs_dups = dup_df[(dup_df['SAMPLE_NAME'] == s)]
-        # create a dictionary of lists of lists of the rows, grouped by the 'group' column
-        grouped_rows = {k: [list(row) for _, row in v.iterrows()] for k, v in sbs.groupby('REGION')}
-        grouped_rows_dups = {k: [list(row) for _, row in v.iterrows()] for k, v in sbs_dups.groupby('REGION')}
-        # Create a list of lists of lists from the dictionary
-        list_of_lists_of_lists = [group_rows for group_rows in grouped_rows.values()]
-        # idea is to create 2 lists with the same length and order for the reads and duplicated reads info
-        list_of_lists_of_lists_dups = []
-        for x in grouped_rows.keys():
-            if x in grouped_rows_dups.keys():
-                list_of_lists_of_lists_dups.append(grouped_rows_dups[x])
-            else:
-                list_of_lists_of_lists_dups.append([])
-        # pair non-duplicated and duplicated for parallelization, assuming list_of_lists_of_lists and list_of_lists_of_lists_dups have the same length
-        list_pairs = zip(list_of_lists_of_lists, list_of_lists_of_lists_dups)
-        # also take any relevant clipping event in the sample and region of interest
-        temp_clipping = all_clipping_df[all_clipping_df['REGION'].isin(list(sbs['REGION'])) & all_clipping_df['SAMPLE'].isin(list(sbs['SAMPLE_NAME']))]
-        pool = multiprocessing.Pool(processes=n_cpu)
-        haplo_fun = partial(haplotyping, s = s, thr_mad = thr_mad, type = type, reference_motif_dic = reference_motif_dic, intervals = intervals, min_support = min_support, temp_clipping = temp_clipping)
-        # use list_of_lists_of_lists below instead of list_pairs to restore
-        haplo_results = pool.map(haplo_fun, list_pairs)
-        pool.close()
-        sample_res.append(haplo_results)
-    # STEP 7 IS TO COMPOSE THE OUTPUTS: VCF AND SEQUENCES
-    df_vcf = pd.DataFrame([x[0] for x in sample_res[0]], columns=['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT', all_samples[0]])
-    df_seq = pd.DataFrame([x for y in sample_res[0] for x in y[1]], columns=['READ_NAME', 'HAPLOTAG', 'REGION', 'PASSES', 'READ_QUALITY', 'LEN_SEQUENCE_FOR_TRF', 'START_TRF', 'END_TRF', 'type', 'SAMPLE_NAME', 'POLISHED_HAPLO', 'DEPTH', 'CONSENSUS_MOTIF', 'CONSENSUS_MOTIF_COPIES', 'MOTIF_REF', 'REFERENCE_MOTIF_COPIES', 'SEQUENCE_WITH_PADDINGS', 'SEQUENCE_FOR_TRF'])
-    # and the raw output
-    raw_seq_list = []
-    if type == 'reads':
-        for sample in sample_res:
-            for region in sample:
-                if isinstance(region[-1], pd.DataFrame):
-                    raw_seq_list.append(region[-1])
-        # combine all dataframes and write as output
-        if len(raw_seq_list) >0:
-            raw_seq_df = pd.concat(raw_seq_list, ignore_index=True)
-        #raw_seq_df.to_csv('%s/sample.raw.txt.gz' %(outDir), sep="\t", compression = 'gzip', header=True, index=False)
-    # if there are more samples, write them as well
-    if len(sample_res) >1:
-        for i in range(1, len(sample_res)):
-            tmp = pd.DataFrame([[x[0][2], x[0][-1]] for x in sample_res[i]], columns=['ID', all_samples[i]])
-            # merge with main df
-            df_vcf = pd.merge(df_vcf, tmp, on='ID', how='outer')
-            # then compose the seq dataframe
-            tmp = pd.DataFrame([x for y in sample_res[i] for x in y[1]], columns=['READ_NAME', 'HAPLOTAG', 'REGION', 'PASSES', 'READ_QUALITY', 'LEN_SEQUENCE_FOR_TRF', 'START_TRF', 'END_TRF', 'type', 'SAMPLE_NAME', 'POLISHED_HAPLO', 'DEPTH', 'CONSENSUS_MOTIF', 'CONSENSUS_MOTIF_COPIES', 'MOTIF_REF', 'REFERENCE_MOTIF_COPIES', 'SEQUENCE_WITH_PADDINGS', 'SEQUENCE_FOR_TRF'])
-            # add to main df
-            df_seq = pd.concat([df_seq, tmp], axis=0)
-    # STEP 8 IS TO WRITE THE OUTPUTS
-    print('** Producing outputs: VCF file and table with sequences                        ')
-    seq_file = '%s/sample.seq.txt.gz' %(outDir)
-    vcf_file = '%s/sample.vcf' %(outDir)
-    writeOutputs(df_vcf, df_seq, seq_file, vcf_file, all_samples, inBam)
-    print('Haplotyping analysis done!')
-    return df_seq, raw_seq_df
+    return reference_motif_dic
+
+# Function to compose the VCF record of a region: fixed fields from the first sample with the region, then one genotype per sample
+def composeRecord(sample_rows, n_samples):
+    first = sample_rows[min(sample_rows.keys())]
+    return list(first[:9]) + [sample_rows[i][-1] if i in sample_rows.keys() else '.' for i in range(n_samples)]
+
+# Function to write the regions whose samples are all done, in coordinate order: returns the records and the index of the next region to write
+def completeRegions(pending, region_order, n_expected, next_region, n_samples):
+    records = []
+    while next_region < len(region_order) and len(pending.get(region_order[next_region], {})) == n_expected[region_order[next_region]]:
+        records.append(composeRecord(pending.pop(region_order[next_region]), n_samples))
+        next_region += 1
+    return records, next_region
+
+# Largest number of reads in a batch of genotyping tasks, so that the outputs are written while the tasks run
+BATCH_READS = 5000
+
+# Function to group the genotyping tasks in batches with similar number of reads
+# Regions are scheduled in coordinate order, in windows of about one batch per worker: the tasks of a region are in the same window, and largest tasks come first within a window
+def batchTasks(tasks, n_cpu):
+    n_reads = [(task[1][1] - task[1][0]) + (task[2][1] - task[2][0]) for task in tasks]
+    # target size of a batch: a few batches per worker, so that workers finishing early can take more
+    target = max(1, min(BATCH_READS, sum(n_reads) / (n_cpu * 8)))
+    region_tasks = {}
+    for i in range(len(tasks)):
+        region_tasks.setdefault(tasks[i][4], []).append(i)
+    batches = []; window = []; window_reads = 0
+    for r in sorted(region_tasks.keys(), key = regionKey):
+        window.extend(region_tasks[r]); window_reads += sum([n_reads[i] for i in region_tasks[r]])
+        if window_reads >= n_cpu * target:
+            batches.extend(windowBatches(window, tasks, n_reads, target))
+            window = []; window_reads = 0
+    batches.extend(windowBatches(window, tasks, n_reads, target))
+    return batches
 
-# function to make permutations
-def permutMotif(motif):
-    # standard motif
-    motif_cons = [motif[i::] + motif[0:i] for i in range(len(motif))]
-    # reverse complement
-    rc_motif = reverse_complement(motif)
-    rc_motif_cons = [rc_motif[i::] + rc_motif[0:i] for i in range(len(rc_motif))]
-    # combine
-    comb_motifs = motif_cons + rc_motif_cons
-    # take the first in ascending order
-    sel_motif = sorted(comb_motifs)[0]
-    return sel_motif
+# Function to group the tasks of a window of regions in batches: largest tasks come first, small tasks are grouped together
+def windowBatches(window, tasks, n_reads, target):
+    batches = []; batch = []; batch_reads = 0
+    for i in sorted(window, key = lambda i: -n_reads[i]):
+        batch.append([i, tasks[i]]); batch_reads += n_reads[i]
+        if batch_reads >= target:
+            batches.append(batch); batch = []; batch_reads = 0
+    if len(batch) >0:
+        batches.append(batch)
+    return batches
+
+# Function to run haplotyping on a batch of tasks
+def haplotypingBatch(batch, thr_mad, type, min_support, shared_data, store_nodup, store_dups):
+    reference_motif_dic, intervals = readSharedObject(shared_data)
+    return [[i, haplotyping(task, thr_mad, type, reference_motif_dic, intervals, min_support, store_nodup, store_dups)] for i, task in batch]
 
 # Function to do qc based on clipping events
-def clippingQC(sbs, temp_clipping_r):
+def clippingQC(sbs, n_clipped):
     n_spanning = sbs.shape[0]
-    n_clipped = temp_clipping_r.shape[0]
     n_total = n_spanning + n_clipped
     # rule: if total number of clipped reads is larger than 30% of all the reads, do not pass qc
     qc = False if (n_clipped/n_total >= 0.20) else True
     return(qc)
 
 # function to guide haplotyping
-def haplotyping(pair, s, thr_mad, type, reference_motif_dic, intervals, min_support, temp_clipping):
-    # recover information for the reads and duplicates -- comment this and add dup_df as argument for the function to restore to previous, also look few lines below
-    x, y = pair
-    # define columns based on the data type
-    columns = ['SAMPLE_NAME', 'REGION', 'READ_NAME', 'PASSES', 'READ_QUALITY', 'MAPPING_CONSENSUS', 'SEQUENCE_FOR_TRF', 'SEQUENCE_WITH_PADDINGS', 'LEN_SEQUENCE_FOR_TRF', 'LEN_SEQUENCE_WITH_PADDINGS', 'ID', 'EXPECTED_MOTIF', 'START_TRF', 'END_TRF', 'LENGTH_MOTIF_TRF', 'COPIES_TRF', 'TRF_CONSENSUS_SIZE', 'TRF_PERC_MATCH', 'TRF_PERC_INDEL', 'TRF_SCORE', 'TRF_A_PERC', 'TRF_C_PERC', 'TRF_G_PERC', 'TRF_T_PERC', 'TRF_ENTROPY', 'TRF_MOTIF', 'TRF_REPEAT_SEQUENCE', 'TRF_PADDING_BEFORE', 'TRF_PADDING_AFTER', 'HAPLOTAG', 'motif', 'UNIFORM_MOTIF', 'UNIQUE_NAME'] if type in ['reads', 'hifiasm'] else ['SAMPLE_NAME', 'REGION', 'READ_NAME', 'SEQUENCE_WITH_PADDINGS', 'LEN_SEQUENCE_WITH_PADDINGS', 'SEQUENCE_FOR_TRF', 'LEN_SEQUENCE_FOR_TRF', 'HAPLOTAG', 'PASSES', 'READ_QUALITY', 'MAPPING_CONSENSUS', 'ID', 'EXPECTED_MOTIF', 'START_TRF', 'END_TRF', 'LENGTH_MOTIF_TRF', 'COPIES_TRF', 'TRF_CONSENSUS_SIZE', 'TRF_PERC_MATCH', 'TRF_PERC_INDEL', 'TRF_SCORE', 'TRF_A_PERC', 'TRF_C_PERC', 'TRF_G_PERC', 'TRF_T_PERC', 'TRF_ENTROPY', 'TRF_MOTIF', 'TRF_REPEAT_SEQUENCE', 'TRF_PADDING_BEFORE', 'TRF_PADDING_AFTER', 'motif', 'UNIFORM_MOTIF', 'UNIQUE_NAME']
-    # data of interest to dataframe
-    sbs = pd.DataFrame(x, columns=columns)
-    #print(list(set(list(sbs['REGION'])))[0])
-    # comment out this below to restore
-    dup_df = pd.DataFrame(y, columns=columns)
-    # extract region
-    r = list(sbs['REGION'].unique())[0]
+def haplotyping(task, thr_mad, type, reference_motif_dic, intervals, min_support, store_nodup, store_dups):
+    # recover information for the reads and duplicates of the sample and region from the column stores
+    s, (start, stop), (start_dups, stop_dups), n_clipped, r = task
+    sbs = readColumnStore(store_nodup, start, stop)
+    dup_df = readColumnStore(store_dups, start_dups, stop_dups)
     # exclude nas
     sbs = sbs.dropna(subset=['LEN_SEQUENCE_FOR_TRF'])
-    # extract clipping events
-    temp_clipping_r = temp_clipping[temp_clipping['REGION'] == r]
     # check if there are rows
     if sbs.shape[0] >0:
         if type in ['otter', 'hifiasm']:
@@ -719,7 +824,7 @@ def haplotyping(pair, s, thr_mad, type, reference_motif_dic, intervals, min_supp
             # check minimum support: minimum support is for alleles --> 2*min_support is the total minimum coverage required for autosomal regions. For sex-regions, we will use min_support directly
             # find chromosome to adapt coverage
             # first do qc based on the clipping events
-            qc_clip = clippingQC(sbs, temp_clipping_r)
+            qc_clip = clippingQC(sbs, n_clipped)
             if qc_clip == True:
                 chrom = r.split(':')[0]
                 minimum_coverage = min_support if chrom in ['chrY', 'Y'] else min_support*2
@@ -797,7 +902,9 @@ def readBased_size(sbs, r, chrom, min_support, thr_mad):
                 # haplotags need to be either 0 or 1, so remove 1 from the current values
                 pol_sbs['HAPLOTAG'] = pol_sbs['HAPLOTAG'] - 1
                 sbs = pol_sbs
-    except:
+    except Exception as e:
+        # the region is not genotyped, but the error is reported
+        print('!! Haplotyping of region %s failed: %s: %s' %(r, type(e).__name__, e))
         sbs['POLISHED_HAPLO'] = 'NA'
     return sbs
 
@@ -1219,31 +1326,12 @@ def prepareIntervals(all_regions):
         intervals.append(all_regions[index])
     return intervals
 
-# function to write header of vcf file
-def writeVCFheader(vcf_file, samples, inBam):
-    # open file
-    outf = open(vcf_file, 'w')
-    # write header
-    outf.write('##fileformat=VCFv4.2\n##INFO=<ID=REFERENCE_INFO,Number=2,Type=String,Description="Motif observed in the reference genome (GRCh38), and relative number of motif repetitions."\n##FORMAT=<ID=QC,Number=1,Type=String,Description="Quality summary of TREAT genotyping. PASS_BOTH: genotype agreed between reads-spanning and assembly. PASS_RSP: genotype from reads-spanning. PASS_ASM: genotype from assembly."\n##FORMAT=<ID=GT,Number=2,Type=String,Description="Phased size of the tandem repeats. H1_size | H2_size"\n##FORMAT=<ID=MOTIF,Number=2,Type=String,Description="Phased consensus motif found in the sample. H1_motif | H2_motif"\n##FORMAT=<ID=CN,Number=2,Type=String,Description="Phased number of copies of the motif found in the sample. H1_copies | H2_copies"\n##FORMAT=<ID=CN_REF,Number=2,Type=String,Description="Phased estimation of the reference motif as found in the sample. H1_motif_ref | H2_motif_ref"\n##FORMAT=<ID=DP,Number=1,Type=String,Description="Phased depth found in the sample. H1_depth | H2_depth"\n')
-    # need to add the contig information
-    contig_info = '\n'.join([convert_sq_to_contig(x.rstrip())for x in os.popen('samtools view -H %s' %(inBam[0])) if '@SQ' in x])
-    outf.write('%s\n' %(contig_info))
-    outf.close()
-    return    
-
-# Function to convert sequence to contig - OK
-def convert_sq_to_contig(sq_string):
-    match = re.match(r'@SQ\tSN:(\S+)\tLN:(\d+)', sq_string)
-    if not match:
-        raise ValueError("The input string does not match the expected format")
-    return f'##contig=<ID={match.group(1)},length={match.group(2)}>'
-
-# function to write outputs
-def writeOutputs(df_vcf, df_seq, seq_file, vcf_file, all_samples, inBam):
-    # write header of vcf file
-    writeVCFheader(vcf_file, all_samples, inBam)
-    with open(vcf_file, mode='a') as file:
-        df_vcf.to_csv(file, header=True, index=False, sep='\t')
-    # then compress it
-    os.system('gzip %s' %(vcf_file))
-    return
+# header lines of the VCF file, contigs excluded
+VCF_HEADER = ['##fileformat=VCFv4.2',
+    '##INFO=<ID=REFERENCE_INFO,Number=2,Type=String,Description="Motif observed in the reference genome (GRCh38), and relative number of motif repetitions."',
+    '##FORMAT=<ID=QC,Number=1,Type=String,Description="Quality summary of TREAT genotyping. PASS_BOTH: genotype agreed between reads-spanning and assembly. PASS_RSP: genotype from reads-spanning. PASS_ASM: genotype from assembly."',
+    '##FORMAT=<ID=GT,Number=2,Type=String,Description="Phased size of the tandem repeats. H1_size | H2_size"',
+    '##FORMAT=<ID=MOTIF,Number=2,Type=String,Description="Phased consensus motif found in the sample. H1_motif | H2_motif"',
+    '##FORMAT=<ID=CN,Number=2,Type=String,Description="Phased number of copies of the motif found in the sample. H1_copies | H2_copies"',
+    '##FORMAT=<ID=CN_REF,Number=2,Type=String,Description="Phased estimation of the reference motif as found in the sample. H1_motif_ref | H2_motif_ref"',
+    '##FORMAT=<ID=DP,Number=1,Type=String,Description="Phased depth found in the sample. H1_depth | H2_depth"']
@@ -2,11 +2,16 @@
 
 # Libraries
 print('* Loading libraries')
-import pandas as pd
 import os
-import re
 import sys
 import time
+import heapq
+import shutil
+import tempfile
+import multiprocessing
+import pysam
+from functools import partial
+from functions_common import regionKey, chromosomeKey, openVCFtext, readVCFheader
 
 # Functions
 ### Functions to check input arguments
@@ -23,24 +28,9 @@ def checkOutDir(outDir):
             os.system('mkdir %s' %(outDir))
             return("** Output directory doesn't exist. Will create and will output files %s" %(outDir))
 
-# Check if VCF files exist
+# Check if VCF files exist and were produced by TREAT: only the headers are read
 def checkVCF(vcf):
-    # then check them one by one if they exist
-    valid_files = []
-    non_valid_files = []
-    for f in vcf:
-        # check if file exist
-        if os.path.exists(f) == True:
-            # if file exists, check if it was produced by TREAT
-            cmd_cat = 'cat' if '.gz' not in f else 'zcat'
-            cmd = '%s %s | head | grep "TREAT"' %(cmd_cat, f)
-            res = [x.rstrip() for x in os.popen(cmd)]
-            if len(res) >0:
-                valid_files.append(f)
-            else:
-                non_valid_files.append(f)
-        else:
-            non_valid_files.append(f)
+    non_valid_files = [f for f in vcf if not os.path.isfile(f) or not readVCFheader(f)['treat']]
     # summary
     if len(non_valid_files) == 0:
         return('** %s valid VCF provided.' %(len(vcf)))
@@ -48,30 +38,187 @@ def checkVCF(vcf):
         print('** %s non valid VCF provided: %s.\nExecution halted.' %(len(non_valid_files), ' '.join(non_valid_files)))
         sys.exit(1)  # Exit the script with a non-zero status code
 
-### Functions to write output
-# function to write header of vcf file
-def writeVCFheader(output_fname):
-    # open file
-    outf = open(output_fname, 'w')
-    # write header
-    outf.write('##fileformat=VCFv4.2\n##INFO=<ID=REFERENCE_INFO,Number=2,Type=String,Description="Motif observed in the reference genome (GRCh38), and relative number of motif repetitions."\n##FORMAT=<ID=QC,Number=1,Type=String,Description="Quality summary of TREAT genotyping. PASS_BOTH: genotype agreed between reads-spanning and assembly. PASS_RSP: genotype from reads-spanning. PASS_ASM: genotype from assembly."\n##FORMAT=<ID=GT,Number=2,Type=String,Description="Phased size of the tandem repeats. H1_size | H2_size"\n##FORMAT=<ID=MOTIF,Number=2,Type=String,Description="Phased consensus motif found in the sample. H1_motif | H2_motif"\n##FORMAT=<ID=CN,Number=2,Type=String,Description="Phased number of copies of the motif found in the sample. H1_copies | H2_copies"\n##FORMAT=<ID=CN_REF,Number=2,Type=String,Description="Phased estimation of the reference motif as found in the sample. H1_motif_ref | H2_motif_ref"\n##FORMAT=<ID=DP,Number=1,Type=String,Description="Phased depth found in the sample. H1_depth | H2_depth"\n')
-    outf.close()
-    return
-
-# function to write outputs
-def writeOutputs(output_fname, vcf_data):
-    # write header of vcf file
-    writeVCFheader(output_fname)
-    with open(output_fname, mode='a') as file:
-        vcf_data.to_csv(file, header=True, index=False, sep='\t')
-    # then compress it
-    os.system('gzip %s' %(output_fname))
-    return
+### Functions to read the VCF files
+# Genotype of the samples of a file that does not have a region
+NA_GENOTYPE = 'NA;NA|NA;NA|NA;NA|NA;NA|NA;NA|NA'
+
+# Sorting key of a record: region in coordinate order
+def recordKey(rec):
+    return regionKey(rec[2])
+
+# Records of a VCF file, as lists of fields
+def readRecords(f):
+    with openVCFtext(f) as finp:
+        for line in finp:
+            if not line.startswith('#') and line.strip() != '':
+                yield line.rstrip('\n').split('\t')
+
+# Check whether a VCF file has a tabix index
+def isIndexed(f):
+    return f.endswith('.gz') and os.path.exists('%s.tbi' %(f))
+
+# Check whether the records of a VCF file are in coordinate order
+def checkSorted(f):
+    previous = None
+    for rec in readRecords(f):
+        key = recordKey(rec)
+        if previous is not None and key < previous:
+            return False
+        previous = key
+    return True
+
+# Sort a VCF file that is not sorted into a temporary bgzip-compressed file of records: only one file is held in memory at a time
+def sortToFile(f, sorted_file):
+    fout = pysam.BGZFile(sorted_file, 'wb')
+    writeMerged(fout, sorted(readRecords(f), key = recordKey))
+    fout.close()
+    return sorted_file
+
+# Records of a chromosome of a VCF file with tabix index
+def chromosomeRecords(f, chrom):
+    tbx = pysam.TabixFile(f)
+    if chrom in tbx.contigs:
+        for line in tbx.fetch(chrom):
+            yield line.split('\t')
+    tbx.close()
+
+### Functions to merge the VCF files
+# Records of a file with their sorting key and the index of the file
+def keyedRecords(records, i):
+    for rec in records:
+        yield recordKey(rec), i, rec
+
+# Merge records in coordinate order: records of the same region are combined, and samples of files without the region get the NA genotype
+def mergeRecords(record_iters, n_samples):
+    merged = heapq.merge(*[keyedRecords(records, i) for i, records in enumerate(record_iters)])
+    current_key = None; current = {}
+    for key, i, rec in merged:
+        if key != current_key and len(current) >0:
+            yield composeMerged(current, n_samples)
+            current = {}
+        current_key = key
+        # the first record of a file for a region is kept
+        if i not in current.keys():
+            current[i] = rec
+    if len(current) >0:
+        yield composeMerged(current, n_samples)
+
+# Compose a merged record: fixed fields from the first file with the region
+def composeMerged(current, n_samples):
+    merged = list(current[min(current.keys())][:9])
+    for i in range(len(n_samples)):
+        merged.extend(current[i][9:] if i in current.keys() else [NA_GENOTYPE] * n_samples[i])
+    return merged
+
+# Write merged records in blocks
+def writeMerged(fout, records, block_size = 10000):
+    n_records = 0; block = []
+    for rec in records:
+        block.append('\t'.join(rec))
+        if len(block) == block_size:
+            fout.write(('\n'.join(block) + '\n').encode())
+            n_records += len(block); block = []
+    if len(block) >0:
+        fout.write(('\n'.join(block) + '\n').encode())
+        n_records += len(block)
+    return n_records
+
+# Merge the records of a chromosome in a bgzip-compressed part of the output
+def mergeChromosome(chrom, vcf, n_samples, tmp_dir):
+    part_file = '%s/%s.vcf.gz' %(tmp_dir, chrom)
+    fout = pysam.BGZFile(part_file, 'wb')
+    n_records = writeMerged(fout, mergeRecords([chromosomeRecords(f, chrom) for f in vcf], n_samples))
+    fout.close()
+    return part_file, n_records
+
+# Header of the merged VCF: header lines of the first file, and samples of all files
+def mergedHeader(vcf):
+    headers = [readVCFheader(f) for f in vcf]
+    n_samples = [len(x['samples']) for x in headers]
+    all_samples = [s for x in headers for s in x['samples']]
+    # contigs of the other files that are not in the first file are added
+    contigs = list(headers[0]['contigs'])
+    extra_contigs = []
+    for x in headers[1:]:
+        for contig, line in zip(x['contigs'], [l for l in x['lines'] if l.startswith('##contig=<ID=')]):
+            if contig not in contigs:
+                contigs.append(contig); extra_contigs.append(line)
+    header = headers[0]['lines'] + extra_contigs + ['\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT'] + all_samples)]
+    return header, n_samples
+
+# Merge VCF files in a single stream: files that are not sorted are first sorted one at a time into temporary files, then all files are streamed
+def mergeStream(vcf, output_fname, sorted_check):
+    header, n_samples = mergedHeader(vcf)
+    tmp_dir = tempfile.mkdtemp(prefix = 'merge_sort_', dir = os.path.dirname(output_fname))
+    inputs = [vcf[i] if sorted_check[i] else sortToFile(vcf[i], '%s/sorted_%s.vcf.gz' %(tmp_dir, i)) for i in range(len(vcf))]
+    fout = pysam.BGZFile(output_fname, 'wb')
+    fout.write(('\n'.join(header) + '\n').encode())
+    n_records = writeMerged(fout, mergeRecords([readRecords(f) for f in inputs], n_samples))
+    fout.close()
+    shutil.rmtree(tmp_dir)
+    pysam.tabix_index(output_fname, preset = 'vcf', force = True)
+    return n_records
+
+# Merge a group of VCF files in a single process, for the tree-reduce mode
+def mergeGroup(group):
+    vcf, sorted_check, output_fname = group
+    return output_fname, mergeStream(vcf, output_fname, sorted_check)
+
+# Merge VCF files: by chromosome in parallel if all files have a tabix index, otherwise in a single stream
+def mergeVCF(vcf, output_fname, cpu, sorted_check = None):
+    # files with tabix index are sorted by position within each chromosome
+    if cpu >1 and all([isIndexed(f) for f in vcf]):
+        print('** All VCF files are indexed: merging by chromosome')
+        header, n_samples = mergedHeader(vcf)
+        all_chroms = set()
+        for f in vcf:
+            tbx = pysam.TabixFile(f); all_chroms.update(tbx.contigs); tbx.close()
+        tmp_dir = tempfile.mkdtemp(prefix = 'merge_vcf_', dir = os.path.dirname(output_fname))
+        pool = multiprocessing.Pool(processes=cpu)
+        merge_fun = partial(mergeChromosome, vcf = vcf, n_samples = n_samples, tmp_dir = tmp_dir)
+        parts = pool.map(merge_fun, sorted(all_chroms, key = chromosomeKey))
+        pool.close()
+        fout = pysam.BGZFile(output_fname, 'wb')
+        fout.write(('\n'.join(header) + '\n').encode())
+        fout.close()
+        # bgzip-compressed parts can be concatenated
+        with open(output_fname, 'ab') as fcat:
+            for part_file, n_records in parts:
+                with open(part_file, 'rb') as fpart:
+                    shutil.copyfileobj(fpart, fcat)
+        shutil.rmtree(tmp_dir)
+        pysam.tabix_index(output_fname, preset = 'vcf', force = True)
+        return sum([x[1] for x in parts])
+    if sorted_check is None:
+        pool = multiprocessing.Pool(processes=cpu)
+        sorted_check = pool.map(checkSorted, vcf)
+        pool.close()
+    if not all(sorted_check):
+        print('** %s VCF files are not sorted: they will be sorted one at a time in temporary files' %(len([x for x in sorted_check if not x])))
+    return mergeStream(vcf, output_fname, sorted_check)
+
+# Merge VCF files as a tree: groups of fan_in files are merged in parallel into intermediate VCF files, which are merged again until fan_in files or less are left
+def mergeTree(vcf, output_fname, cpu, fan_in):
+    tmp_dir = tempfile.mkdtemp(prefix = 'merge_tree_', dir = os.path.dirname(output_fname))
+    pool = multiprocessing.Pool(processes=cpu)
+    sorted_check = pool.map(checkSorted, vcf)
+    level = 0
+    while len(vcf) > fan_in:
+        groups = [[vcf[i:i+fan_in], sorted_check[i:i+fan_in], '%s/level%s_group%s.vcf.gz' %(tmp_dir, level, i // fan_in)] for i in range(0, len(vcf), fan_in)]
+        vcf = [x[0] for x in pool.map(mergeGroup, groups)]
+        # intermediate files are sorted
+        sorted_check = [True] * len(vcf)
+        level += 1
+        print('** Merge level %s: %s intermediate VCF files' %(level, len(vcf)))
+    pool.close()
+    n_records = mergeVCF(vcf, output_fname, cpu, sorted_check)
+    shutil.rmtree(tmp_dir)
+    return n_records
 
 # Main
 # Read arguments
-vcf, outDir, outName = sys.argv[1::]
-vcf = vcf.split(',')
+vcf, outDir, outName, cpu, fanIn = sys.argv[1::]
+vcf = vcf.split(','); cpu = int(cpu); fanIn = int(fanIn)
 
 # 1. Check arguments: VCFs and output directory
 print('* Analysis started')
@@ -81,39 +228,16 @@ print(checkOutDir(outDir))
 # 1.2 Check VCF files
 print(checkVCF(vcf))
 
-# 2. Read the first VCF
-first = pd.read_csv(vcf[0], sep="\t", skiprows=8)
-# then iteratively read the others and merge them with the first
-for f in vcf[1::]:
-    tmp = pd.read_csv(f, sep="\t", skiprows=8)
-    # merge common ids
-    tmp_sb = tmp.iloc[:, [2] + list(range(9, len(tmp.columns)))]
-    merged_df = first.merge(tmp_sb, on='ID', how='inner')
-    # find common elements in "ID" column
-    common_ids = first['ID'].isin(merged_df['ID'])
-    common_ids_df2 = tmp['ID'].isin(merged_df['ID'])
-    # find elements unique to df1
-    unique_to_df1 = first[~common_ids].copy()
-    # add NAs
-    samples_df2 = list(tmp.columns[9::])
-    for newsam in samples_df2:
-        unique_to_df1[newsam] = 'NA;NA|NA;NA|NA;NA|NA;NA|NA;NA|NA'
-    # the the other way around - find elements unique to df2
-    unique_to_df2 = tmp[~common_ids_df2].copy()
-    # add NAs
-    samples_df1 = list(first.columns[9::])
-    for newsam in samples_df1:
-        unique_to_df2[newsam] = 'NA;NA|NA;NA|NA;NA|NA;NA|NA;NA|NA'
-    # combine all together
-    complete_df = pd.concat([merged_df, unique_to_df1, unique_to_df2], ignore_index=True)
-    first = complete_df
-
-# 3. write output file
+# 2. Merge the VCF files in coordinate order, and write the output compressed and indexed: as a tree if a fan-in is given
 output_fname = '%s/%s' %(outDir, outName)
-output_fname = output_fname.replace('.gz', '')
-writeOutputs(output_fname, first)
+if not output_fname.endswith('.gz'):
+    output_fname = output_fname + '.gz'
+if fanIn >1 and len(vcf) > fanIn:
+    n_records = mergeTree(vcf, output_fname, cpu, fanIn)
+else:
+    n_records = mergeVCF(vcf, output_fname, cpu)
+print('** %s regions in the combined VCF' %(n_records))
 
 te_total = time.time()
 time_total = te_total - ts_total
 print('\n* VCF combined in %s seconds. Ciao!\t\t\t\t\t\t\t\t' %(round(time_total, 0)))
-
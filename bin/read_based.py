@@ -6,8 +6,8 @@ from functions_read_based import *
 
 # Main
 # Read arguments and make small changes
-inBam_dir, bed_dir, outDir, ref, window, cpu, phasingData, mappingSNP, HaploDev, minimumSupport, minimumCoverage, rawSequences = sys.argv[1::]
-window = int(window); cpu = int(cpu); minimumSupport = int(minimumSupport)
+inBam_dir, bed_dir, outDir, ref, window, cpu, phasingData, mappingSNP, HaploDev, minimumSupport, minimumCoverage, rawSequences, trfBackend, cacheDir, outFormat, resume, catalog = sys.argv[1::]
+window = int(window); cpu = int(cpu); minimumSupport = int(minimumSupport); outFormat = checkTableFormat(outFormat)
 if HaploDev == 'None':
     HaploDev = 0.10
 else:
@@ -17,106 +17,102 @@ else:
 print('* Analysis started')
 ts_total = time.time()
 # 1.1 Check output directory
-print(checkOutDir(outDir))
+print(checkOutDir(outDir, resume))
+checkpointDir = '%s/checkpoints' %(outDir) if resume == 'True' else 'None'
 # 1.2 Create Log file
-logfile = createLogReads(inBam_dir, bed_dir, outDir, ref, window, cpu, phasingData, mappingSNP, HaploDev, minimumSupport, minimumCoverage)
+logfile = createLogReads(inBam_dir, bed_dir, outDir, ref, window, cpu, phasingData, mappingSNP, HaploDev, minimumSupport, minimumCoverage, trfBackend, cacheDir, outFormat, resume, catalog)
+# inputs shared by all checkpoints: regions and reference
+input_key = [fileKey(bed_dir, content = True), fileKey(ref), window]
 # 1.3 Read bed file
-bed, count_reg, bed_dir = readBed(bed_dir, outDir)
+bed, count_reg, bed_dir, bed_index = readBed(bed_dir, outDir)
 # 1.3 Check BAM files
 inBam = checkBAM(inBam_dir)
+# 1.4 Start the worker processes used by all steps, with the regions and the motif table preloaded
+loadMotifTable(cacheDir)
+startPool(cpu, {'bed_index' : bed_index, 'reference' : ref})
 
-# 2. Extract sequence of interest
+# 2. Phasing and haplotagging, before the extraction so that the haplotags are added to the reads as they are annotated
 ts = time.time()
-# 2.1 Extract reads using samtools
-temp_bams, temp_beds = extractRead(inBam, bed_dir, outDir, cpu, count_reg)
-# 2.2 Parse output and get sequences
-pool = multiprocessing.Pool(processes=cpu)
-extract_fun = partial(distributeExtraction, bed = bed, window = window)
-extract_results = pool.map(extract_fun, temp_bams)
-pool.close()
+# 2.1 Check whether we need to do this
+if phasingData == 'None':
+    print('** Phasing NOT selected (not specified any SNP data)')
+    haplotag_index = {}
+    phasing_keys = []
+else:
+    print('** Phasing and haplotagging with whatshap')
+    # create directory for phasing
+    os.makedirs('%s/phasing' %(outDir), exist_ok = True)
+    print('** Phasing started\t\t\t\t\t\t\t\t\t\t\t')
+    # 2.2 Each sample is phased once on all the regions: the result is an index of the haplotags of its reads, checkpointed in its own stage
+    phasing_fun = partial(phase_reads, bed_file = bed_dir, phasingData = phasingData, mappingSNP = mappingSNP, outDir = outDir, snpWindow = 10000, ref = ref)
+    phasing_keys = [checkpointKey(input_key, fileKey(x), fileKey(phasingData), fileKey(mappingSNP)) for x in inBam]
+    haplotag_index = dict(mapCheckpointed(phasing_fun, inBam, phasing_keys, 'haplotag_index', checkpointDir, cpu))
+    print('** %s reads haplotagged' %(sum([len(x[0]) for x in haplotag_index.values()])))
+te = time.time()
+time_phasing = te-ts
+print('*** Phasing took %s seconds\t\t\t\t\t\t\t\t\t\t' %(round(time_phasing, 0)))
+
+# 3. Extract sequence of interest
+ts = time.time()
+# 3.1 Split the regions in chunks and pair them with the BAM files
+extraction_tasks, temp_beds = extractRead(inBam, bed, outDir, cpu, count_reg)
+# 3.2 Fetch reads from the BAM files and get sequences
+extract_fun = partial(distributeExtraction, window = window)
+extraction_keys = [checkpointKey(input_key, fileKey(x[0]), x[2]) for x in extraction_tasks]
+extract_results = mapCheckpointed(extract_fun, extraction_tasks, extraction_keys, 'extraction', checkpointDir, cpu)
 print('** Exact SV intervals extracted')
 all_fasta = [outer_list[1] for outer_list in extract_results]
 all_clipping = [outer_list[2] for outer_list in extract_results]
 all_clipping_flatten = [item for sublist in all_clipping for item in sublist]
 all_clipping_df = pd.DataFrame(all_clipping_flatten, columns=['REGION', 'SAMPLE', 'READ_NAME'])
-# 2.3 Then do the same on the reference genome
-pool = multiprocessing.Pool(processes=cpu)
-extract_fun = partial(measureDistance_reference, window = window, ref = ref, output_directory = outDir)
-extract_results_ref = pool.map(extract_fun, temp_beds)
-pool.close()
-all_fasta_ref = [outer_list[1] for outer_list in extract_results_ref]
-print('** Exact SV intervals from reference extracted')
-# 2.5 combine reference with other samples
-extract_results.extend(extract_results_ref)
-all_fasta.extend(all_fasta_ref)
+# 3.3 Then do the same on the reference genome, unless the reference motifs come from the reference catalog
+if catalog == 'None':
+    extract_fun = partial(measureDistance_reference, window = window, ref = ref, output_directory = outDir)
+    reference_keys = [checkpointKey(input_key, fileKey(x, content = True)) for x in temp_beds]
+    extract_results_ref = mapCheckpointed(extract_fun, temp_beds, reference_keys, 'reference', checkpointDir, cpu)
+    all_fasta_ref = [outer_list[1] for outer_list in extract_results_ref]
+    print('** Exact SV intervals from reference extracted')
+    # 3.4 combine reference with other samples
+    extract_results.extend(extract_results_ref)
+    all_fasta.extend(all_fasta_ref)
+    reference_motif_dic = None
+else:
+    reference_motif_dic = readCatalog(catalog, 'reads', ref, {'window' : window, 'annotation' : TRF_PARAMS[trfBackend]}, referenceRegions(bed))
+    reference_keys = [fileKey(catalog, content = True)]
 te = time.time()
 time_extraction = te-ts
 print('** Read extraction took %s seconds\t\t\t\t\t\t\t\t\t\t' %(round(time_extraction, 0)))
 
-# 3. TRF
+# 4. TRF
 ts = time.time()
-# 3.1 Run TRF in multiprocessing for each sample
-pool = multiprocessing.Pool(processes=cpu)
-trf_fun = partial(run_trf, all_fasta = all_fasta, type = 'reads')
-index_fasta = [x for x in range(len(all_fasta))]
-trf_results = pool.map(trf_fun, index_fasta)
-pool.close()
-# 3.2 combine df from different chunks together
-df_trf_combined = combineTRF_res(trf_results, extract_results, all_fasta)
+# 4.1 Run TRF in multiprocessing on the distinct sequences not in the annotation cache, unless a previous run did it already
+trf_key = checkpointKey(extraction_keys, reference_keys, phasing_keys, trfBackend, TRF_PARAMS)
+found, df_trf_combined = readCheckpoint(checkpointDir, 'annotation', trf_key)
+if found:
+    print('** TRF: reused from checkpoint')
+else:
+    trf_results = annotateReads(extract_results, trfBackend, cacheDir, cpu, outDir)
+    # 4.2 combine df from different chunks together, with the haplotag of each read from the index of its sample
+    df_trf_combined = writeCheckpoint(checkpointDir, 'annotation', trf_key, combineTRF_res(trf_results, extract_results, all_fasta, haplotag_index))
 print('** TRF done on all reads and samples')
 te = time.time()
 time_trf = te-ts
 print('*** TRF took %s seconds\t\t\t\t\t\t\t\t\t\t' %(round(time_trf, 0)))
 
-# 4. Phasing and haplotagging and combine with sequences
-ts = time.time()
-# 4.1 Check whether we need to do this
-if phasingData == 'None':
-    print('** Phasing NOT selected (not specified any SNP data)')
-    combined_haplotags_df = pd.DataFrame(columns=['READ_NAME', 'HAPLOTAG'])
-else:
-    print('** Phasing and haplotagging with whatshap')
-    # create directory for phasing
-    ts = time.time()
-    os.system('mkdir %s/phasing' %(outDir))
-    print('** Phasing started\t\t\t\t\t\t\t\t\t\t\t')
-    pool = multiprocessing.Pool(processes=cpu)
-    phasing_fun = partial(phase_reads, temp_bams = temp_bams, temp_beds = temp_beds, phasingData = phasingData, mappingSNP = mappingSNP, outDir = outDir, snpWindow = 10000)
-    #tmp = phase_reads(5, temp_bams = temp_bams, temp_beds = temp_beds, phasingData = phasingData, mappingSNP = mappingSNP, outDir = outDir, snpWindow = 10000)
-    phasing_res = pool.map(phasing_fun, [i for i in range(len(temp_bams))])
-    pool.close()
-    te = time.time()
-    time_phasing = te-ts
-    print('** Phasing done in %s seconds\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t' %(round(time_phasing, 0)))
-    combined_haplotags = sum(phasing_res, [])
-    if combined_haplotags == []:
-        combined_haplotags_df = pd.DataFrame(columns=['READ_NAME', 'HAPLOTAG'])
-    else:
-        combined_haplotags_df = pd.DataFrame(combined_haplotags, columns = ['READ_NAME', 'HAPLOTAG'])
-    # combine phased VCF and haplotagged bam files
-    combined_data = combine_data_afterPhasing(outDir)
-    print('*** Phasing took %s seconds\t\t\t\t\t\t\t\t\t\t' %(round(time_phasing, 0)))
-# 4.2 Combine with sequences
-df_trf_phasing_combined = pd.merge(df_trf_combined, combined_haplotags_df, left_on = 'READ_NAME', right_on = 'READ_NAME', how = 'outer')
-# check with some actual data where phasing is expected
-
 # 5. Do directly the haplotyping so that we save on IO usage
 ts = time.time()
-df_seq, df_raw = haplotyping_steps(data = df_trf_phasing_combined, n_cpu = cpu, thr_mad = HaploDev, min_support = minimumSupport, type = 'reads', outDir = outDir, all_clipping_df = all_clipping_df, inBam = inBam)
+# 5.1 The raw data sequences are written along with the VCF, if requested
+raw_table = '%s/spanning_reads_trf_phasing' %(outDir) if rawSequences == 'True' else 'None'
+vcf_file, raw_file = haplotyping_steps(data = df_trf_combined, n_cpu = cpu, thr_mad = HaploDev, min_support = minimumSupport, type = 'reads', outDir = outDir, all_clipping_df = all_clipping_df, inBam = inBam, raw_table = raw_table, raw_format = outFormat, reference_motif_dic = reference_motif_dic)
+saveMotifTable(cacheDir)
+closePool()
 te = time.time()
 time_write = te-ts
 print('*** Operation took %s seconds\t\t\t\t\t\t\t\t\t\t\t\t' %(round(time_write, 0)))
 te_total = time.time()
 time_total = te_total - ts_total
 
-# 6. Output also the raw data
-ts = time.time()
-# 6.1 Output file for haplotyping if requested
-if rawSequences == 'True':
-    outf = '%s/spanning_reads_trf_phasing.txt.gz' %(outDir)
-    print('** Writing raw data sequences')
-    df_raw.to_csv(outf, sep = " ", index=False, na_rep='NA', compression='gzip')
-# 6.2 Removing temporary files
+# 6. Removing temporary files
 print('** Cleaning')
 tmp = removeTemp(outDir)
 print('\n* Analysis completed in %s seconds. Ciao!\t\t\t\t\t\t\t\t' %(round(time_total, 0)))
@@ -0,0 +1,52 @@
+# This script builds the reference catalog: the annotation of the regions in the reference genome, used by the read-based and assembly-based analyses
+
+# Libraries
+print('* Loading libraries')
+import functions_read_based as reads_based
+import functions_assembly_based as assembly_based
+from functions_common import *
+import time
+import tempfile
+
+# Main
+# Read arguments and make small changes
+bed_dir, ref, outDir, outName, window, cpu, trfBackend, cacheDir = sys.argv[1::]
+window = int(window); cpu = int(cpu)
+
+# 1. Check arguments: BED and output directory
+print('* Catalog started')
+ts_total = time.time()
+# 1.1 Check output directory
+os.makedirs(outDir, exist_ok = True)
+print('** Output directory valid. Will output the catalog in %s' %(outDir))
+# 1.2 Read bed file: temporary files go in a directory that is removed at the end
+tmp_dir = tempfile.mkdtemp(prefix = 'catalog_', dir = outDir)
+bed, count_reg, bed_tmp, bed_index = reads_based.readBed(bed_dir, tmp_dir)
+# 1.3 Start the worker processes used by all steps: annotation cache and motif table are loaded before, so that the workers inherit them
+loadAnnotationCache(cacheDir)
+loadMotifTable(cacheDir)
+startPool(cpu, {'reference' : ref})
+
+# 2. Reference motifs as in the read-based analysis
+ts = time.time()
+reads_motifs = reads_based.referenceCatalog(bed, count_reg, ref, window, trfBackend, cacheDir, cpu, tmp_dir)
+print('*** Reference motifs for the read-based analysis took %s seconds\t\t\t\t\t\t\t\t\t\t' %(round(time.time() - ts, 0)))
+
+# 3. Reference motifs as in the assembly-based analysis
+ts = time.time()
+assembly_motifs = assembly_based.referenceCatalog_opt(bed, ref, window, cpu, cacheDir)
+print('*** Reference motifs for the assembly-based analysis took %s seconds\t\t\t\t\t\t\t\t\t\t' %(round(time.time() - ts, 0)))
+saveMotifTable(cacheDir)
+closePool()
+
+# 4. Write the catalog
+catalog = {'reference' : os.path.abspath(ref), 'contigs' : referenceContigs(ref), 'bed' : os.path.abspath(bed_dir),
+           'reads' : {'params' : {'window' : window, 'annotation' : reads_based.TRF_PARAMS[trfBackend]}, 'regions' : reads_based.referenceRegions(bed), 'motifs' : reads_motifs},
+           'assembly' : {'params' : {'annotation' : assembly_based.ATR_PARAMS}, 'regions' : [entry[2] for chromosome in bed for entry in bed[chromosome]], 'motifs' : assembly_motifs}}
+catalog_file = writeCatalog(catalog, '%s/%s' %(outDir, outName))
+shutil.rmtree(tmp_dir, ignore_errors = True)
+print('** Reference catalog of %s regions written to %s' %(count_reg, catalog_file))
+
+te_total = time.time()
+time_total = te_total - ts_total
+print('\n* Catalog completed in %s seconds. Ciao!\t\t\t\t\t\t\t\t' %(round(time_total, 0)))
@@ -10,11 +10,13 @@ import sys
 import os
 import gzip
 import numpy as np
-from scipy.stats import chi2
-from statsmodels.stats.multitest import fdrcorrection
-from statsmodels.api import Logit
+from scipy.stats import chi2, norm
+from scipy.special import expit
 import pandas as pd
 import warnings
+import multiprocessing
+from functools import partial
+from functions_common import readVCFheader, TREAT_FORMATS
 
 ###########################################################
 # Define the parser
@@ -62,10 +64,13 @@ def checkOutDir(out_dir):
         print('!! Output directory does not exists and cannot be created. Please check. Exiting.')
         sys.exit(1)
 
-# Function to check input vcf
+# Function to check input vcf: only the header is read
 def checkVCF(inp_vcf):
     if os.path.exists(inp_vcf):
         if '.gz' in inp_vcf or '.zip' in inp_vcf:
+            if not readVCFheader(inp_vcf)['treat']:
+                print('!! VCF was likely not produced with TREAT. Please check.')
+                sys.exit(1)
             print('** Input VCF file exists and it is valid.')
             return inp_vcf
         else:
@@ -129,10 +134,12 @@ def known_boundaries(known):
         print('** A file with known TR boundaries was submitted, but the file does not exist or is unreadable.')
         return 'none'
 
-# Function for outlier analysis
-def outlier_analysis(inp_vcf, region, madThr, cpu, out_dir, out_name, known):
+# Function for outlier analysis: regions are read in chunks, and the chunks are scored in parallel
+def outlier_analysis(inp_vcf, region, madThr, cpu, out_dir, out_name, known, chunk_size = None):
     # check if known file with boundaries was specified
     known_boun = known_boundaries(known)
+    boundaries = None
+    fout_bou = None
     if isinstance(known_boun, pd.DataFrame):
         # initialize output file
         if '.txt' in out_name:
@@ -141,216 +148,228 @@ def outlier_analysis(inp_vcf, region, madThr, cpu, out_dir, out_name, known):
             out_name_bou = out_name + '_boundaries.txt'
         fout_bou = open('%s/%s' %(out_dir, out_name_bou), 'w')
         fout_bou.write('OUTLIER_BOUNDARY\tSAMPLE\tREGION\tBOUNDARY\tSAMPLE_ALLELE_SIZE\tALLELE\n')
-        fout_bou.close()
+        # boundary of each region: the first one if the region is listed more than once
+        boundaries = {}
+        for id, boundary in zip(known_boun['ID'], known_boun['BOUNDARY']):
+            boundaries.setdefault(id, boundary)
     # initialize output file
     fout = open('%s/%s' %(out_dir, out_name), 'w')
     fout.write('REGION\tALLELE\tMEDIAN_ALL\tOUTLIER_SAMPLE\tOUTLIER_SIZE\tOUTLIER_DIST\tOUTLIER_P\tOUTLIER_RATIO\n')
-    # list for sample names
-    sample_names = []
-    # iterate over regions
-    with gzip.open(inp_vcf) as finp:
-        for line in finp:
-            if line.startswith(b'##'):
-                pass
-            elif line.startswith(b'#CHROM'):
-                line = line.rstrip().split()
-                sample_names = [x.decode('utf-8') for x in line[9::]] + ['GRCh38']
-            else:
-                line = line.rstrip().split()
-                chrom, pos, id, ref, format = [x.decode('utf-8') for x in [line[0], line[1], line[2], line[3], line[8]]]
-                # check input file is from treat
-                if format != 'QC;GT;GT_LEN;MOTIF;CN;CN_REF;DP' and format != 'QC;GT;MOTIF;CN;CN_REF;DP':
-                    print('!! VCF was likely not produced with TREAT. Please check.')
-                    sys.exit(1)
-                else:
-                    # check if 1 region need to be processed or all of them
-                    if (isinstance(region, list) == True and id in region) or (isinstance(region, list) == False):
-                        # extract genotypes per sample
-                        if format == 'QC;GT;GT_LEN;MOTIF;CN;CN_REF;DP':
-                            allele_sizes = [x.decode('utf-8').split(';')[2] for x in line[9::]] + [len(ref)]
-                        else:
-                            allele_sizes = [x.decode('utf-8').split(';')[1] for x in line[9::]] + [ref]
-                        # extract list of shorter alleles
-                        short_alleles = [giveAllele(x, 'short') for x in allele_sizes]
-                        # extract list of longer alleles
-                        long_alleles = [giveAllele(x, 'long') for x in allele_sizes]
-                        # extract list of sum of both alleles
-                        join_alleles = [giveAllele(x, 'sum') for x in allele_sizes]
-                        # find outliers for shorter alleles
-                        res_short = scoreOutliers(short_alleles, madThr)
-                        # find outliers for longer alleles
-                        res_long = scoreOutliers(long_alleles, madThr)
-                        # find outliers for sum of both alleles
-                        res_join = scoreOutliers(join_alleles, madThr)
-                        # write to file
-                        writeToFile(res_short, fout, 'SHORT', id, sample_names)
-                        writeToFile(res_long, fout, 'LONG', id, sample_names)
-                        writeToFile(res_join, fout, 'JOIN', id, sample_names)
-                        # check allele size boundaries
-                        short_boundaries = checkBoundary(short_alleles, sample_names, id, known_boun, 'SHORT', out_dir, out_name_bou)
-                        long_boundaries = checkBoundary(long_alleles, sample_names, id, known_boun, 'LONG', out_dir, out_name_bou)
-                        joint_boundaries = checkBoundary(join_alleles, sample_names, id, known_boun, 'JOINT', out_dir, out_name_bou)
-                    else:
-                        pass
+    # sample names, with the reference as last sample
+    sample_names = readVCFheader(inp_vcf)['samples'] + ['GRCh38']
+    # score chunks of regions
+    score_fun = partial(outlierChunk, madThr = madThr, sample_names = sample_names, boundaries = boundaries)
+    for outlier_lines, boundary_df in mapChunks(score_fun, inp_vcf, region, cpu, chunk_size):
+        fout.write(outlier_lines)
+        if fout_bou is not None and boundary_df.shape[0] >0:
+            boundary_df.to_csv(fout_bou, header=False, index=False, sep="\t")
     fout.close()
+    if fout_bou is not None:
+        fout_bou.close()
     return '** Analysis completed. Cheers!'
 
-# Function to check allele size boundaries
-def checkBoundary(alleles, sample_names, id, known_boun, allele_type, out_dir, out_name_bou):
-    temp_bound = known_boun[known_boun['ID'] == id]
-    if temp_bound.shape[0] >0:
-        boundary_value = temp_bound['BOUNDARY'].iloc[0]
-        greater_than_bound = [True if x >= boundary_value else False for x in alleles]
-    else:
-        greater_than_bound = ['NA' for x in alleles]
-        boundary_value = 'NA'
-    df = pd.DataFrame(greater_than_bound, columns = ['OUTLIER'])
-    df['SAMPLE'] = sample_names
-    df['ID'] = id
-    df['BOUNDARY'] = boundary_value
-    df['ALLELE_SIZE'] = alleles
-    df['ALLELE'] = allele_type
-    df.to_csv('%s/%s' %(out_dir, out_name_bou), mode = 'a', header=False, index=False, sep="\t")
-    return df
+# Function to read the records of the regions to analyse in chunks
+def regionChunks(inp_vcf, region, chunk_size):
+    region = set(region) if isinstance(region, list) else None
+    chunk = []
+    with gzip.open(inp_vcf, 'rt') as finp:
+        for line in finp:
+            if line.startswith('#'):
+                continue
+            # check if 1 region need to be processed or all of them
+            if region is None or line.split('\t', 3)[2] in region:
+                chunk.append(line)
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+    if len(chunk) >0:
+        yield chunk
 
-# Function to write outliers to file
-def writeToFile(res, fout, type, id, sample_names):
-    # check if there are outliers, otherwise skip
-    if len(res[1]) >0:
-        for i in range(len(res[1])):
-            fout.write('%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n' %(id, type, res[0], sample_names[res[1][i]], res[-2][i], res[-3][i], res[2][i], res[-1][i]))
-    else:
-        pass
+# Function to apply a function to the chunks of regions, in parallel if more cpus are given: results are returned in the order of the regions
+def mapChunks(score_fun, inp_vcf, region, cpu, chunk_size = None):
+    # by default, chunks have about 2 million genotypes
+    if chunk_size is None:
+        chunk_size = max(1, min(1000, 2000000 // max(1, len(readVCFheader(inp_vcf)['samples']))))
+    pool = multiprocessing.Pool(processes=cpu) if cpu >1 else None
+    results = pool.imap(score_fun, regionChunks(inp_vcf, region, chunk_size)) if pool is not None else map(score_fun, regionChunks(inp_vcf, region, chunk_size))
+    for res in results:
+        # check input file is from treat
+        if res is None:
+            print('!! VCF was likely not produced with TREAT. Please check.')
+            if pool is not None:
+                pool.terminate()
+            sys.exit(1)
+        yield res
+    if pool is not None:
+        pool.close()
+
+# Function to extract the allele sizes of a chunk of regions: matrix of regions x samples x (shorter, longer, sum of both alleles), with the reference as last sample if requested
+def alleleMatrix(records, reference = True):
+    alleles = []
+    for rec in records:
+        if rec[8] == 'QC;GT;GT_LEN;MOTIF;CN;CN_REF;DP':
+            allele_sizes = [x.split(';')[2] for x in rec[9:]] + ([len(rec[3])] if reference else [])
+        else:
+            allele_sizes = [x.split(';')[1] for x in rec[9:]] + ([rec[3]] if reference else [])
+        alleles.append([alleleSizes(x) for x in allele_sizes])
+    return np.array(alleles, dtype = float).reshape(len(records), len(records[0]) - 9 + int(reference), 3)
+
+# Function to score outliers in a chunk of regions: returns the lines of outliers and the table of allele size boundaries
+def outlierChunk(lines, madThr, sample_names, boundaries):
+    records = [line.rstrip().split() for line in lines]
+    if any([rec[8] not in TREAT_FORMATS for rec in records]):
+        return None
+    ids = [rec[2] for rec in records]
+    # extract genotypes per sample: matrix of regions x samples x (shorter, longer, sum of both alleles)
+    alleles = alleleMatrix(records)
+    scores = [scoreOutliers(alleles[:, :, k], madThr) for k in range(3)]
+    # write outliers by region, for shorter, longer and sum of alleles
+    outlier_lines = []
+    for i in range(len(ids)):
+        for k, type in enumerate(['SHORT', 'LONG', 'JOIN']):
+            median_alleles, mahalanobis_dist, p_values_corrected, ratios = scores[k]
+            for j in np.where(p_values_corrected[i] < 0.05)[0]:
+                outlier_lines.append('%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n' %(ids[i], type, median_alleles[i], sample_names[j], alleles[i, j, k], mahalanobis_dist[i, j], p_values_corrected[i, j], ratios[i, j]))
+    # check allele size boundaries
+    boundary_rows = []
+    if boundaries is not None:
+        for i in range(len(ids)):
+            boundary_value = boundaries[ids[i]] if ids[i] in boundaries.keys() else 'NA'
+            for k, type in enumerate(['SHORT', 'LONG', 'JOINT']):
+                for j in range(len(sample_names)):
+                    greater_than_bound = 'NA' if boundary_value == 'NA' else (True if alleles[i, j, k] >= boundary_value else False)
+                    boundary_rows.append([greater_than_bound, sample_names[j], ids[i], boundary_value, alleles[i, j, k], type])
+    boundary_df = pd.DataFrame(boundary_rows, columns = ['OUTLIER', 'SAMPLE', 'ID', 'BOUNDARY', 'ALLELE_SIZE', 'ALLELE'])
+    return ''.join(outlier_lines), boundary_df
 
-# Function for modified version of zscore
+# Function for modified version of zscore, on a matrix of regions x samples
 def scoreOutliers(alleles, madThr):
-    try:
-        # compute mean and covariance
-        #mean_alleles = np.nanmean(alleles)
-        #variance = np.nanvar(alleles, ddof=1)
-        median_alleles = np.nanmedian(alleles)
-        mad = np.nanmedian(np.abs(alleles - np.nanmedian(alleles))) + median_alleles*0.10
-        # calculate the Mahalanobis distance
-        #mahalanobis_dist = np.abs(alleles - mean_alleles) / np.sqrt(variance)
-        mahalanobis_dist = np.abs(alleles - median_alleles) / (mad*madThr)
-        # remove NaN values from mahalanobis_dist for further calculations
-        valid_idx = ~np.isnan(mahalanobis_dist)
-        valid_mahalanobis_dist = mahalanobis_dist[valid_idx]
-        # compute p-values using chi-squared distribution
-        p_values = 1 - chi2.cdf(mahalanobis_dist**2, df=1)
-        # correct p-values using FDR method
-        _, p_values_corrected_valid = fdrcorrection(p_values[valid_idx])
-        # make sure to have all pvalues in the right place for every sample
-        p_values_corrected = np.full(p_values.shape, np.nan)
-        p_values_corrected[valid_idx] = p_values_corrected_valid
-        # also do the ratio between the median value and the observed value
-        ratios = alleles/median_alleles
-        # identify outliers
-        outliers = np.where(p_values_corrected < 0.05)[0]
-        outliers_p = p_values_corrected[outliers]
-        outliers_dist = mahalanobis_dist[outliers]
-        outliers_alleles = np.array(alleles)[outliers]
-        outliers_ratios = np.array(ratios)[outliers]
-        return median_alleles, outliers, outliers_p, outliers_dist, outliers_alleles, outliers_ratios
-    except:
-        return 'NA', 'NA', 'NA', 'NA', 'NA', 'NA'
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category = RuntimeWarning)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            # median and median absolute deviation of each region
+            median_alleles = np.nanmedian(alleles, axis = 1)
+            mad = np.nanmedian(np.abs(alleles - median_alleles[:, None]), axis = 1) + median_alleles*0.10
+            # calculate the Mahalanobis distance
+            mahalanobis_dist = np.abs(alleles - median_alleles[:, None]) / (mad*madThr)[:, None]
+            # compute p-values using chi-squared distribution
+            p_values = 1 - chi2.cdf(mahalanobis_dist**2, df=1)
+            # correct p-values using FDR method, within each region
+            p_values_corrected = fdrCorrection(p_values)
+            # also do the ratio between the median value and the observed value
+            ratios = alleles / median_alleles[:, None]
+    return median_alleles, mahalanobis_dist, p_values_corrected, ratios
 
-# Function that return the shorter or longer allele given a form of Allele1|Allele2
-def giveAllele(allele, type):
+# Function for Benjamini-Hochberg correction of each row of a matrix of p-values: missing values are excluded
+def fdrCorrection(p_values):
+    valid = ~np.isnan(p_values)
+    n_valid = valid.sum(axis = 1)
+    # missing values are sorted last
+    order = np.argsort(np.where(valid, p_values, np.inf), axis = 1, kind = 'mergesort')
+    p_sorted = np.take_along_axis(p_values, order, axis = 1)
+    ecdffactor = np.arange(1, p_values.shape[1] + 1)[None, :] / n_valid[:, None].astype(float)
+    corrected = p_sorted / ecdffactor
+    corrected[np.isnan(corrected)] = np.inf
+    corrected = np.minimum.accumulate(corrected[:, ::-1], axis = 1)[:, ::-1]
+    corrected[corrected >1] = 1
+    p_values_corrected = np.full(p_values.shape, np.nan)
+    np.put_along_axis(p_values_corrected, order, corrected, axis = 1)
+    p_values_corrected[~valid] = np.nan
+    return p_values_corrected
+
+# Function that return the shorter and longer allele, and the sum of both, given a form of Allele1|Allele2
+def alleleSizes(allele):
     try:
         allele_list = [float(x) for x in str(allele).split('|')]
-        if type == 'short':
-            return min(allele_list)
-        elif type == 'long':
-            return max(allele_list)
-        elif type == 'sum':
-            return(sum(allele_list))
+        return min(allele_list), max(allele_list), sum(allele_list)
     except:
-        return np.nan
+        return np.nan, np.nan, np.nan
 
-# Function for case-control analysis
-def casecontrol_analysis(inp_vcf, region, labels_dic, cpu, out_dir, out_name):
+# Function for case-control analysis: regions are read in chunks, and the chunks are tested in parallel
+def casecontrol_analysis(inp_vcf, region, labels_dic, cpu, out_dir, out_name, chunk_size = None):
     # initialize output file
     fout = open('%s/%s' %(out_dir, out_name), 'w')
     fout.write('REGION\tBETA_SHORT\tSE_SHORT\tLOW_CI_SHORT\tUP_CI_SHORT\tP_SHORT\tBETA_LONG\tSE_LONG\tLOW_CI_LONG\tUP_CI_LONG\tP_LONG\tBETA_JOIN\tSE_JOIN\tLOW_CI_JOIN\tUP_CI_JOIN\tP_JOIN\n')
+    # sample names and check if we have the phenotype for these
+    sample_names = readVCFheader(inp_vcf)['samples']
+    check_values_in_dict(sample_names, labels_dic)
+    # index of the samples with a label and the labels, computed once for all regions
+    sample_index, labels = labelVector(labels_dic, sample_names)
+    # test chunks of regions
+    score_fun = partial(associationChunk, sample_index = sample_index, labels = labels)
+    for comb_df in mapChunks(score_fun, inp_vcf, region, cpu, chunk_size):
+        comb_df.to_csv(fout, header = False, index = False, sep = "\t")
     fout.close()
-    # list for sample names
-    sample_names = []
-    # iterate over regions
-    with gzip.open(inp_vcf) as finp:
-        for line in finp:
-            if line.startswith(b'##'):
-                pass
-            elif line.startswith(b'#CHROM'):
-                line = line.rstrip().split()
-                sample_names = [x.decode('utf-8') for x in line[9::]]
-                # check if we have the phenotype for these
-                check_values_in_dict(sample_names, labels_dic)
-            else:
-                line = line.rstrip().split()
-                chrom, pos, id, ref, format = [x.decode('utf-8') for x in [line[0], line[1], line[2], line[3], line[8]]]
-                # check input file is from treat
-                if format != 'QC;GT;GT_LEN;MOTIF;CN;CN_REF;DP' and format != 'QC;GT;MOTIF;CN;CN_REF;DP':
-                    print('!! VCF was likely not produced with TREAT. Please check.')
-                    sys.exit(1)
-                else:
-                    # check if 1 region need to be processed or all of them
-                    if (isinstance(region, list) == True and id in region) or (isinstance(region, list) == False):
-                        # extract genotypes per sample
-                        if format == 'QC;GT;GT_LEN;MOTIF;CN;CN_REF;DP':
-                            allele_sizes = [x.decode('utf-8').split(';')[2] for x in line[9::]] + [len(ref)]
-                        else:
-                            allele_sizes = [x.decode('utf-8').split(';')[1] for x in line[9::]] + [ref]
-                        # extract list of shorter alleles
-                        short_alleles = [giveAllele(x, 'short') for x in allele_sizes]
-                        # extract list of longer alleles
-                        long_alleles = [giveAllele(x, 'long') for x in allele_sizes]
-                        # extract list of sum of both alleles
-                        join_alleles = [giveAllele(x, 'sum') for x in allele_sizes]
-                        # combine in a dataframe
-                        df_alleles = createDF(labels_dic, sample_names, short_alleles, long_alleles, join_alleles)                        
-                        # run association for short
-                        res_short = logit(df_alleles, 'Short')
-                        # run association for long
-                        res_long = logit(df_alleles, 'Long')
-                        # run association for join
-                        res_join = logit(df_alleles, 'Join')
-                        # combine results
-                        comb_res = [[id] + res_short + res_long + res_join]
-                        comb_df = pd.DataFrame(comb_res, columns = ['REGION', 'BETA_SHORT', 'SE_SHORT', 'LOW_CI_SHORT', 'UP_CI_SHORT', 'P_SHORT', 'BETA_LONG', 'SE_LONG', 'LOW_CI_LONG', 'UP_CI_LONG', 'P_LONG', 'BETA_JOIN', 'SE_JOIN', 'LOW_CI_JOIN', 'UP_CI_JOIN', 'P_JOIN'])
-                        # append to file
-                        comb_df.to_csv('%s/%s' %(out_dir, out_name), mode = 'a', header = False, index = False, sep = "\t")
-                    else:
-                        pass
     return'** Analysis completed. Cheers!'
 
-# Function to do logistic regression
-def logit(df_alleles, type):
-    try:
-        # short allele
-        model = Logit.from_formula('Label ~ %s' %(type), data = df_alleles)
-        result = model.fit(disp=0)
-        beta = result.params[1]
-        se = result.bse[1]
-        lowci = result.conf_int()[0][1]
-        upci = result.conf_int()[1][1]
-        pval = result.pvalues[1]
-        return [beta, se, lowci, upci, pval]
-    except:
-        return ['NA', 'NA', 'NA', 'NA', 'NA']
-
-# Function to create dataframe with values of interest for the logistic regression
-def createDF(labels_dic, sample_names, short_alleles, long_alleles, join_alleles):
-    temp = []
+# Function to create the vector of labels, and the index of the corresponding samples in the VCF
+def labelVector(labels_dic, sample_names):
+    sample_position = {}
+    for i, sample in enumerate(sample_names):
+        sample_position.setdefault(sample, i)
+    sample_index = []; labels = []
     for label, samples in labels_dic.items():
         for sample in samples:
-            if sample in sample_names:
-                temp_short = short_alleles[sample_names.index(sample)]
-                temp_long = long_alleles[sample_names.index(sample)]
-                temp_join = join_alleles[sample_names.index(sample)]
-                temp.append({'Sample' : sample, 'Label' : int(label), 'Short' : temp_short, 'Long' : temp_long, 'Join' : temp_join})
-    df = pd.DataFrame(temp)
-    return(df)
+            if sample in sample_position.keys():
+                sample_index.append(sample_position[sample]); labels.append(int(label))
+    return np.array(sample_index, dtype = int), np.array(labels, dtype = float)
+
+# Function to test the association of allele sizes and labels in a chunk of regions
+def associationChunk(lines, sample_index, labels):
+    records = [line.rstrip().split() for line in lines]
+    if any([rec[8] not in TREAT_FORMATS for rec in records]):
+        return None
+    # extract genotypes of the samples with a label
+    alleles = alleleMatrix(records, reference = False)[:, sample_index, :]
+    # run association for short, long and join
+    comb_res = [[rec[2]] for rec in records]
+    for k in range(3):
+        res = logitMatrix(alleles[:, :, k], labels)
+        for i in range(len(records)):
+            comb_res[i].extend(res[i])
+    comb_df = pd.DataFrame(comb_res, columns = ['REGION', 'BETA_SHORT', 'SE_SHORT', 'LOW_CI_SHORT', 'UP_CI_SHORT', 'P_SHORT', 'BETA_LONG', 'SE_LONG', 'LOW_CI_LONG', 'UP_CI_LONG', 'P_LONG', 'BETA_JOIN', 'SE_JOIN', 'LOW_CI_JOIN', 'UP_CI_JOIN', 'P_JOIN'])
+    return comb_df
+
+# Function to do logistic regression of the labels on the allele sizes of each region, for a matrix of regions x samples
+# Newton-Raphson iterations are done on all regions at once, samples with missing allele sizes are excluded
+def logitMatrix(alleles, labels, maxiter = 35, tol = 1e-8):
+    valid = ~np.isnan(alleles)
+    x = np.where(valid, alleles, 0.0)
+    y = labels[None, :]
+    params = np.zeros((alleles.shape[0], 2))
+    converged = np.zeros(alleles.shape[0], dtype = bool)
+    failed = np.zeros(alleles.shape[0], dtype = bool)
+    with np.errstate(divide = 'ignore', invalid = 'ignore', over = 'ignore'):
+        for iteration in range(maxiter + 1):
+            p = expit(params[:, [0]] + params[:, [1]] * x)
+            # perfect prediction: parameters are not identified
+            failed |= np.all((np.abs(p - y) <= 1e-8) | ~valid, axis = 1)
+            active = ~(converged | failed)
+            if iteration == maxiter or not active.any():
+                break
+            # score and hessian
+            score_0, score_1, h_00, h_01, h_11 = logitDerivatives(x, y, p, valid)
+            det = h_00 * h_11 - h_01**2
+            failed |= active & ~(np.abs(det) > 0)
+            update = active & ~failed
+            step = np.column_stack([(h_11 * score_0 - h_01 * score_1) / det, (h_00 * score_1 - h_01 * score_0) / det])
+            params[update] += step[update]
+            converged |= update & np.all(np.abs(step) < tol, axis = 1)
+        # standard error from the inverse of the hessian, and Wald test
+        score_0, score_1, h_00, h_01, h_11 = logitDerivatives(x, y, p, valid)
+        beta = params[:, 1]
+        se = np.sqrt(h_00 / (h_00 * h_11 - h_01**2))
+        q = norm.ppf(0.975)
+        pval = 2 * norm.sf(np.abs(beta / se))
+    res = np.column_stack([beta, se, beta - q * se, beta + q * se, pval])
+    failed |= ~np.all(np.isfinite(res), axis = 1)
+    return [['NA', 'NA', 'NA', 'NA', 'NA'] if failed[i] else list(res[i]) for i in range(res.shape[0])]
+
+# Function for the score and the hessian (with changed sign) of the logistic likelihood of each region
+def logitDerivatives(x, y, p, valid):
+    w = np.where(valid, p * (1 - p), 0.0)
+    r = np.where(valid, y - p, 0.0)
+    return r.sum(axis = 1), (r * x).sum(axis = 1), w.sum(axis = 1), (w * x).sum(axis = 1), (w * x**2).sum(axis = 1)
 
 # Function to check overlap between a list and a dictionary value
 def check_values_in_dict(sample_names, labels_dic):
@@ -365,7 +384,7 @@ def check_values_in_dict(sample_names, labels_dic):
 # Main
 ###########################################################
 # Parse input arguments and set up for running
-inp_vcf, analysis, labels, out_dir, out_name, region, madThr, cpu, known = args.vcf, args.analysis, args.labels, args.outDir, args.outName, args.region, int(args.madThr), args.cpu, args.known
+inp_vcf, analysis, labels, out_dir, out_name, region, madThr, cpu, known = args.vcf, args.analysis, args.labels, args.outDir, args.outName, args.region, int(args.madThr), int(args.cpu), args.known
 if analysis == 'case-control' and labels == 'None':
     print('!! Case-control analysis was chosen, but no case-control labels were given. Exiting.\n')
     sys.exit(1)
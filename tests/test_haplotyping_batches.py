@@ -0,0 +1,51 @@
+# Tests of the scheduling of the genotyping tasks: the VCF records are written while the batches complete
+import os
+import sys
+import random
+import pytest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin'))
+from functions_read_based import batchTasks, completeRegions
+from functions_common import regionKey
+
+# Tasks of samples x regions as in haplotyping_steps: sample, range of reads, range of duplicated reads, clipped reads, region
+def genotypingTasks(n_samples, n_regions):
+    random.seed(n_samples)
+    regions = ['chr%s:%s-%s' %(1 + i % 22, 1000 * i, 1000 * i + 50) for i in range(n_regions)]
+    tasks = []; start = 0
+    for s in range(n_samples):
+        for r in regions:
+            n_reads = random.randint(5, 50)
+            tasks.append(['sample%s' %(s), (start, start + n_reads), (0, 0), 0, r])
+            start += n_reads
+    return tasks
+
+# Replay the writer of haplotyping_steps with the batches completing in submission order: batch after which the first record is written, and largest number of regions waiting
+def replayWriter(tasks, batches):
+    region_order = sorted(set([x[4] for x in tasks]), key = regionKey)
+    n_expected = {}
+    for x in tasks:
+        n_expected[x[4]] = n_expected.get(x[4], 0) + 1
+    samples = sorted(set([x[0] for x in tasks]))
+    pending = {}; next_region = 0; first_write = None; max_pending = 0
+    for b, batch in enumerate(batches):
+        for i, task in batch:
+            pending.setdefault(task[4], {})[samples.index(task[0])] = [task[4]] * 10
+        max_pending = max(max_pending, len(pending))
+        records, next_region = completeRegions(pending, region_order, n_expected, next_region, len(samples))
+        if len(records) >0 and first_write is None:
+            first_write = b
+    assert next_region == len(region_order) and len(pending) == 0
+    return first_write, max_pending, len(region_order)
+
+@pytest.mark.parametrize('n_samples, n_regions, n_cpu', [[1000, 50, 16], [1, 20000, 32], [30, 5000, 32], [5, 3, 4]])
+def test_records_written_before_last_batch(n_samples, n_regions, n_cpu):
+    tasks = genotypingTasks(n_samples, n_regions)
+    batches = batchTasks(tasks, n_cpu)
+    # each task is in one batch
+    assert sorted([i for batch in batches for i, task in batch]) == list(range(len(tasks)))
+    first_write, max_pending, n_regions = replayWriter(tasks, batches)
+    if n_regions >10:
+        assert first_write < len(batches) // 4
+        assert max_pending <= n_regions // 4
+    else:
+        assert first_write is not None
@@ -0,0 +1,80 @@
+# Tests of the merge of VCF files: streaming merge of unsorted files, duplicated and missing regions, tree and per-chromosome merges
+import os
+import sys
+import gzip
+import subprocess
+import pysam
+
+BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin')
+
+HEADER = ['##fileformat=VCFv4.2',
+          '##FORMAT=<ID=QC,Number=1,Type=String,Description="Quality summary">',
+          '##FORMAT=<ID=GT,Number=2,Type=String,Description="Phased size">',
+          '##FORMAT=<ID=MOTIF,Number=2,Type=String,Description="Phased motif">',
+          '##FORMAT=<ID=CN,Number=2,Type=String,Description="Phased copies">',
+          '##FORMAT=<ID=CN_REF,Number=2,Type=String,Description="Phased reference copies">',
+          '##FORMAT=<ID=DP,Number=1,Type=String,Description="Phased depth">',
+          '##contig=<ID=chr1,length=1000>',
+          '##contig=<ID=chr2,length=1000>']
+NA_GENOTYPE = 'NA;NA|NA;NA|NA;NA|NA;NA|NA;NA|NA'
+
+# Record of a region with the genotype of the sample
+def record(region, size):
+    chrom, interval = region.split(':')
+    return [chrom, interval.split('-')[0], region, '60', '.', '.', 'PASS', 'CAG;20', 'QC;GT;MOTIF;CN;CN_REF;DP', 'PASS_RSP;%s|%s;CAG|CAG;20|20;20|20;5|5' %(size, size)]
+
+# Write a VCF file of a sample with the records in the order given
+def writeVCF(path, sample, records, compressed = False):
+    lines = HEADER + ['\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT', sample])] + ['\t'.join(x) for x in records]
+    text = '\n'.join(lines) + '\n'
+    if compressed:
+        with pysam.BGZFile(path, 'wb') as fout:
+            fout.write(text.encode())
+        pysam.tabix_index(path, preset = 'vcf', force = True)
+    else:
+        with open(path, 'w') as fout:
+            fout.write(text)
+    return path
+
+# Merge VCF files with the script, and return the lines of the merged VCF
+def runMerge(vcf, out_dir, cpu, fan_in):
+    subprocess.run([sys.executable, os.path.join(BIN, 'merge_vcf.py'), ','.join(vcf), out_dir, 'merged.vcf', str(cpu), str(fan_in)], check = True, stdout = subprocess.DEVNULL)
+    with gzip.open('%s/merged.vcf.gz' %(out_dir), 'rt') as finp:
+        return finp.read().splitlines()
+
+# Samples: the first is not sorted and has a duplicated region, the second misses a region
+def sampleVCFs(tmp_path, compressed = False):
+    suffix = '.vcf.gz' if compressed else '.vcf'
+    regions = ['chr1:100-160', 'chr1:500-560', 'chr2:100-150']
+    vcf = []
+    if not compressed:
+        vcf.append(writeVCF(str(tmp_path / ('s0' + suffix)), 's0', [record('chr2:100-150', 60), record('chr1:500-560', 61), record('chr1:100-160', 62), record('chr1:100-160', 99)]))
+    vcf.append(writeVCF(str(tmp_path / ('s1' + suffix)), 's1', [record('chr1:100-160', 63), record('chr1:500-560', 64)], compressed))
+    for i in range(2, 6):
+        vcf.append(writeVCF(str(tmp_path / ('s%s%s' %(i, suffix))), 's%s' %(i), [record(r, 70 + i) for r in regions], compressed))
+    return vcf
+
+def test_merge_unsorted_duplicated_and_missing(tmp_path):
+    lines = runMerge(sampleVCFs(tmp_path), str(tmp_path / 'flat'), 1, 0)
+    assert lines[-4].split('\t')[9:] == ['s%s' %(i) for i in range(6)]
+    records = [x.split('\t') for x in lines[-3:]]
+    # regions in coordinate order
+    assert [x[2] for x in records] == ['chr1:100-160', 'chr1:500-560', 'chr2:100-150']
+    # the first record of a duplicated region is kept
+    assert records[0][9] == 'PASS_RSP;62|62;CAG|CAG;20|20;20|20;5|5'
+    # samples without a region get the NA genotype
+    assert records[2][10] == NA_GENOTYPE
+    assert records[1][10] == 'PASS_RSP;64|64;CAG|CAG;20|20;20|20;5|5'
+    assert records[2][11:] == ['PASS_RSP;%s|%s;CAG|CAG;20|20;20|20;5|5' %(70 + i, 70 + i) for i in range(2, 6)]
+
+def test_merge_tree_as_flat(tmp_path):
+    vcf = sampleVCFs(tmp_path)
+    flat = runMerge(vcf, str(tmp_path / 'flat'), 1, 0)
+    assert runMerge(vcf, str(tmp_path / 'tree2'), 2, 2) == flat
+    assert runMerge(vcf, str(tmp_path / 'tree3'), 2, 3) == flat
+
+def test_merge_by_chromosome_as_stream(tmp_path):
+    vcf = sampleVCFs(tmp_path, compressed = True)
+    stream = runMerge(vcf, str(tmp_path / 'stream'), 1, 0)
+    assert runMerge(vcf, str(tmp_path / 'chromosomes'), 2, 0) == stream
+    assert len([x for x in stream if not x.startswith('#')]) == 3
@@ -0,0 +1,37 @@
+# Tests of motif finding with pytrf: repeats have the same fields and counts whatever the installed version of pytrf
+import os
+import sys
+import pytest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin'))
+from functions_common import ATR_FIELDS, findRepeats, repeatLists
+from functions_read_based import pytrfAnnotation
+
+# Sequences with a repeat: perfect, with a substitution and with an insertion, and the expected start, end, matches, substitutions, insertions and deletions
+REPEATS = [['CAG' * 20, [1, 60, 60, 0, 0, 0]],
+           ['CAG' * 10 + 'CAA' + 'CAG' * 10, [1, 63, 62, 1, 0, 0]],
+           ['CAG' * 10 + 'CAAG' + 'CAG' * 10, [1, 64, 63, 0, 1, 0]]]
+
+@pytest.mark.parametrize('seq, expected', REPEATS)
+def test_repeat_counts(seq, expected):
+    repeats = findRepeats('sequence', seq, min_motif_size = 1, max_motif_size = 100)
+    assert len(repeats) == 1
+    atr = repeats[0]
+    assert set(ATR_FIELDS) <= set(atr.keys())
+    assert atr['motif'] == 'CAG' and atr['type'] == 3
+    # counts are on the whole repeat, seed included
+    assert [atr[x] for x in ['start', 'end', 'matches', 'substitutions', 'insertions', 'deletions']] == expected
+    assert atr['identity'] == pytest.approx(100 * expected[2] / sum(expected[2:]))
+
+def test_repeat_lists_in_pytrf_order():
+    seq = REPEATS[1][0]
+    atr = findRepeats('sequence', seq, min_motif_size = 1, max_motif_size = 100)[0]
+    assert repeatLists('sequence', seq, min_motif_size = 1, max_motif_size = 100) == [[atr[x] for x in ATR_FIELDS]]
+    # keywords of the fallback of the assembly-based analysis
+    assert len(repeatLists('sequence', seq, min_motif_size = 1, max_motif_size = 100, min_seed_repeat = 2, min_seed_length = 8)) == 1
+
+def test_pytrf_annotation():
+    # fields as in the -ngs output of trf: start, end, period, copies, consensus size, percent matches, percent indels, score
+    assert [x[:8] + [x[13]] for x in pytrfAnnotation(REPEATS[0][0].lower())] == [['1', '60', '3', '20.0', '3', '100', '0', '120', 'CAG']]
+    assert [x[:8] + [x[13]] for x in pytrfAnnotation(REPEATS[1][0])] == [['1', '63', '3', '21.0', '3', '98', '0', '117', 'CAG']]
+    # repeats below the minimum score of trf are not kept
+    assert pytrfAnnotation('CAGCAGCAGCAG') == []
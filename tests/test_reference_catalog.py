@@ -0,0 +1,63 @@
+# Tests of the reference catalog: the read-based analysis gives the same VCF with and without the catalog
+import os
+import sys
+import gzip
+import random
+import subprocess
+import pysam
+import pytest
+
+BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin')
+
+# Reference with two repeats, and the regions around them
+def writeReference(tmp_path):
+    random.seed(1)
+    seq = [random.choice('ACGT') for i in range(3000)]
+    seq[1000:1060] = list('CAG' * 20)
+    seq[2000:2050] = list('AAAAG' * 10)
+    seq = ''.join(seq)
+    ref = str(tmp_path / 'reference.fa')
+    with open(ref, 'w') as fout:
+        fout.write('>chr1\n%s\n' %(seq))
+    pysam.faidx(ref)
+    bed = str(tmp_path / 'regions.bed')
+    with open(bed, 'w') as fout:
+        fout.write('chr1\t1000\t1060\nchr1\t2000\t2050\n')
+    return seq, ref, bed
+
+# Sample with 3 more copies of the first repeat on both alleles: supplementary alignments have no sequence size
+def writeBam(seq, tmp_path, supplementary):
+    bam = str(tmp_path / 'sample.bam')
+    header = {'HD' : {'VN' : '1.6', 'SO' : 'coordinate'}, 'SQ' : [{'SN' : 'chr1', 'LN' : len(seq)}]}
+    with pysam.AlignmentFile(bam, 'wb', header = header) as fout:
+        for i in range(12):
+            read = pysam.AlignedSegment()
+            read.query_name = 'read%s' %(i)
+            read.reference_id = 0; read.reference_start = 700; read.mapping_quality = 60
+            read.query_sequence = seq[700:1050] + 'CAGCAGCAG' + seq[1050:2300]; read.cigartuples = [(0, 350), (1, 9), (0, 1250)]
+            read.flag = 2048 if (supplementary and i == 11) else 0
+            fout.write(read)
+    pysam.index(bam)
+    return bam
+
+# Run a script of TREAT
+def runScript(script, arguments):
+    subprocess.run([sys.executable, os.path.join(BIN, script)] + arguments, check = True, stdout = subprocess.DEVNULL)
+
+# Records of a VCF file
+def vcfRecords(vcf):
+    with gzip.open(vcf, 'rt') as finp:
+        return [line for line in finp if not line.startswith('#')]
+
+@pytest.mark.parametrize('supplementary', [False, True])
+def test_catalog_gives_same_vcf(tmp_path, supplementary):
+    seq, ref, bed = writeReference(tmp_path)
+    bam = writeBam(seq, tmp_path, supplementary)
+    runScript('reference_catalog.py', [bed, ref, str(tmp_path / 'catalog'), 'catalog.json.gz', '10', '2', 'pytrf', 'None'])
+    vcf = {}
+    for run, catalog in [['direct', 'None'], ['with_catalog', str(tmp_path / 'catalog' / 'catalog.json.gz')]]:
+        out_dir = str(tmp_path / run)
+        runScript('read_based.py', [bam, bed, out_dir, ref, '10', '2', 'None', 'None', 'None', '2', '5', 'False', 'pytrf', 'None', 'txt', 'False', catalog])
+        vcf[run] = vcfRecords('%s/sample.vcf.gz' %(out_dir))
+    assert len(vcf['direct']) == 2
+    assert vcf['direct'] == vcf['with_catalog']
@@ -0,0 +1,33 @@
+# Tests of the tables of reads: text and parquet tables give back the same columns
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin'))
+from functions_common import writeTable, readTable
+
+pytest.importorskip('pyarrow')
+
+# A small table of reads as written by the haplotyping
+def readsTable():
+    return pd.DataFrame({'READ_NAME' : ['m1/ccs', 'm2/ccs', 'm3/ccs', 'm4/ccs'],
+                         'HAPLOTAG' : [1, 0, 1, 0],
+                         'HAPLOTYPE' : [1.0, np.nan, 2.0, 2.0],
+                         'REGION' : ['chr4_39348424_39348483', 'chr4_39348424_39348483', 'chr1_100_200', 'chr1_100_200'],
+                         'SAMPLE_NAME' : ['sampleA', 'sampleB', 'sampleA', 'sampleB'],
+                         'LEN_SEQUENCE_FOR_TRF' : [59, 61, 100, 101],
+                         'CONSENSUS_MOTIF' : ['AAAAG', 'NA', 'CAG', 'CAG'],
+                         'type' : ['reads', 'reads', 'reads', 'reads']})
+
+def test_text_and_parquet_tables_match(tmp_path):
+    df = readsTable()
+    txt = readTable(writeTable(df, str(tmp_path / 'raw'), 'txt'))
+    parquet = readTable(writeTable(df, str(tmp_path / 'raw'), 'parquet'))
+    # parquet tables are sorted by region and sample
+    txt = txt.sort_values('READ_NAME').reset_index(drop = True)
+    parquet = parquet.sort_values('READ_NAME').reset_index(drop = True)
+    pd.testing.assert_frame_equal(txt, parquet)
+    assert parquet['HAPLOTAG'].dtype == np.int64
+    assert list(parquet['HAPLOTAG'] - 1) == [0, -1, 0, -1]
+    assert np.isnan(parquet['HAPLOTYPE'][1])
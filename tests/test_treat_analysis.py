@@ -0,0 +1,97 @@
+# Tests of the case-control analysis: logistic regression of the labels on the allele sizes, with NA for the regions that cannot be fitted
+import os
+import sys
+import gzip
+import random
+import subprocess
+import numpy as np
+import pandas as pd
+import pytest
+
+BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin')
+
+HEADER = ['##fileformat=VCFv4.2',
+          '##FORMAT=<ID=QC,Number=1,Type=String,Description="Quality summary">',
+          '##FORMAT=<ID=GT,Number=2,Type=String,Description="Phased size">',
+          '##FORMAT=<ID=MOTIF,Number=2,Type=String,Description="Phased motif">',
+          '##FORMAT=<ID=CN,Number=2,Type=String,Description="Phased copies">',
+          '##FORMAT=<ID=CN_REF,Number=2,Type=String,Description="Phased reference copies">',
+          '##FORMAT=<ID=DP,Number=1,Type=String,Description="Phased depth">']
+N_SAMPLES = 20
+LABELS = [1 if i < N_SAMPLES // 2 else 0 for i in range(N_SAMPLES)]
+
+# Allele sizes of the samples in each region: None is a missing genotype
+def regionAlleles():
+    random.seed(3)
+    alleles = {}
+    # sizes larger in cases, with overlap between cases and controls
+    alleles['chr1:100-160'] = [[random.randint(55, 75) + 5 * LABELS[i], random.randint(55, 75)] for i in range(N_SAMPLES)]
+    # same, with some missing genotypes
+    alleles['chr1:500-560'] = [None if i % 7 == 0 else [random.randint(55, 75) + 5 * LABELS[i], random.randint(55, 75)] for i in range(N_SAMPLES)]
+    # same size in all samples
+    alleles['chr1:900-960'] = [[60, 60] for i in range(N_SAMPLES)]
+    # sizes separate cases and controls perfectly
+    alleles['chr2:100-160'] = [[80, 80] if LABELS[i] == 1 else [60, 60] for i in range(N_SAMPLES)]
+    # all genotypes missing
+    alleles['chr2:500-560'] = [None for i in range(N_SAMPLES)]
+    return alleles
+
+def genotype(sizes):
+    if sizes is None:
+        return 'NA;NA|NA;NA|NA;NA|NA;NA|NA;NA|NA'
+    return 'PASS_RSP;%s|%s;CAG|CAG;20|20;20|20;5|5' %(sizes[0], sizes[1])
+
+# Write the VCF and the labels, run the case-control analysis and read its output
+def runCaseControl(tmp_path, cpu):
+    samples = ['s%s' %(i) for i in range(N_SAMPLES)]
+    vcf = str(tmp_path / 'samples.vcf.gz')
+    with gzip.open(vcf, 'wt') as fout:
+        fout.write('\n'.join(HEADER + ['\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT'] + samples)]) + '\n')
+        for region, sizes in regionAlleles().items():
+            chrom, interval = region.split(':')
+            fout.write('\t'.join([chrom, interval.split('-')[0], region, '60', '.', '.', 'PASS', 'CAG;20', 'QC;GT;MOTIF;CN;CN_REF;DP'] + [genotype(x) for x in sizes]) + '\n')
+    labels = str(tmp_path / 'labels.txt')
+    with open(labels, 'w') as fout:
+        fout.write(''.join(['%s\t%s\n' %(samples[i], LABELS[i]) for i in range(N_SAMPLES)]))
+    out_name = 'casecontrol_%s.txt' %(cpu)
+    subprocess.run([sys.executable, os.path.join(BIN, 'treat_analysis.py'), '-a', 'case-control', '-v', vcf, '-l', labels, '-o', str(tmp_path), '-n', out_name, '-c', str(cpu)], check = True, stdout = subprocess.DEVNULL)
+    return pd.read_csv(str(tmp_path / out_name), sep = '\t', index_col = 'REGION')
+
+# Estimates of the informative regions: beta and standard error for the shorter, longer and sum of the alleles
+EXPECTED = {'chr1:100-160' : [0.15275513, 0.091661195, 0.50003757, 0.23494449, 0.29925266, 0.15856448],
+            'chr1:500-560' : [0.0064711895, 0.095788915, -0.043081702, 0.11492176, -0.0080618982, 0.055835879]}
+
+def test_case_control_estimates(tmp_path):
+    res = runCaseControl(tmp_path, 1)
+    assert list(res.index) == list(regionAlleles().keys())
+    for region, expected in EXPECTED.items():
+        observed = res.loc[region, ['BETA_SHORT', 'SE_SHORT', 'BETA_LONG', 'SE_LONG', 'BETA_JOIN', 'SE_JOIN']].astype(float).values
+        assert observed == pytest.approx(expected, rel = 1e-6)
+    # confidence intervals and p-values of the Wald test
+    row = res.loc['chr1:100-160']
+    assert row['LOW_CI_SHORT'] == pytest.approx(row['BETA_SHORT'] - 1.959963985 * row['SE_SHORT'])
+    assert row['UP_CI_SHORT'] == pytest.approx(row['BETA_SHORT'] + 1.959963985 * row['SE_SHORT'])
+    assert 0 < row['P_SHORT'] < 1
+
+def test_case_control_not_fitted(tmp_path):
+    res = runCaseControl(tmp_path, 1)
+    # constant sizes, perfect separation and missing genotypes give NA for all estimates
+    for region in ['chr1:900-960', 'chr2:100-160', 'chr2:500-560']:
+        assert res.loc[region].isna().all()
+
+def test_case_control_parallel(tmp_path):
+    pd.testing.assert_frame_equal(runCaseControl(tmp_path, 2), runCaseControl(tmp_path, 1))
+
+def test_case_control_as_statsmodels(tmp_path):
+    sm = pytest.importorskip('statsmodels.api')
+    res = runCaseControl(tmp_path, 1)
+    labels = np.array(LABELS, dtype = float)
+    for region in EXPECTED.keys():
+        sizes = regionAlleles()[region]
+        valid = [i for i in range(N_SAMPLES) if sizes[i] is not None]
+        for k, name in enumerate(['SHORT', 'LONG', 'JOIN']):
+            x = np.array([[min(sizes[i]), max(sizes[i]), sum(sizes[i])][k] for i in valid], dtype = float)
+            fit = sm.Logit(labels[valid], sm.add_constant(x)).fit(disp = 0)
+            assert res.loc[region, 'BETA_%s' %(name)] == pytest.approx(fit.params[1], rel = 1e-8)
+            assert res.loc[region, 'SE_%s' %(name)] == pytest.approx(fit.bse[1], rel = 1e-8)
+            assert res.loc[region, 'P_%s' %(name)] == pytest.approx(fit.pvalues[1], rel = 1e-6)